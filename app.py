@@ -1,8 +1,13 @@
-from openai import OpenAI
+import os
+import sys
+
+# Share the pooled, rate-limited client with the research_assistant_agent apps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "research_assistant_agent"))
+from llm_client import LLMBusyError, get_llm_client
 
 class VirtualClassroom:
     def __init__(self):
-        self.client = OpenAI()
+        self.client = get_llm_client()
         self.system_prompt = """You are a helpful virtual classroom assistant. You help students learn 
         by answering questions, providing explanations, and guiding them through topics. You are 
         knowledgeable, patient, and encouraging."""
@@ -25,6 +30,9 @@ class VirtualClassroom:
             
             return ai_response
             
+        except LLMBusyError:
+            self.messages.pop()
+            return "Lots of students are asking questions right now! Please try again in a moment."
         except Exception as e:
             print(f"Error handling message: \n{str(e)}")
             return "I apologize, but I encountered an error processing your message. Please try again." 
\ No newline at end of file
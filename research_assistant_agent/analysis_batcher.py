@@ -0,0 +1,157 @@
+import atexit
+import json
+import os
+import threading
+import time
+from metrics import get_metrics
+
+
+def normalize_analysis(result):
+    # (style, interests, engagement) from one JSON analysis object
+    interests = result.get("interests") or []
+    if isinstance(interests, str):
+        interests = interests.split(',')
+    return (
+        str(result.get("style", "")).lower(),
+        [str(interest).strip() for interest in interests if str(interest).strip()],
+        str(result.get("engagement", "medium")).lower()
+    )
+
+
+class AnalysisBatcher:
+    # Queues messages for learning-style analysis and sends them to the model
+    # in micro-batches: up to batch_size messages, or whatever arrived within
+    # max_wait seconds, go out as one structured request. Each result is
+    # handed to the callback given with its message.
+    def __init__(self, client, executor, batch_size=None, max_wait=None):
+        if batch_size is None:
+            batch_size = int(os.getenv('ANALYSIS_BATCH_SIZE', '20'))
+        if max_wait is None:
+            max_wait = float(os.getenv('ANALYSIS_BATCH_WAIT', '0.5'))
+        self.client = client
+        self.executor = executor
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.metrics = get_metrics()
+        self._pending = []  # (message, callback, queued at)
+        self._in_flight = 0
+        self._flushing = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {"messages": 0, "batches": 0, "errors": 0}
+        self.metrics.expose_stats("analysis_batches", self.stats)
+        self._thread = threading.Thread(target=self._run, name="analysis-batcher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, message, callback):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Analysis batcher is closed")
+            self._pending.append((message, callback, time.monotonic()))
+            self.stats["messages"] += 1
+            # The first message starts the max_wait clock; a full batch goes now
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                wait = self._pending[0][2] + self.max_wait - time.monotonic()
+                if len(self._pending) < self.batch_size and wait > 0 and not (self._closed or self._flushing):
+                    self._cond.wait(wait)
+                    continue
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                self._in_flight += 1
+            try:
+                self.executor.submit(self._process, batch)
+            except RuntimeError:
+                # The pool is already gone at interpreter exit; finish inline
+                self._process(batch)
+
+    def _process(self, batch):
+        try:
+            results = self.analyze_batch([message for message, _, _ in batch])
+        except Exception as e:
+            print(f"Error analyzing batch of {len(batch)} messages: {str(e)}")
+            self.stats["errors"] += 1
+            results = [None] * len(batch)
+        for (_, callback, _), analysis in zip(batch, results):
+            try:
+                callback(analysis)
+            except Exception as e:
+                print(f"Error applying analysis: {str(e)}")
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def analyze_batch(self, messages):
+        numbered = "\n".join(f"{i}. {json.dumps(message)}" for i, message in enumerate(messages, 1))
+        prompt = f"""Analyze each of these numbered student messages for:
+            1. Learning style indicators (visual, auditory, kinesthetic)
+            2. Interests or topics
+            3. Engagement level (high, medium, low)
+
+            Messages:
+            {numbered}
+
+            Respond with a JSON object with a "results" list holding one object per
+            message, in order, with the keys "id" (the message number), "style",
+            "interests" (a list) and "engagement"."""
+
+        self.stats["batches"] += 1
+        with self.metrics.span("analysis_batch"):
+            response = self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=60 * len(messages) + 50,
+                response_format={"type": "json_object"}
+            )
+        content = response.choices[0].message.content
+        try:
+            items = json.loads(content)["results"]
+        except (ValueError, KeyError, TypeError):
+            print(f"Unexpected batch analysis response: {content}")
+            return [None] * len(messages)
+
+        results = [None] * len(messages)
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            # Trust the id when it's usable, otherwise the position
+            index = item.get("id")
+            index = index - 1 if isinstance(index, int) and 1 <= index <= len(messages) else position
+            if index < len(messages):
+                results[index] = normalize_analysis(item)
+        return results
+
+    def flush(self, timeout=None):
+        # Sends whatever is queued now and waits for every batch to land
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flushing -= 1
+        return True
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
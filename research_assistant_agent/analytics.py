@@ -0,0 +1,203 @@
+import argparse
+import heapq
+import json
+import os
+import threading
+from datetime import datetime
+from profile_writer import atomic_write_bytes, get_profile_writer
+from student_profile import StudentProfile
+
+# Classroom-wide aggregates (engagement, learning-style mix, interests, quiz
+# totals, per-day activity), kept current from StudentProfile change events
+# and written through the profile writer like any dirty profile. Reports
+# read the counters only, so they cost the same for 10 or 10,000 students.
+#
+#   python analytics.py report
+#   python analytics.py rebuild    # recompute from all profiles in one pass
+
+
+def empty_aggregates():
+    return {
+        "students": 0,
+        "interactions": 0,
+        "engagement": {},
+        "styles": {},
+        "interests": {},
+        "quizzes": {"answered": 0, "correct": 0},
+        "days": {},  # YYYY-MM-DD -> {"interactions": n, "engagement": {...}}
+        "updated": None
+    }
+
+
+def _bump(counts, key, amount=1):
+    counts[key] = counts.get(key, 0) + amount
+    if counts[key] <= 0:
+        del counts[key]
+
+
+class ClassAnalytics:
+    def __init__(self, path=None, writer=None):
+        if path is None:
+            path = os.getenv('ANALYTICS_FILE', 'analytics.json')
+        self.path = path
+        self.writer = writer or get_profile_writer()
+        # Key for the profile writer; a tuple, so no username can clash with it
+        self.student_id = ("shared", "analytics")
+        self.lock = threading.RLock()
+        self.loaded_mtime = None
+        self.data = self.load() or empty_aggregates()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.loaded_mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            print(f"Error loading analytics: {str(e)}")
+            return None
+        return data
+
+    def flush(self):
+        with self.lock:
+            payload = json.dumps(self.data, separators=(",", ":")).encode("utf-8")
+        written = atomic_write_bytes(self.path, payload)
+        self.loaded_mtime = os.path.getmtime(self.path)
+        return written
+
+    def on_change(self, profile, event, data):
+        with self.lock:
+            self.apply(self.data, event, data)
+            self.data["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.writer.mark_dirty(self)
+
+    def apply(self, aggregates, event, data):
+        if event == "created":
+            aggregates["students"] += 1
+        elif event == "interaction":
+            engagement = data.get("engagement") or "medium"
+            aggregates["interactions"] += 1
+            _bump(aggregates["engagement"], engagement)
+            day = aggregates["days"].setdefault((data.get("date") or "")[:10], {"interactions": 0, "engagement": {}})
+            day["interactions"] += 1
+            _bump(day["engagement"], engagement)
+        elif event == "learning_style":
+            if data.get("old") == data.get("new"):
+                return
+            if data.get("old"):
+                _bump(aggregates["styles"], data["old"], -1)
+            if data.get("new"):
+                _bump(aggregates["styles"], data["new"])
+        elif event == "interest":
+            _bump(aggregates["interests"], data["interest"])
+        elif event == "quiz":
+            aggregates["quizzes"]["answered"] += data["answered"]
+            aggregates["quizzes"]["correct"] += data["correct"]
+
+    def refresh(self):
+        # Another process (the CLI classroom) may own the counters; pick up
+        # its latest flush, unless we have changes of our own waiting.
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+        if mtime != self.loaded_mtime and not self.writer.is_dirty(self.student_id):
+            data = self.load()
+            if data is not None:
+                with self.lock:
+                    self.data = data
+
+    def report(self, days=14, top=10):
+        self.refresh()
+        with self.lock:
+            data = self.data
+            engagement = dict(data["engagement"])
+            recent_days = sorted(data["days"])[-days:]
+            report = {
+                "students": data["students"],
+                "interactions": data["interactions"],
+                "engagement": engagement,
+                "engagement_share": {level: round(count / data["interactions"], 3)
+                                     for level, count in engagement.items()} if data["interactions"] else {},
+                "learning_styles": dict(data["styles"]),
+                "top_interests": heapq.nlargest(top, data["interests"].items(), key=lambda item: item[1]),
+                "quizzes": dict(data["quizzes"]),
+                "days": {day: {"interactions": data["days"][day]["interactions"],
+                               "engagement": dict(data["days"][day]["engagement"])} for day in recent_days},
+                "updated": data["updated"]
+            }
+        return report
+
+    def rebuild(self, storage):
+        # One streaming pass over every profile and its interaction log
+        aggregates = empty_aggregates()
+        for student_id in storage.list_profile_ids():
+            profile = storage.load_profile(student_id)
+            if profile is None:
+                continue
+            self.apply(aggregates, "created", {})
+            self.apply(aggregates, "learning_style", {"old": None, "new": profile["learning_style"].get("primary")})
+            for interest in profile.get("interests", []):
+                self.apply(aggregates, "interest", {"interest": interest})
+            for progress in profile.get("progress", {}).values():
+                if "answered" in progress:
+                    self.apply(aggregates, "quiz", {"answered": progress["answered"], "correct": progress["correct"]})
+            history = profile.get("interaction_history")
+            interactions = history if history is not None else storage.iter_interactions(student_id)
+            for interaction in interactions:
+                self.apply(aggregates, "interaction", interaction)
+        aggregates["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            self.data = aggregates
+        self.flush()
+        return aggregates
+
+
+_default_analytics = None
+_default_analytics_lock = threading.Lock()
+
+
+def get_analytics():
+    global _default_analytics
+    with _default_analytics_lock:
+        if _default_analytics is None:
+            _default_analytics = ClassAnalytics()
+            StudentProfile.add_listener(_default_analytics.on_change)
+        return _default_analytics
+
+
+def print_report(report):
+    print(f"Students: {report['students']}    Interactions: {report['interactions']}")
+    print("Engagement: " + ", ".join(f"{level} {count} ({report['engagement_share'].get(level, 0):.0%})"
+                                     for level, count in sorted(report['engagement'].items())))
+    print("Learning styles: " + ", ".join(f"{style} {count}" for style, count in sorted(report['learning_styles'].items())))
+    print("Top interests: " + ", ".join(f"{interest} ({count})" for interest, count in report['top_interests']))
+    quizzes = report['quizzes']
+    print(f"Quiz answers: {quizzes['correct']} correct of {quizzes['answered']}")
+    for day, counts in report['days'].items():
+        print(f"  {day}: {counts['interactions']} interactions " +
+              " ".join(f"{level}={count}" for level, count in sorted(counts['engagement'].items())))
+
+
+def main():
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description="Classroom-wide analytics")
+    parser.add_argument("command", choices=["report", "rebuild"])
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    analytics = ClassAnalytics()
+    if args.command == "rebuild":
+        analytics.rebuild(get_storage())
+    report = analytics.report(days=args.days)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
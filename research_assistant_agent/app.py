@@ -1,15 +1,22 @@
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, stream_with_context
 from google.oauth2 import id_token
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport import requests
 import openai
 from flask_oauthlib.client import OAuth
-from datetime import timedelta
+from datetime import date, timedelta
+from storage import get_storage
+from conversation_store import ConversationStore
+from llm_client import LLMBusyError, get_async_llm_client, get_llm_client
+from metrics import get_metrics
+from commands import CommandRouter
+from analytics import get_analytics
+from search_index import get_search_index
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -38,21 +45,20 @@ logger.debug(f"GOOGLE_CLIENT_SECRET: {GOOGLE_CLIENT_SECRET}")
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-here')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///virtual_classroom.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SESSION_COOKIE_NAME'] = 'google-login-session'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=5)
 app.config['SESSION_COOKIE_SECURE'] = False
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-db = SQLAlchemy(app)
 
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    google_id = db.Column(db.String(100), unique=True)
-    name = db.Column(db.String(100))
-    email = db.Column(db.String(100), unique=True)
-    profile_picture = db.Column(db.String(200))
+# Users and conversation history live in the shared storage backend
+# (STORAGE_BACKEND=json|sqlite), the same one main.py uses.
+storage = get_storage()
+metrics = get_metrics()
+
+# Google accounts allowed to see class-wide data (/analytics, /search);
+# when unset, any logged-in user can
+TEACHER_EMAILS = {email.strip().lower() for email in os.getenv('TEACHER_EMAILS', '').split(',') if email.strip()}
 
 # After loading environment variables
 openai.api_key = os.getenv('OPENAI_API_KEY')
@@ -60,74 +66,165 @@ logger.debug(f"OpenAI API key loaded: {'OPENAI_API_KEY' in os.environ}")
 
 class VirtualClassroom:
     def __init__(self):
-        self.client = openai.OpenAI()  # Create client instance
+        self.client = get_llm_client()  # Shared pooled, rate-limited client
+        self.cache_replies = os.getenv('LLM_CACHE_REPLIES', '0') == '1'
         self.system_prompt = """You are a helpful virtual classroom assistant. You help students learn 
         about various topics and can provide quizzes and educational activities. When using commands:
         !help - List available commands and features
         !topics - Show available learning topics
         !quiz - Start a quiz on the current or selected topic"""
+        self.commands = self.build_commands()
+        
+    def build_messages(self, message, history):
+        # Prepare messages for OpenAI
+        messages = [
+            {"role": "system", "content": self.system_prompt}
+        ]
         
+        # Add message history
+        for msg in history:
+            messages.append({
+                "role": msg["role"],
+                "content": msg["content"]
+            })
+        
+        # Add current message
+        messages.append({"role": "user", "content": message})
+        return messages
+
     def handle_message(self, message, history):
         try:
             if message.startswith('!'):
                 return self.handle_command(message)
             
-            # Prepare messages for OpenAI
-            messages = [
-                {"role": "system", "content": self.system_prompt}
-            ]
-            
-            # Add message history
-            for msg in history:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
+            # Updated API call format
+            with metrics.span("chat"):
+                response = self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=self.build_messages(message, history),
+                    cache=self.cache_replies,
+                    near_text=message
+                )
             
-            # Add current message
-            messages.append({"role": "user", "content": message})
+            return response.choices[0].message.content
             
-            # Updated API call format
-            response = self.client.chat.completions.create(
+        except LLMBusyError:
+            return "Lots of students are asking questions right now! Please try again in a moment."
+        except Exception as e:
+            print(f"Error handling message: {str(e)}")
+            return "I apologize, but I encountered an error processing your message. Please try again."
+
+    def stream_message(self, message, history):
+        # Yields the reply piece by piece as the model produces it. Errors are
+        # left to the caller, which decides how to report them mid-stream.
+        if message.startswith('!'):
+            yield self.handle_command(message)
+            return
+        
+        with metrics.span("chat_stream"):
+            stream = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=messages
+                messages=self.build_messages(message, history),
+                stream=True
             )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    
+    # Async counterparts used by the ASGI entry point (asgi.py)
+
+    async def handle_message_async(self, message, history):
+        try:
+            if message.startswith('!'):
+                return self.handle_command(message)
+            
+            with metrics.span("chat"):
+                response = await get_async_llm_client().chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=self.build_messages(message, history),
+                    cache=self.cache_replies,
+                    near_text=message
+                )
             
             return response.choices[0].message.content
             
+        except LLMBusyError:
+            return "Lots of students are asking questions right now! Please try again in a moment."
         except Exception as e:
             print(f"Error handling message: {str(e)}")
             return "I apologize, but I encountered an error processing your message. Please try again."
+
+    async def stream_message_async(self, message, history):
+        if message.startswith('!'):
+            yield self.handle_command(message)
+            return
+        
+        with metrics.span("chat_stream"):
+            stream = await get_async_llm_client().chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self.build_messages(message, history),
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
     
+    def summarize(self, previous_summary, messages):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = f"""Update this summary of a tutoring conversation with the new messages.
+        Keep the topics covered, what the student understood and what they struggled with.
+        Reply with the summary only, in under 100 words.
+
+        Summary so far: {previous_summary or 'none'}
+
+        New messages:
+        {transcript}"""
+        response = self.client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=200
+        )
+        return response.choices[0].message.content
+
     def handle_command(self, command):
-        if command == '!help':
-            return """Available commands:
+        with metrics.span("command"):
+            return self.command_response(command)
+
+    def build_commands(self):
+        # Built once; every command here has a fixed reply
+        return (CommandRouter(lambda command: f"Unknown command: {command}")
+                .add('!help', response="""Available commands:
             !help - Show this help message
             !topics - Show available learning topics
-            !quiz - Start a quiz on the current topic"""
-            
-        elif command == '!topics':
-            return """Available topics:
+            !quiz - Start a quiz on the current topic""")
+                .add('!topics', response="""Available topics:
             1. Mathematics
             2. Science
             3. History
             4. Literature
             5. Computer Science
-            Choose a topic by saying "Let's learn about [topic]" """
-            
-        elif command == '!quiz':
-            return """Let's start a quiz! First, which topic would you like to be quizzed on?
+            Choose a topic by saying "Let's learn about [topic]" """)
+                .add('!quiz', response="""Let's start a quiz! First, which topic would you like to be quizzed on?
             - Mathematics
             - Science
             - History
             - Literature
-            - Computer Science"""
-            
-        return f"Unknown command: {command}"
+            - Computer Science"""))
+
+    def command_response(self, command):
+        return self.commands.dispatch(command)
 
 # Create an instance of VirtualClassroom
 virtual_classroom = VirtualClassroom()
 
+# Chat history is kept server-side per user and trimmed to a token budget;
+# older turns are folded into a rolling summary when CONVERSATION_SUMMARIZE=1.
+conversations = ConversationStore(
+    storage,
+    summarizer=virtual_classroom.summarize if os.getenv('CONVERSATION_SUMMARIZE', '0') == '1' else None
+)
+
 # Initialize OAuth client
 oauth = OAuth(app)
 
@@ -191,7 +288,8 @@ def callback():
         session['google_token'] = (resp['access_token'], '')
         
         # Get user info
-        me = google.get('userinfo')
+        with metrics.span("auth"):
+            me = google.get('userinfo')
         if me.status != 200:
             return 'Failed to get user info'
             
@@ -199,6 +297,12 @@ def callback():
         session['user_email'] = user_data.get('email')
         session['user_name'] = user_data.get('name')
         session['picture'] = user_data.get('picture')
+        storage.save_user(user_data.get('email'), {
+            "google_id": user_data.get('id'),
+            "name": user_data.get('name'),
+            "email": user_data.get('email'),
+            "profile_picture": user_data.get('picture')
+        })
         
         print(f"Login successful for: {session.get('user_email')}")
         return redirect(url_for('dashboard'))
@@ -261,18 +365,110 @@ def chat():
             return jsonify({'error': 'No data provided'}), 400
             
         message = data.get('message', '')
-        history = data.get('history', [])
+        user_email = session.get('user_email')
         
         if not message:
             return jsonify({'error': 'No message provided'}), 400
             
+        metrics.inc("requests", route="chat")
+        with metrics.span("history_load"):
+            history = conversations.context(user_email)
         response = virtual_classroom.handle_message(message, history)
+        with metrics.span("history_save"):
+            conversations.append(user_email, 'user', message)
+            conversations.append(user_email, 'assistant', response)
         return jsonify({'response': response})
         
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    if 'google_token' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+        
+    message = data.get('message', '')
+    user_email = session.get('user_email')
+    
+    if not message:
+        return jsonify({'error': 'No message provided'}), 400
+    metrics.inc("requests", route="chat_stream")
+    with metrics.span("history_load"):
+        history = conversations.context(user_email)
+    
+    def generate():
+        parts = []
+        try:
+            for delta in virtual_classroom.stream_message(message, history):
+                parts.append(delta)
+                yield sse_event({'delta': delta})
+        except Exception as e:
+            print(f"Error in chat stream: {str(e)}")
+            # The client falls back to /chat if nothing was streamed yet
+            yield sse_event({'error': 'Internal server error', 'partial': bool(parts)}, event='error')
+            return
+        response = ''.join(parts)
+        with metrics.span("history_save"):
+            conversations.append(user_email, 'user', message)
+            conversations.append(user_email, 'assistant', response)
+        yield sse_event({'done': True})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text format: stage timings, requests, tokens, cache and storage counters
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def teacher_only():
+    # An error response for class-wide endpoints, or None when allowed
+    if 'google_token' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if TEACHER_EMAILS and (session.get('user_email') or '').lower() not in TEACHER_EMAILS:
+        return jsonify({'error': 'Teachers only'}), 403
+    return None
+
+@app.route('/analytics')
+def analytics_endpoint():
+    # Precomputed classroom aggregates; never reads individual profiles
+    denied = teacher_only()
+    if denied:
+        return denied
+    days = request.args.get('days', 14, type=int)
+    return jsonify(get_analytics().report(days=days))
+
+@app.route('/search')
+def search_endpoint():
+    # /search?interest=astronomy or /search?q=fractions&days=7
+    denied = teacher_only()
+    if denied:
+        return denied
+    index = get_search_index()
+    interest = request.args.get('interest')
+    if interest:
+        return jsonify({'interest': interest, 'students': index.students_with_interest(interest)})
+    query = request.args.get('q', '')
+    days = request.args.get('days', type=int)
+    since = date.today() - timedelta(days=days) if days else None
+    matches = index.search(query, since, request.args.get('limit', 50, type=int))
+    return jsonify({
+        'query': query,
+        'students': sorted({match['student_id'] for match in matches}),
+        'matches': matches
+    })
+
 @app.route('/test-urls')
 def test_urls():
     return {
@@ -282,7 +478,5 @@ def test_urls():
     }
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
     # Try port 5000 instead
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
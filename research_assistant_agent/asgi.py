@@ -0,0 +1,207 @@
+import asyncio
+import functools
+import json
+from http.cookies import SimpleCookie
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from app import app as flask_app, conversations, metrics, sse_event, virtual_classroom
+from educational_activities import EducationalActivities
+from rooms import RoomManager
+
+# ASGI entry point: /chat and /chat/stream run as native coroutines on the
+# async OpenAI client, so a waiting chat costs a coroutine rather than a
+# worker thread. Classroom rooms are WebSockets at /rooms/<room>: every
+# student in a room sees the same moderator replies and activities.
+# Every other route is served by the unchanged Flask app.
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class ClassroomASGI:
+    def __init__(self, flask_app, classroom, conversations, rooms):
+        self.flask_app = flask_app
+        self.classroom = classroom
+        self.conversations = conversations
+        self.rooms = rooms
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.routes = {
+            ("POST", "/chat"): self.chat,
+            ("POST", "/chat/stream"): self.chat_stream
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http":
+            handler = self.routes.get((scope["method"], scope["path"]))
+            if handler is not None:
+                return await handler(scope, receive, send)
+        if scope["type"] == "websocket":
+            return await self.room_socket(scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def load_session(self, scope):
+        # Reads the same signed cookie Flask issues at login
+        cookies = SimpleCookie()
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                cookies.load(value.decode("latin-1"))
+        morsel = cookies.get(self.flask_app.config["SESSION_COOKIE_NAME"])
+        if morsel is None:
+            return {}
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        try:
+            return serializer.loads(morsel.value, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return {}
+
+    async def read_json(self, receive):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_BYTES:
+                return None
+            if not message.get("more_body"):
+                break
+        try:
+            return json.loads(body)
+        except ValueError:
+            return None
+
+    async def send_json(self, send, status, data):
+        body = json.dumps(data).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def run_blocking(self, func, *args):
+        # Storage calls touch the disk; keep them off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args))
+
+    async def parse_chat_request(self, scope, receive, send):
+        session = self.load_session(scope)
+        if 'google_token' not in session:
+            await self.send_json(send, 401, {'error': 'Not authenticated'})
+            return None
+        data = await self.read_json(receive)
+        if not data:
+            await self.send_json(send, 400, {'error': 'No data provided'})
+            return None
+        message = data.get('message', '')
+        if not message:
+            await self.send_json(send, 400, {'error': 'No message provided'})
+            return None
+        return session.get('user_email'), message
+
+    async def chat(self, scope, receive, send):
+        request = await self.parse_chat_request(scope, receive, send)
+        if request is None:
+            return
+        user_email, message = request
+        metrics.inc("requests", route="chat")
+        try:
+            history = await self.run_blocking(self.conversations.context, user_email)
+            response = await self.classroom.handle_message_async(message, history)
+            await self.run_blocking(self.conversations.append, user_email, 'user', message)
+            await self.run_blocking(self.conversations.append, user_email, 'assistant', response)
+        except Exception as e:
+            print(f"Error in chat endpoint: {str(e)}")
+            return await self.send_json(send, 500, {'error': 'Internal server error'})
+        await self.send_json(send, 200, {'response': response})
+
+    async def chat_stream(self, scope, receive, send):
+        request = await self.parse_chat_request(scope, receive, send)
+        if request is None:
+            return
+        user_email, message = request
+        metrics.inc("requests", route="chat_stream")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no")]
+        })
+
+        async def send_event(data, event=None):
+            await send({"type": "http.response.body", "body": sse_event(data, event).encode("utf-8"), "more_body": True})
+
+        parts = []
+        try:
+            history = await self.run_blocking(self.conversations.context, user_email)
+            async for delta in self.classroom.stream_message_async(message, history):
+                parts.append(delta)
+                await send_event({'delta': delta})
+        except Exception as e:
+            print(f"Error in chat stream: {str(e)}")
+            await send_event({'error': 'Internal server error', 'partial': bool(parts)}, event='error')
+        else:
+            response = ''.join(parts)
+            await self.run_blocking(self.conversations.append, user_email, 'user', message)
+            await self.run_blocking(self.conversations.append, user_email, 'assistant', response)
+            await send_event({'done': True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+    async def room_socket(self, scope, receive, send):
+        # Client frames are {"message": "..."} (or plain text); server frames
+        # are JSON events: joined, presence, message, moderator, activity, error.
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        room_id = scope["path"][len("/rooms/"):] if scope["path"].startswith("/rooms/") else ""
+        session = self.load_session(scope)
+        if not room_id or 'google_token' not in session:
+            return await send({"type": "websocket.close", "code": 4401})
+        room = self.rooms.get(room_id)
+        if len(room.connections) >= room.max_students:
+            return await send({"type": "websocket.close", "code": 1013})
+        await send({"type": "websocket.accept"})
+        name = session.get('user_name') or session.get('user_email') or "Student"
+        connection = room.join(send, name)
+        if connection is None:
+            return await send({"type": "websocket.close", "code": 1013, "reason": "Room is full"})
+        metrics.inc("requests", route="room")
+        try:
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                text = message.get("text") or (message.get("bytes") or b"").decode("utf-8", "replace")
+                if len(text) > MAX_BODY_BYTES:
+                    continue
+                try:
+                    data = json.loads(text)
+                    text = data.get('message', '') if isinstance(data, dict) else str(data)
+                except ValueError:
+                    pass
+                if not isinstance(text, str):
+                    continue  # {"message": 5}, {"message": null}: nothing to say
+                if connection.closed:
+                    break  # dropped as a slow consumer
+                await room.receive(connection, text)
+        finally:
+            self.rooms.leave(room, connection)
+
+
+application = ClassroomASGI(flask_app, virtual_classroom, conversations,
+                            RoomManager(virtual_classroom, EducationalActivities()))
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run("asgi:application", host='0.0.0.0', port=5000)
@@ -0,0 +1,77 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+# Dispatch cost per chat command, with no model calls involved:
+#
+#   cd research_assistant_agent
+#   python -m benchmarks.commands --number 20000
+#
+# "classroom" is the CLI classroom's handle_command (session lookup, router,
+# handler); "web" is the Flask app's. "router" is CommandRouter.dispatch
+# alone, to a handler that does nothing.
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+CLASSROOM_COMMANDS = ["!help", "!theme space", "!answer A", "!profile", "!login amy", "!nonsense"]
+WEB_COMMANDS = ["!help", "!topics", "!quiz", "!nonsense"]
+ROUTER_COMMANDS = ["!static", "!none", "!one word", "!many a b c d e", "!missing"]
+
+
+def time_per_call(func, number):
+    # Best of three runs, in microseconds
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat command dispatch")
+    parser.add_argument("--number", type=int, default=20000, help="calls per command and run")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write results to this file")
+    args = parser.parse_args()
+
+    # No request reaches the model, but the clients are built at import
+    os.environ.setdefault('OPENAI_API_KEY', 'fake-benchmark-key')
+    os.environ.setdefault('GOOGLE_CLIENT_ID', 'benchmark')
+    os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'benchmark')
+    os.chdir(tempfile.mkdtemp(prefix="classroom-commands-"))
+    from app import virtual_classroom as web
+    from commands import CommandRouter
+    from main import VirtualClassroom
+    logging.getLogger().setLevel(logging.WARNING)
+
+    classroom = VirtualClassroom()
+    classroom.handle_command("!theme space", "bench", "bench")
+    router = (CommandRouter("unknown")
+              .add("!static", response="fixed")
+              .add("!none", lambda: None)
+              .add("!one", lambda word: None, "word")
+              .add("!many", lambda first, rest, last: None, "first rest... last")
+              .add("!missing", lambda word: None, "word"))
+
+    results = []
+    for command in CLASSROOM_COMMANDS:
+        results.append(("classroom", command, time_per_call(
+            lambda: classroom.handle_command(command, "bench", "bench"), args.number)))
+    for command in WEB_COMMANDS:
+        results.append(("web", command, time_per_call(lambda: web.handle_command(command), args.number)))
+    for command in ROUTER_COMMANDS:
+        results.append(("router", command, time_per_call(lambda: router.dispatch(command), args.number)))
+
+    width = max(len(command) for _, command, _ in results)
+    print(f"{'app':<10} {'command':<{width}}  us/call")
+    for app, command, micros in results:
+        print(f"{app:<10} {command:<{width}}  {micros:.2f}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump([{"app": app, "command": command, "us_per_call": round(micros, 3)}
+                       for app, command, micros in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the chat-completions API, so benchmarks run with no
+# network and no API key. Point the app at it with
+#
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake
+#
+# Replies are deterministic for a given seed: the analysis prompt gets a
+# STYLE|INTERESTS|ENGAGEMENT line, JSON mode gets a JSON object and
+# everything else gets a short canned answer.
+
+REPLIES = [
+    "Great question! Let's explore that together with a fun example.",
+    "Wow, you're really curious! Here's something cool to think about.",
+    "Nice work! Let's try a little experiment to see how it works.",
+    "That's a super interesting topic. Imagine you're a scientist for a moment!"
+]
+STYLES = ["visual", "auditory", "kinesthetic"]
+INTERESTS = ["space", "dinosaurs", "fractions", "volcanoes", "music", "robots"]
+ENGAGEMENT = ["high", "medium", "low"]
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency=0.05, jitter=0.0, tokens_per_second=0, error_rate=0.0, error_status=429,
+                 retry_after=None, seed=0):
+        self.latency = latency  # seconds before the first byte
+        self.jitter = jitter  # extra uniform random latency, seconds
+        self.tokens_per_second = tokens_per_second  # generation speed; 0 means instant
+        self.error_rate = error_rate  # share of requests answered with error_status
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "streams": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def roll(self):
+        with self.lock:
+            return self.random.random(), self.random.random()
+
+
+def count_tokens(text):
+    return max(len(text) // 4, 1)
+
+
+def fake_content(body, pick):
+    messages = body.get("messages", [])
+    prompt = messages[-1].get("content", "") if messages else ""
+    index = int(pick * 1000)
+    if "STYLE|INTERESTS|ENGAGEMENT" in prompt:
+        interests = ", ".join(INTERESTS[(index + i) % len(INTERESTS)] for i in range(2))
+        return f"{STYLES[index % 3]}|{interests}|{ENGAGEMENT[index % 3]}"
+    if '"results" list' in prompt:
+        # Batched analysis: one result per numbered message
+        count = len(re.findall(r'^\s*\d+\. "', prompt, re.MULTILINE))
+        return json.dumps({"results": [{
+            "id": i,
+            "style": STYLES[(index + i) % 3],
+            "interests": [INTERESTS[(index + i) % len(INTERESTS)]],
+            "engagement": ENGAGEMENT[(index + i) % 3]
+        } for i in range(1, count + 1)]})
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps({
+            "reply": REPLIES[index % len(REPLIES)],
+            "style": STYLES[index % 3],
+            "interests": [INTERESTS[index % len(INTERESTS)]],
+            "engagement": ENGAGEMENT[index % 3]
+        })
+    return REPLIES[index % len(REPLIES)]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, Nagle plus
+    # delayed ACKs add ~40ms to every response.
+    disable_nagle_algorithm = True
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, data, headers=None):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self.send_body(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self.send_body(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+
+        config = self.config
+        failure, pick = config.roll()
+        with config.lock:
+            config.stats["requests"] += 1
+        time.sleep(config.latency + config.jitter * pick)
+
+        if failure < config.error_rate:
+            with config.lock:
+                config.stats["errors"] += 1
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else None
+            return self.send_body(config.error_status, {
+                "error": {"message": "Injected failure", "type": "server_error"}
+            }, headers)
+
+        content = fake_content(body, pick)
+        prompt_tokens = sum(count_tokens(m.get("content") or "") for m in body.get("messages", []))
+        completion_tokens = count_tokens(content)
+        with config.lock:
+            config.stats["prompt_tokens"] += prompt_tokens
+            config.stats["completion_tokens"] += completion_tokens
+
+        if body.get("stream"):
+            return self.stream(body, content)
+        if config.tokens_per_second:
+            time.sleep(completion_tokens / config.tokens_per_second)
+        self.send_body(200, {
+            "id": f"chatcmpl-fake-{int(pick * 1e9)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    def stream(self, body, content):
+        with self.config.lock:
+            self.config.stats["streams"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        words = content.split(" ")
+        delay = 1 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-fake-stream",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-3.5-turbo"),
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connection bursts, and the
+    # client's SYN retries then show up as 1-3s latency spikes.
+    request_queue_size = 128
+
+
+class FakeOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        self.config = config or FakeOpenAIConfig()
+        handler = type("BoundFakeOpenAIHandler", (FakeOpenAIHandler,), {"config": self.config})
+        self.server = FakeOpenAIHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat-completions API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="generation speed, 0 for instant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.latency, args.jitter, args.tokens_per_second, args.error_rate,
+                              args.error_status, args.retry_after, args.seed)
+    server = FakeOpenAIServer(args.host, args.port, config)
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Login storm: many students logging in at once against the salted,
+# pooled password hashing. Half the accounts start with legacy SHA-256
+# hashes and are migrated as they log in.
+#
+#   cd research_assistant_agent
+#   python -m benchmarks.logins --students 50 --logins 400 --concurrency 32
+#
+# Reports logins per second, login latency, logins turned away because the
+# hashing queue was full, accounts rehashed, and how late a 5 ms timer on
+# another thread fires meanwhile (how much the storm stalls the rest of the server).
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+from benchmarks.run import percentile
+
+
+class Heartbeat:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.lateness = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            time.sleep(self.interval)
+            self.lateness.append(time.perf_counter() - started - self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent logins with pooled password hashing")
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="hashing threads (PASSWORD_HASH_WORKERS)")
+    parser.add_argument("--queue-depth", type=int, default=None, help="PASSWORD_HASH_QUEUE")
+    parser.add_argument("--algorithm", choices=["scrypt", "pbkdf2"], default=None)
+    parser.add_argument("--json", dest="json_path", default=None, help="also write results to this file")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="classroom-logins-"))
+    from password_hashing import PasswordHasher
+    from sessions import SessionManager
+    from storage import get_storage
+    from user_auth import UserAuth
+
+    storage = get_storage()
+    hasher = PasswordHasher(args.algorithm, args.workers, args.queue_depth)
+    auth = UserAuth(storage, hasher)
+    for number in range(args.students):
+        username, password = f"student{number}", f"password{number}"
+        if number % 2:
+            auth.register(username, password, username, f"{username}@example.com")
+        else:
+            storage.save_user(username, {"password": hashlib.sha256(password.encode()).hexdigest(),
+                                         "name": username, "email": f"{username}@example.com"})
+
+    sessions = SessionManager()
+    latencies = []
+    outcomes = {"ok": 0, "busy": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def login(turn):
+        number = turn % args.students
+        session = sessions.create()
+        started = time.perf_counter()
+        success, message = auth.login(session, f"student{number}", f"password{number}")
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            outcomes["ok" if success else "busy" if "try again" in message else "failed"] += 1
+
+    with Heartbeat() as heartbeat:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - started
+    hasher.pool.shutdown(wait=True)  # let the background rehashes finish
+
+    latencies.sort()
+    lateness = sorted(heartbeat.lateness)
+    result = {
+        "algorithm": hasher.algorithm,
+        "workers": hasher.pool._max_workers,
+        "concurrency": args.concurrency,
+        "logins": args.logins,
+        "logins_per_second": round(outcomes["ok"] / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "busy": outcomes["busy"],
+        "failed": outcomes["failed"],
+        "rehashed": hasher.stats["rehashed"],
+        "legacy_left": sum(1 for user in storage.list_users().values() if "$" not in user["password"]),
+        "timer_late_p99_ms": round(percentile(lateness, 99) * 1000, 1)
+    }
+    for name, value in result.items():
+        print(f"{name}: {value}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Classroom rooms under load: drives the ASGI app's /rooms/<room> WebSocket
+# handler in-process with simulated students, against the fake OpenAI server.
+#
+#   cd research_assistant_agent
+#   python -m benchmarks.rooms --students 30 --messages 200 --slow 2
+#
+# Reports upstream model calls per student message, frames delivered, how
+# long a broadcast takes to reach each student, and slow students dropped.
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.run import MESSAGES, percentile
+
+
+class SimulatedStudent:
+    def __init__(self, application, cookie, room, name, send_delay=0.0):
+        self.application = application
+        self.scope = {"type": "websocket", "path": f"/rooms/{room}", "headers": [(b"cookie", cookie)]}
+        self.name = name
+        self.send_delay = send_delay  # seconds per frame; a slow connection
+        self.inbox = asyncio.Queue()
+        self.frames = 0
+        self.delays = []  # broadcast -> arrival, seconds
+        self.closed_with = None
+        self.joined = False
+        self.ready = asyncio.Event()
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send(self, message):
+        if message["type"] == "websocket.accept":
+            self.joined = True
+            return
+        if message["type"] == "websocket.close":
+            self.closed_with = message.get("code")
+            self.ready.set()
+            await self.inbox.put({"type": "websocket.disconnect", "code": self.closed_with})
+            return
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        event = json.loads(message["text"])
+        self.frames += 1
+        if event["type"] == "joined":
+            self.ready.set()
+        if "time" in event:
+            self.delays.append(time.time() - event["time"])
+
+    async def connect(self):
+        await self.inbox.put({"type": "websocket.connect"})
+        return asyncio.create_task(self.application(self.scope, self.receive, self.send))
+
+    async def say(self, text):
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps({"message": text})})
+
+    async def leave(self):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+
+
+def session_cookie(flask_app):
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    value = serializer.dumps({"google_token": ["benchmark", ""], "user_name": "Benchmark"})
+    return f"{flask_app.config['SESSION_COOKIE_NAME']}={value}".encode("latin-1")
+
+
+async def run_room(args, server):
+    # Imported after the environment points at the fake server
+    from asgi import application, flask_app
+    logging.getLogger().setLevel(logging.WARNING)
+    cookie = session_cookie(flask_app)
+    students = [SimulatedStudent(application, cookie, "bench", f"student{number}",
+                                 args.slow_delay if number < args.slow else 0.0)
+                for number in range(args.students)]
+    tasks = [await student.connect() for student in students]
+    await asyncio.gather(*(student.ready.wait() for student in students))
+
+    requests_before = server.config.stats["requests"]
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    for number in range(args.messages):
+        await rng.choice(students[args.slow:] or students).say(f"{MESSAGES[number % len(MESSAGES)]} ({number})")
+        await asyncio.sleep(args.interval)
+    # Let the last moderator reply land and the queues drain
+    room = application.rooms.rooms.get("bench")
+    while room is not None and room.moderator is not None and not room.moderator.done():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(max(args.slow_delay * 2, 0.1))
+    elapsed = time.perf_counter() - started
+
+    for student in students:
+        await student.leave()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    delays = sorted(delay for student in students[args.slow:] or students for delay in student.delays)
+    model_calls = server.config.stats["requests"] - requests_before
+    return {
+        "students": args.students,
+        "messages": args.messages,
+        "seconds": round(elapsed, 3),
+        "model_calls": model_calls,
+        "calls_per_message": round(model_calls / max(args.messages, 1), 3),
+        "frames_delivered": sum(student.frames for student in students),
+        "fanout_p50_ms": round(percentile(delays, 50) * 1000, 2),
+        "fanout_p99_ms": round(percentile(delays, 99) * 1000, 2),
+        "turned_away": sum(1 for student in students if not student.joined),
+        "slow_dropped": sum(1 for student in students if student.joined and student.closed_with == 1013)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark classroom rooms over the ASGI WebSocket handler")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=200, help="student messages sent to the room")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between student messages")
+    parser.add_argument("--slow", type=int, default=1, help="students whose connection lags on every frame")
+    parser.add_argument("--slow-delay", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="also write results to this file")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(config=FakeOpenAIConfig(latency=args.latency, seed=args.seed)).start()
+    os.environ['OPENAI_BASE_URL'] = server.base_url
+    os.environ['OPENAI_API_KEY'] = 'fake-benchmark-key'
+    os.environ.setdefault('GOOGLE_CLIENT_ID', 'benchmark')
+    os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'benchmark')
+    os.environ['OPENAI_RPM'] = '0'
+    os.chdir(tempfile.mkdtemp(prefix="classroom-rooms-"))
+    print(f"Fake OpenAI API at {server.base_url}")
+
+    try:
+        result = asyncio.run(run_room(args, server))
+    finally:
+        server.stop()
+
+    for name, value in result.items():
+        print(f"{name}: {value}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
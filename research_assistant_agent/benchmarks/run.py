@@ -0,0 +1,226 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Offline benchmarks for the hot paths, run against the fake OpenAI server
+# in a scratch data directory:
+#
+#   cd research_assistant_agent
+#   python -m benchmarks.run --turns 500 --concurrency 16 --latency 0.05
+#
+# Each scenario reports throughput, p50/p95/p99 latency, upstream model
+# requests and bytes written to storage per turn.
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+MESSAGES = [
+    "Why is the sky blue?",
+    "I love drawing planets, can you show me Saturn's rings?",
+    "How do volcanoes erupt?",
+    "Can we sing a song about fractions?",
+    "I built a robot out of boxes today!",
+    "What do dinosaurs eat?"
+]
+COMMANDS = ["!help", "!profile", "!activity"]
+SCENARIOS = ["moderate", "command", "chat", "persistence"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, len(sorted_values) - 1)
+    return sorted_values[max(index, 0)]
+
+
+def message_for(turn):
+    # Unique per turn so the completion cache doesn't hide the model latency
+    return f"{MESSAGES[turn % len(MESSAGES)]} (question {turn})"
+
+
+class Benchmark:
+    def __init__(self, server, turns, concurrency, students):
+        self.server = server
+        self.turns = turns
+        self.concurrency = concurrency
+        self.students = students
+        # Imported after the environment points at the fake server
+        from main import VirtualClassroom
+        from profile_writer import get_profile_writer
+        from storage import get_storage
+        from app import app
+        # app.py turns on DEBUG logging for everything, which would dominate the timings
+        logging.getLogger().setLevel(logging.WARNING)
+        self.classroom = VirtualClassroom()
+        self.app = app
+        self.writer = get_profile_writer()
+        self.storage = get_storage()
+        self._local = threading.local()
+
+    def student(self, turn):
+        return f"student{turn % self.students}"
+
+    def turn_moderate(self, turn):
+        student = self.student(turn)
+        return self.classroom.moderate_message(student, message_for(turn), session_token=student)
+
+    def turn_command(self, turn):
+        student = self.student(turn)
+        return self.classroom.handle_command(COMMANDS[turn % len(COMMANDS)], student, session_token=student)
+
+    def turn_chat(self, turn):
+        # Flask test clients aren't thread-safe; keep one per worker thread
+        clients = getattr(self._local, "clients", None)
+        if clients is None:
+            clients = self._local.clients = {}
+        student = self.student(turn)
+        client = clients.get(student)
+        if client is None:
+            client = clients[student] = self.app.test_client()
+            with client.session_transaction() as session:
+                session['google_token'] = ("bench-token", "")
+                session['user_email'] = f"{student}@example.com"
+        response = client.post('/chat', json={'message': message_for(turn)})
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat returned {response.status_code}")
+        return response.get_json()['response']
+
+    def turn_persistence(self, turn):
+        profile = self.classroom.get_or_create_student(self.student(turn))
+        profile.update_learning_style(["visual", "auditory", "kinesthetic"][turn % 3], None, 0.7)
+        profile.add_interest(["space", "animals", "science"][turn % 3])
+        profile.add_interaction(message_for(turn), "Great question!", "high")
+
+    def settle(self):
+        if self.classroom.analysis_batcher is not None:
+            self.classroom.analysis_batcher.flush()
+        self.writer.flush()
+
+    def run(self, scenario):
+        func = getattr(self, f"turn_{scenario}")
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def timed(turn):
+            start = time.perf_counter()
+            try:
+                func(turn)
+            except Exception as e:
+                print(f"Error in {scenario} turn {turn}: {str(e)}")
+                with lock:
+                    errors[0] += 1
+                return
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+        # One untimed turn per student warms profile loads and connections
+        for turn in range(min(self.students, self.turns)):
+            timed(turn)
+        latencies.clear()
+        errors[0] = 0
+        self.settle()
+
+        requests_before = self.server.config.stats["requests"]
+        bytes_before = self.storage.bytes_written
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(timed, range(self.turns)))
+        elapsed = time.perf_counter() - started
+        # Count the analysis and writes still owed for these turns
+        self.settle()
+
+        latencies.sort()
+        completed = len(latencies)
+        return {
+            "scenario": scenario,
+            "turns": self.turns,
+            "errors": errors[0],
+            "concurrency": self.concurrency,
+            "seconds": round(elapsed, 3),
+            "throughput": round(completed / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "upstream_requests": self.server.config.stats["requests"] - requests_before,
+            "bytes_per_turn": round((self.storage.bytes_written - bytes_before) / max(self.turns, 1), 1)
+        }
+
+
+def print_report(results):
+    columns = ["scenario", "turns", "errors", "throughput", "p50_ms", "p95_ms", "p99_ms",
+               "upstream_requests", "bytes_per_turn"]
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline Virtual Classroom benchmarks")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated, from {SCENARIOS}")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rpm", type=int, default=0, help="client request rate limit, 0 for none")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default=None, help="storage backend")
+    parser.add_argument("--analysis-mode", default=None, help="overrides ANALYSIS_MODE")
+    parser.add_argument("--data-dir", default=None, help="where profiles are written (default: a temp dir)")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write results to this file")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    config = FakeOpenAIConfig(latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+                              error_rate=args.error_rate, seed=args.seed)
+    server = FakeOpenAIServer(config=config).start()
+    os.environ['OPENAI_BASE_URL'] = server.base_url
+    os.environ['OPENAI_API_KEY'] = 'fake-benchmark-key'
+    # app.py builds its OAuth client at import time and insists on these
+    os.environ.setdefault('GOOGLE_CLIENT_ID', 'benchmark')
+    os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'benchmark')
+    # The client's own rate limiter would otherwise set the pace after the
+    # first OPENAI_RPM requests
+    os.environ['OPENAI_RPM'] = str(args.rpm)
+    if args.backend:
+        os.environ['STORAGE_BACKEND'] = args.backend
+    if args.analysis_mode:
+        os.environ['ANALYSIS_MODE'] = args.analysis_mode
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="classroom-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    os.chdir(data_dir)
+    print(f"Fake OpenAI API at {server.base_url}, data in {data_dir}")
+
+    try:
+        benchmark = Benchmark(server, args.turns, args.concurrency, args.students)
+        results = [benchmark.run(scenario) for scenario in scenarios]
+    finally:
+        server.stop()
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
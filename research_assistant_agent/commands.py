@@ -0,0 +1,87 @@
+# Chat command routing shared by the CLI classroom (main.py) and the web
+# apps (app.py, and asgi.py through it). Each app builds its router once at
+# startup. Dispatch is one dict lookup. Arguments are split and converted
+# once, then handed to the handler as keyword arguments. Commands with a
+# fixed reply are served from a precomputed string.
+#
+#   router = CommandRouter("Unknown command!")
+#   router.add("!help", response="...")
+#   router.add("!login", login_user, "username password", usage="Usage: !login [username] [password]")
+#   router.dispatch("!login amy secret", session)  ->  login_user(session, username="amy", password="secret")
+#
+# An argument spec is a space-separated list of names. "name?" is optional,
+# "name..." takes as many words as are left over (joined by spaces), and
+# "name:int" converts the word.
+
+ARG_TYPES = {"str": str, "int": int, "float": float}
+
+
+class CommandArgs:
+    def __init__(self, spec):
+        self.names = []
+        self.required = 0
+        self.variadic = None  # index of the "name..." argument, if any
+        self.types = []
+        for position, word in enumerate(spec.split()):
+            optional = word.endswith("?")
+            word = word.rstrip("?")
+            if word.endswith("..."):
+                self.variadic = position
+                word = word[:-3]
+            name, _, type_name = word.partition(":")
+            self.names.append(name)
+            self.types.append(ARG_TYPES[type_name or "str"])
+            if not optional:
+                self.required += 1
+
+    def parse(self, text):
+        # Keyword arguments for the handler, or None when the words don't fit
+        words = text.split()
+        if len(words) < self.required:
+            return None
+        if self.variadic is not None:
+            tail = len(self.names) - self.variadic - 1
+            end = len(words) - tail
+            words = words[:self.variadic] + [" ".join(words[self.variadic:end])] + words[end:]
+        # Words beyond the spec are ignored
+        args = {}
+        try:
+            for name, convert, word in zip(self.names, self.types, words):
+                args[name] = convert(word)
+        except ValueError:
+            return None
+        return args
+
+
+class Command:
+    def __init__(self, name, handler=None, args="", usage=None, response=None):
+        self.name = name
+        self.handler = handler
+        self.args = CommandArgs(args)
+        self.usage = usage or f"Usage: {name} " + " ".join(f"[{arg}]" for arg in self.args.names)
+        self.response = response  # fixed reply; the handler is never called
+
+
+class CommandRouter:
+    def __init__(self, unknown):
+        self.commands = {}
+        self.unknown = unknown  # reply text, or callable(command text)
+
+    def add(self, name, handler=None, args="", usage=None, response=None):
+        self.commands[name] = Command(name, handler, args, usage, response)
+        return self
+
+    def __contains__(self, name):
+        return name in self.commands
+
+    def dispatch(self, text, *context):
+        name, _, rest = text.strip().partition(" ")
+        command = self.commands.get(name)
+        if command is None:
+            return self.unknown(text) if callable(self.unknown) else self.unknown
+        if command.response is not None:
+            return command.response
+        args = command.args.parse(rest)
+        if args is None:
+            return command.usage
+        return command.handler(*context, **args)
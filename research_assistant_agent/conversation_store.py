@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from storage import get_storage
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text, plus the few
+    # tokens of per-message overhead the chat format adds.
+    return len(text) // 4 + 4
+
+
+class ConversationStore:
+    def __init__(self, storage=None, token_budget=None, summarizer=None, max_conversations=None):
+        if token_budget is None:
+            token_budget = int(os.getenv('CONVERSATION_TOKEN_BUDGET', '1500'))
+        if max_conversations is None:
+            max_conversations = int(os.getenv('CONVERSATION_CACHE_SIZE', '1000'))
+        self.storage = storage or get_storage()
+        self.token_budget = token_budget
+        self.max_conversations = max_conversations
+        # summarizer(previous_summary, dropped_messages) -> new summary text
+        self.summarizer = summarizer
+        # Conversations not used recently are dropped and re-read on demand
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self._summary_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+    def _conversation(self, conversation_id):
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = self._conversations[conversation_id] = {
+                    "id": conversation_id,
+                    "lock": threading.Lock(),
+                    "loaded": False,
+                    "summary": None,
+                    "summarized": 0,  # messages from the start the summary covers
+                    "first": 0,  # position of messages[0] in the whole conversation
+                    "messages": [],
+                    "tokens": 0
+                }
+                if len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+            else:
+                self._conversations.move_to_end(conversation_id)
+        with conversation["lock"]:
+            if not conversation["loaded"]:
+                saved = self.storage.load_summary(conversation_id)
+                if saved:
+                    conversation["summary"] = saved["summary"]
+                    conversation["summarized"] = saved["messages"]
+                # Only the tail that could fit in the budget is ever read back.
+                limit = self._load_limit()
+                messages = self.storage.load_messages(conversation_id, limit=limit)
+                if len(messages) == limit:
+                    conversation["first"] = self.storage.count_messages(conversation_id) - limit
+                for message in messages:
+                    self._push(conversation, message["role"], message["content"])
+                self._trim(conversation)
+                conversation["loaded"] = True
+        return conversation
+
+    def _load_limit(self):
+        return max(self.token_budget // 4, 10)
+
+    def _push(self, conversation, role, content):
+        conversation["messages"].append({"role": role, "content": content})
+        conversation["tokens"] += estimate_tokens(content)
+
+    def _trim(self, conversation):
+        dropped = []
+        messages = conversation["messages"]
+        while conversation["tokens"] > self.token_budget and len(messages) > 1:
+            message = messages.pop(0)
+            conversation["tokens"] -= estimate_tokens(message["content"])
+            # After a reload the oldest messages may already be in the saved summary
+            if conversation["first"] >= conversation["summarized"]:
+                dropped.append(message)
+            conversation["first"] += 1
+        if dropped and self.summarizer:
+            self._summary_pool.submit(self._summarize, conversation, dropped, conversation["first"])
+
+    def _summarize(self, conversation, dropped, through):
+        try:
+            summary = self.summarizer(conversation["summary"], dropped)
+        except Exception as e:
+            print(f"Error summarizing conversation: {str(e)}")
+            return
+        with conversation["lock"]:
+            conversation["summary"] = summary
+            conversation["summarized"] = through
+        # Saved next to the messages so eviction or a restart doesn't lose it
+        try:
+            self.storage.save_summary(conversation["id"], {"summary": summary, "messages": through})
+        except Exception as e:
+            print(f"Error saving conversation summary: {str(e)}")
+
+    def append(self, conversation_id, role, content):
+        conversation = self._conversation(conversation_id)
+        self.storage.append_message(conversation_id, role, content)
+        with conversation["lock"]:
+            self._push(conversation, role, content)
+            self._trim(conversation)
+
+    def context(self, conversation_id):
+        conversation = self._conversation(conversation_id)
+        with conversation["lock"]:
+            messages = list(conversation["messages"])
+            summary = conversation["summary"]
+        if summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        return messages
+
+    def forget(self, conversation_id):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
@@ -1,69 +1,109 @@
+import json
+import os
 import random
-from datetime import datetime
+import threading
+from pathlib import Path
+
+# Quizzes and activities live in a content bank: one JSON-lines file per
+# theme (content/<theme>.jsonl), each line an item such as
+#
+#   {"id": "space-1", "type": "quiz", "difficulty": 1, "styles": ["auditory"],
+#    "question": "...", "options": ["A) ...", "B) ..."], "correct": "B", "explanation": "..."}
+#   {"id": "space-2", "type": "activity", "difficulty": 2, "styles": ["visual"],
+#    "title": "...", "description": "..."}
+#
+# A theme's file is read the first time the theme is used.
+CONTENT_DIR = Path(__file__).resolve().parent / 'content'
+
+class ThemeBank:
+    def __init__(self, theme):
+        self.theme = theme
+        self.items = {}  # id -> item
+        # (type, difficulty, style) -> items, with None matching anything,
+        # so every filter combination is a single dict lookup
+        self.index = {}
+
+    def add(self, item):
+        self.items[item['id']] = item
+        keys = {(item_type, difficulty, style)
+                for item_type in (None, item['type'])
+                for difficulty in (None, item.get('difficulty'))
+                for style in [None] + item['styles']}
+        for key in keys:
+            self.index.setdefault(key, []).append(item)
+
+    def find(self, item_type=None, difficulty=None, style=None):
+        return self.index.get((item_type, difficulty, style)) or self.index.get((item_type, difficulty, None)) or []
 
 class EducationalActivities:
-    def __init__(self):
-        self.activities = {
-            'space': [
-                {
-                    'type': 'quiz',
-                    'question': 'Which planet is known as the Red Planet?',
-                    'options': ['A) Venus', 'B) Mars', 'C) Jupiter'],
-                    'correct': 'B',
-                    'explanation': 'Mars is called the Red Planet because of its reddish appearance!'
-                },
-                {
-                    'type': 'activity',
-                    'title': 'Planet Drawing Challenge',
-                    'description': 'Draw a picture of your favorite planet and describe three interesting facts about it!'
-                }
-            ],
-            'animals': [
-                {
-                    'type': 'quiz',
-                    'question': 'Which animal is the fastest on land?',
-                    'options': ['A) Lion', 'B) Cheetah', 'C) Gazelle'],
-                    'correct': 'B',
-                    'explanation': 'Cheetahs can run up to 70 miles per hour!'
-                },
-                {
-                    'type': 'activity',
-                    'title': 'Animal Research Project',
-                    'description': 'Choose an animal and create a fact sheet about its habitat, diet, and special features!'
-                }
-            ],
-            'science': [
-                {
-                    'type': 'quiz',
-                    'question': 'What is the hardest natural substance on Earth?',
-                    'options': ['A) Gold', 'B) Diamond', 'C) Iron'],
-                    'correct': 'B',
-                    'explanation': 'Diamond is the hardest natural substance known to humans!'
-                },
-                {
-                    'type': 'activity',
-                    'title': 'Simple Science Experiment',
-                    'description': 'Try this fun experiment: Mix baking soda and vinegar to see what happens!'
-                }
-            ]
-        }
+    def __init__(self, content_dir=None):
+        self.content_dir = Path(content_dir or os.getenv('CONTENT_DIR') or CONTENT_DIR)
+        # Only the theme names are read up front
+        self.themes = sorted(path.stem for path in self.content_dir.glob('*.jsonl'))
+        self.theme_names = set(self.themes)
+        self.banks = {}
+        self.lock = threading.Lock()
+
+    def theme_bank(self, theme):
+        bank = self.banks.get(theme)
+        if bank is None:
+            if theme not in self.theme_names:
+                return None
+            with self.lock:
+                bank = self.banks.get(theme)
+                if bank is None:
+                    bank = self.banks[theme] = self.load_theme(theme)
+        return bank
+
+    def load_theme(self, theme):
+        bank = ThemeBank(theme)
+        with open(self.content_dir / f'{theme}.jsonl', 'r') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    print(f"Error loading {theme} item on line {number}: {str(e)}")
+                    continue
+                item['id'] = str(item.get('id', f'{theme}-{number}'))
+                item.setdefault('styles', [])
+                item['theme'] = theme
+                item['text'] = self.format_activity(item)
+                bank.add(item)
+        return bank
+
+    def get_item(self, item_id):
+        # Ids usually start with their theme ("space-12"), so that bank is
+        # tried first; any other id is found by loading themes until it turns up
+        item_id = str(item_id)
+        guesses = [theme for theme in self.themes if item_id.startswith(f'{theme}-')]
+        for theme in guesses + [theme for theme in self.themes if theme not in guesses]:
+            item = self.theme_bank(theme).items.get(item_id)
+            if item is not None:
+                return item
+        return None
+
+    def pick(self, theme, style=None, item_type=None, difficulty=None):
+        bank = self.theme_bank(theme)
+        if bank is None:
+            return None
+        candidates = bank.find(item_type, difficulty, style)
+        return random.choice(candidates) if candidates else None
+
+    def theme_suggestions(self):
+        return ", ".join(self.themes[:5]) or "another theme"
 
     def get_activity(self, theme, student_profile):
-        if theme not in self.activities:
-            return "Theme not found! Try space, animals, or science!"
-            
-        # Choose an activity based on student's learning style
+        if self.theme_bank(theme) is None:
+            return f"Theme not found! Try {self.theme_suggestions()}!"
+
+        # Choose an activity suited to the student's learning style
         style = student_profile.profile['learning_style']['primary']
-        activities = self.activities[theme]
-        
-        if style == 'visual':
-            # Prefer activities with visual elements
-            activity = next((a for a in activities if a['type'] == 'activity'), activities[0])
-        else:
-            # Mix of activities
-            activity = random.choice(activities)
-            
-        return self.format_activity(activity)
+        activity = self.pick(theme, style)
+        if activity is None:
+            return "No activities for this theme yet! Try another one!"
+        return activity['text']
 
     def format_activity(self, activity):
         if activity['type'] == 'quiz':
@@ -81,16 +121,3 @@ Use !answer A, B, or C to respond!"""
 {activity['description']}
 
 Share your work with !share when you're done!"""
-
-    def check_answer(self, theme, answer):
-        if theme not in self.activities:
-            return "Theme not found!"
-            
-        quiz = next((a for a in self.activities[theme] if a['type'] == 'quiz'), None)
-        if not quiz:
-            return "No active quiz found!"
-            
-        if answer.upper() == quiz['correct']:
-            return f"🎉 Correct! {quiz['explanation']}"
-        else:
-            return "Not quite! Try again! 🎯" 
\ No newline at end of file
@@ -1,48 +1,204 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import atexit
 import os
+import queue
+import random
+import threading
+import time
 from dotenv import load_dotenv
 import secrets
+from metrics import get_metrics
+
+class MailQueue:
+    # Delivers queued messages from one background thread over a single SMTP
+    # connection that stays open between messages. Whatever is waiting when
+    # the thread wakes up goes out back to back on that connection; the
+    # connection is closed after idle_timeout seconds without mail.
+    def __init__(self, connect, batch_size=None, max_retries=None, idle_timeout=None, max_queue=None):
+        if batch_size is None:
+            batch_size = int(os.getenv('MAIL_BATCH_SIZE', '20'))
+        if max_retries is None:
+            max_retries = int(os.getenv('MAIL_MAX_RETRIES', '3'))
+        if idle_timeout is None:
+            idle_timeout = float(os.getenv('SMTP_IDLE_TIMEOUT', '30'))
+        if max_queue is None:
+            max_queue = int(os.getenv('MAIL_QUEUE_SIZE', '1000'))
+        self.connect = connect
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._connection = None
+        self.stats = {"queued": 0, "sent": 0, "retries": 0, "failed": 0, "connections": 0, "batches": 0}
+        self._thread = threading.Thread(target=self._run, name="mail-queue", daemon=True)
+        self._thread.start()
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                message = self._queue.get(timeout=self.idle_timeout if self._connection else None)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            batch = [message]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            self.stats["batches"] += 1
+            for message in batch:
+                if message is not None:
+                    self._deliver(message)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                self._disconnect()
+                return
+
+    def _deliver(self, message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self._connection is None:
+                    self._connection = self.connect()
+                    self.stats["connections"] += 1
+                self._connection.send_message(message)
+                self.stats["sent"] += 1
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                # Permanent for this message; the connection is still fine
+                print(f"Error sending email to {message['To']}: {str(e)}")
+                break
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                if attempt == self.max_retries:
+                    print(f"Error sending email to {message['To']}: {str(e)}")
+                    break
+                self.stats["retries"] += 1
+                time.sleep(random.uniform(0, min(0.5 * 2 ** attempt, 30)))
+        self.stats["failed"] += 1
+        return False
+
+    def _disconnect(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._connection = None
+
+    def flush(self):
+        # Blocks until everything queued so far has been attempted
+        self._queue.join()
+
+    def close(self, timeout=10):
+        # Sends what is already queued, then stops the thread
+        if not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            # Still backed up; the daemon thread goes away with the process
+            return
+        self._thread.join(max(0, deadline - time.monotonic()))
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_mail_queue(connect):
+    # One sender thread and SMTP connection per process, whichever
+    # EmailHandler asks first supplies the connect function.
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = MailQueue(connect)
+            get_metrics().expose_stats("mail", _default_queue.stats)
+            atexit.register(_default_queue.close)
+        return _default_queue
+
+
+def describe_duration(seconds):
+    # "15 minutes", "1 hour", "90 seconds": the largest unit that divides evenly
+    for unit, size in (("hour", 3600), ("minute", 60), ("second", 1)):
+        if seconds >= size and seconds % size == 0:
+            count = seconds // size
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+    return f"{seconds} seconds"
+
 
 class EmailHandler:
-    def __init__(self):
+    def __init__(self, code_ttl=None):
         load_dotenv()
-        self.smtp_server = "smtp.gmail.com"
-        self.smtp_port = 587
+        if code_ttl is None:
+            code_ttl = int(os.getenv('RECOVERY_CODE_TTL', '900'))
+        self.code_ttl = code_ttl  # seconds, as stated in the recovery email
+        self.smtp_server = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+        self.smtp_port = int(os.getenv('SMTP_PORT', '587'))
+        self.use_starttls = os.getenv('SMTP_STARTTLS', '1') == '1'
+        self.smtp_timeout = float(os.getenv('SMTP_TIMEOUT', '30'))
         self.sender_email = os.getenv('EMAIL_USER')
         self.sender_password = os.getenv('EMAIL_PASSWORD')
+        self.outbox = None  # the shared MailQueue, started on first send
 
-    def send_recovery_email(self, to_email, recovery_code):
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = to_email
-            msg['Subject'] = "Password Recovery Code"
+    def connect(self):
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.smtp_timeout)
+        if self.use_starttls:
+            server.starttls()
+        # Local stand-ins (python -m smtpd, aiosmtpd) don't need a login
+        if self.sender_password:
+            server.login(self.sender_email, self.sender_password)
+        return server
 
-            body = f"""Hello!
+    def get_outbox(self):
+        if self.outbox is None:
+            self.outbox = get_mail_queue(self.connect)
+        return self.outbox
+
+    def build_recovery_email(self, to_email, recovery_code):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = to_email
+        msg['Subject'] = "Password Recovery Code"
+
+        body = f"""Hello!
 
 You requested to reset your password. Here's your recovery code:
 {recovery_code}
 
-This code will expire in 15 minutes.
+This code will expire in {describe_duration(self.code_ttl)}.
 
 If you didn't request this, please ignore this email.
 
 Best regards,
 Virtual Classroom Team"""
 
-            msg.attach(MIMEText(body, 'plain'))
-
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.sender_email, self.sender_password)
-            server.send_message(msg)
-            server.quit()
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
 
+    def send_recovery_email(self, to_email, recovery_code):
+        # Queued for the background sender; returns without touching the network
+        try:
+            msg = self.build_recovery_email(to_email, recovery_code)
+            if not self.get_outbox().put(msg):
+                return False, "We're sending lots of emails right now. Please try again in a minute!"
             return True, "Recovery code sent to your email!"
         except Exception as e:
             return False, f"Failed to send email: {str(e)}"
 
     def generate_recovery_code(self):
-        return secrets.token_hex(3)  # Generates a 6-character code 
\ No newline at end of file
+        return secrets.token_hex(3)  # Generates a 6-character code
@@ -0,0 +1,174 @@
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Layout, one directory per student so ids never collide with segment names:
+#   profiles/history/<student_id>/current.jsonl           active segment (append-only)
+#   profiles/history/<student_id>/segment-<ns>.jsonl      sealed segments awaiting compaction
+#   profiles/history/<student_id>/archive-<ns>.jsonl.gz   compacted archives
+CURRENT_SEGMENT = "current.jsonl"
+
+
+class InteractionLog:
+    def __init__(self, base_dir="profiles/history", max_segment_bytes=None):
+        if max_segment_bytes is None:
+            max_segment_bytes = int(os.getenv('HISTORY_SEGMENT_BYTES', str(256 * 1024)))
+        self.base_dir = base_dir
+        self.max_segment_bytes = max_segment_bytes
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def _lock(self, student_id):
+        with self._locks_lock:
+            lock = self._locks.get(student_id)
+            if lock is None:
+                lock = self._locks[student_id] = threading.Lock()
+            return lock
+
+    def student_dir(self, student_id):
+        return os.path.join(self.base_dir, student_id)
+
+    def has_history(self, student_id):
+        return os.path.isdir(self.student_dir(student_id))
+
+    def append(self, student_id, interaction):
+        line = json.dumps(interaction) + "\n"
+        directory = self.student_dir(student_id)
+        with self._lock(student_id):
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, CURRENT_SEGMENT), "a") as f:
+                f.write(line)
+                size = f.tell()
+            if size >= self.max_segment_bytes:
+                self._seal(directory)
+        return len(line)
+
+    def extend(self, student_id, interactions):
+        for interaction in interactions:
+            self.append(student_id, interaction)
+
+    def _seal(self, directory):
+        sealed = os.path.join(directory, f"segment-{time.time_ns():020d}.jsonl")
+        os.replace(os.path.join(directory, CURRENT_SEGMENT), sealed)
+
+    def _files(self, directory, prefix):
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(directory, n) for n in names if n.startswith(prefix))
+
+    def _open_files(self, student_id):
+        # Oldest first: archives, then sealed segments, then the active one.
+        # Listed and opened under the student's lock, so a compaction can't
+        # move files in between; open handles stay readable after it does.
+        directory = self.student_dir(student_id)
+        files = []
+        with self._lock(student_id):
+            for path in self._files(directory, "archive-"):
+                files.append(gzip.open(path, "rt"))
+            for path in self._files(directory, "segment-") + [os.path.join(directory, CURRENT_SEGMENT)]:
+                try:
+                    files.append(open(path, "r"))
+                except FileNotFoundError:
+                    continue
+        return files
+
+    def read(self, student_id):
+        files = self._open_files(student_id)
+        try:
+            for f in files:
+                yield from self._parse(f)
+        finally:
+            for f in files:
+                f.close()
+
+    def _parse(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-append; skip it.
+                continue
+
+    def recent(self, student_id, limit=10):
+        # Newest first: the uncompressed segments, then the archives (newest
+        # archive first) only when the segments don't hold enough.
+        files = self._open_files(student_id)
+        found = deque()
+        try:
+            for f in reversed(files):
+                found.extendleft(reversed(list(self._parse(f))))
+                if limit and len(found) >= limit:
+                    break
+        finally:
+            for f in files:
+                f.close()
+        return list(found)[-limit:] if limit else list(found)
+
+    def compact(self, student_id):
+        directory = self.student_dir(student_id)
+        with self._lock(student_id):
+            sealed = self._files(directory, "segment-")
+            if not sealed:
+                return 0
+            name = os.path.basename(sealed[-1]).replace("segment-", "archive-") + ".gz"
+            archive = os.path.join(directory, name)
+            tmp_path = archive + ".tmp"
+            with gzip.open(tmp_path, "wb") as out:
+                for path in sealed:
+                    with open(path, "rb") as f:
+                        out.write(f.read())
+            os.replace(tmp_path, archive)
+            for path in sealed:
+                os.unlink(path)
+        return len(sealed)
+
+    def compact_all(self):
+        compacted = 0
+        try:
+            student_ids = os.listdir(self.base_dir)
+        except FileNotFoundError:
+            return 0
+        for student_id in student_ids:
+            if os.path.isdir(self.student_dir(student_id)):
+                compacted += self.compact(student_id)
+        return compacted
+
+
+class CompactionJob:
+    def __init__(self, log, interval):
+        self.log = log
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-compaction", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.log.compact_all()
+            except Exception as e:
+                print(f"Error compacting interaction history: {str(e)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("Usage: python interaction_log.py compact")
+        sys.exit(1)
+    count = InteractionLog().compact_all()
+    print(f"Compacted {count} segment(s) into archives.")
@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from metrics import get_metrics
+
+
+def normalize_text(text):
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip("?!. ")
+
+
+def shingles(text, size=3):
+    # Character n-grams of the normalized text; robust to small typos and
+    # word-order changes in short questions.
+    text = f" {normalize_text(text)} "
+    return {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _digest(parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cache_keys(model, messages, temperature=None, near_text=None, **options):
+    # The exact key covers everything that shapes the answer. The near key
+    # leaves out near_text, the student's own words within the last message,
+    # so near-duplicate lookups only compare questions asked with the same
+    # model, prompt, template and context. Without near_text there is no
+    # near key: similarity over a whole templated prompt mostly measures
+    # the template.
+    system = [m["content"] for m in messages if m["role"] == "system"]
+    dialogue = [(m["role"], normalize_text(m["content"])) for m in messages if m["role"] != "system"]
+    exact_key = _digest([model, system, dialogue, temperature, options])
+    near_key = None
+    if near_text and dialogue and near_text in messages[-1]["content"]:
+        template = messages[-1]["content"].replace(near_text, "\x00")
+        near_key = _digest([model, system, dialogue[:-1], normalize_text(template), temperature, options])
+    return exact_key, near_key
+
+
+class CompletionCache:
+    def __init__(self, max_entries=None, ttl=None, similarity=None):
+        if max_entries is None:
+            max_entries = int(os.getenv('LLM_CACHE_SIZE', '1024'))
+        if ttl is None:
+            ttl = float(os.getenv('LLM_CACHE_TTL', '3600'))
+        if similarity is None:
+            similarity = float(os.getenv('LLM_CACHE_SIMILARITY', '0'))
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Minimum Jaccard similarity for a near-duplicate hit; 0 disables the tier
+        self.similarity = similarity
+        self._entries = OrderedDict()  # exact key -> (expires, value, near key, shingles)
+        self._near = {}  # near key -> {exact key: shingles}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, exact_key, near_key=None, text=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(exact_key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(exact_key)
+                    self.stats["hits"] += 1
+                    return entry[1]
+                self._remove(exact_key)
+                self.stats["expired"] += 1
+            if self.similarity > 0 and near_key in self._near and text:
+                match = self._nearest(near_key, shingles(text), now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.stats["near_hits"] += 1
+                    return self._entries[match][1]
+            self.stats["misses"] += 1
+            return None
+
+    def _nearest(self, near_key, text_shingles, now):
+        best_key, best_score = None, self.similarity
+        for key, candidate in list(self._near[near_key].items()):
+            if self._entries[key][0] <= now:
+                self._remove(key)
+                self.stats["expired"] += 1
+                continue
+            score = jaccard(text_shingles, candidate)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, exact_key, value, near_key=None, text=None):
+        with self._lock:
+            if exact_key in self._entries:
+                self._remove(exact_key)
+            text_shingles = shingles(text) if self.similarity > 0 and near_key and text else None
+            self._entries[exact_key] = (time.monotonic() + self.ttl, value, near_key, text_shingles)
+            if text_shingles is not None:
+                self._near.setdefault(near_key, {})[exact_key] = text_shingles
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, exact_key):
+        _, _, near_key, _ = self._entries.pop(exact_key)
+        group = self._near.get(near_key)
+        if group is not None:
+            group.pop(exact_key, None)
+            if not group:
+                del self._near[near_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._near.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SingleFlight:
+    # Identical requests already in flight share one upstream call instead of
+    # each making their own. Unlike the cache this holds nothing once the
+    # call returns, so it applies to every request, cached or not.
+    def __init__(self):
+        self._calls = {}  # key -> (threading.Event, result box)
+        self._tasks = {}  # (event loop, key) -> asyncio.Task
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = (threading.Event(), {})
+                self.stats["leaders"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        done, box = flight
+        if not leader:
+            done.wait()
+            if "error" in box:
+                raise box["error"]
+            return box["result"]
+        try:
+            box["result"] = func()
+            return box["result"]
+        except BaseException as e:
+            box["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            done.set()
+
+    async def do_async(self, key, func):
+        # The call runs as its own task, so a caller that goes away (a closed
+        # connection cancels its handler) doesn't cancel it for the others.
+        flight_key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(flight_key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = self._tasks[flight_key] = asyncio.ensure_future(func())
+            self.stats["leaders"] += 1
+            task.add_done_callback(lambda finished: self._finished(flight_key, finished))
+        return await asyncio.shield(task)
+
+    def _finished(self, flight_key, task):
+        if self._tasks.get(flight_key) is task:
+            del self._tasks[flight_key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller went away
+
+
+class CachedCompletions:
+    def __init__(self, completions, cache, flights=None):
+        self.completions = completions
+        self.cache = cache
+        self.flights = flights
+
+    def _lookup(self, cache, near_text, kwargs):
+        # Deterministic (temperature 0) calls are cached unless cache=False;
+        # other calls only when the caller passes cache=True.
+        if cache is None:
+            cache = kwargs.get("temperature") == 0
+        if not cache or kwargs.get("stream"):
+            return None
+        options = {k: v for k, v in kwargs.items() if k not in ("model", "messages", "temperature")}
+        exact_key, near_key = cache_keys(kwargs["model"], kwargs["messages"], kwargs.get("temperature"),
+                                         near_text, **options)
+        return exact_key, near_key, near_text
+
+    def _flight_key(self, coalesce, lookup, kwargs):
+        # Requests coalesce on the same normalized key the cache uses
+        if coalesce is None:
+            coalesce = self.flights is not None
+        if not coalesce or kwargs.get("stream"):
+            return None
+        if lookup is not None:
+            return lookup[0]
+        options = {k: v for k, v in kwargs.items() if k not in ("model", "messages", "temperature")}
+        return cache_keys(kwargs["model"], kwargs["messages"], kwargs.get("temperature"), **options)[0]
+
+    def _fetch(self, lookup, kwargs):
+        response = self.completions.create(**kwargs)
+        if lookup is not None:
+            self.cache.put(lookup[0], response, lookup[1], lookup[2])
+        return response
+
+    def create(self, cache=None, coalesce=None, near_text=None, **kwargs):
+        # near_text: the student's words inside the last message, for the
+        # near-duplicate tier; calls without it only get exact hits
+        lookup = self._lookup(cache, near_text, kwargs)
+        if lookup is not None:
+            response = self.cache.get(*lookup)
+            if response is not None:
+                return response
+        key = self._flight_key(coalesce, lookup, kwargs)
+        if key is None:
+            return self._fetch(lookup, kwargs)
+        return self.flights.do(key, lambda: self._fetch(lookup, kwargs))
+
+
+class AsyncCachedCompletions(CachedCompletions):
+    async def _fetch(self, lookup, kwargs):
+        response = await self.completions.create(**kwargs)
+        if lookup is not None:
+            self.cache.put(lookup[0], response, lookup[1], lookup[2])
+        return response
+
+    async def create(self, cache=None, coalesce=None, near_text=None, **kwargs):
+        lookup = self._lookup(cache, near_text, kwargs)
+        if lookup is not None:
+            response = self.cache.get(*lookup)
+            if response is not None:
+                return response
+        key = self._flight_key(coalesce, lookup, kwargs)
+        if key is None:
+            return await self._fetch(lookup, kwargs)
+        return await self.flights.do_async(key, lambda: self._fetch(lookup, kwargs))
+
+
+class CachedClient:
+    # Drop-in wrapper for openai.OpenAI: client.chat.completions.create()
+    # goes through the cache and then single-flight, everything else is
+    # passed straight through. coalesce=False opts a call out of sharing.
+    completions_class = CachedCompletions
+
+    def __init__(self, client, cache=None, flights=None):
+        self.client = client
+        self.cache = cache if cache is not None else get_completion_cache()
+        if flights is None and os.getenv('LLM_SINGLE_FLIGHT', '1') == '1':
+            flights = get_single_flight()
+        self.chat = SimpleNamespace(completions=self.completions_class(client.chat.completions, self.cache, flights))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class AsyncCachedClient(CachedClient):
+    # Same for openai.AsyncOpenAI-style clients; shares the cache entries.
+    completions_class = AsyncCachedCompletions
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = CompletionCache()
+            get_metrics().expose_stats("llm_cache", _default_cache.stats)
+        return _default_cache
+
+
+_default_flights = None
+
+
+def get_single_flight():
+    # Shared by the sync and async clients; thread and asyncio callers are
+    # tracked separately
+    global _default_flights
+    with _default_cache_lock:
+        if _default_flights is None:
+            _default_flights = SingleFlight()
+            get_metrics().expose_stats("llm_single_flight", _default_flights.stats)
+        return _default_flights
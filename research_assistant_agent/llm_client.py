@@ -0,0 +1,275 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+import httpx
+import openai
+from llm_cache import AsyncCachedClient, CachedClient
+from metrics import get_metrics
+
+
+class LLMBusyError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, cost=1):
+        # Takes the tokens and returns 0, or returns how long to wait for them.
+        cost = min(cost, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return 0
+            return (cost - self.tokens) / self.rate
+
+    def acquire(self, cost=1, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.reserve(cost)
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, cost=1, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.reserve(cost)
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class ReleasingStream:
+    def __init__(self, stream, release):
+        self.stream = stream
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self.close()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release()
+
+    def __del__(self):
+        self.close()
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def shared_bucket(name, rate_per_minute):
+    # Rate limits apply to the API key, so the sync and async clients in one
+    # process draw from the same buckets.
+    with _buckets_lock:
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(rate_per_minute) if rate_per_minute else None
+        return _buckets[name]
+
+
+class BaseLLMClient:
+    RETRYABLE = (openai.RateLimitError, openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError)
+
+    def __init__(self, api_key=None, max_concurrency=None, requests_per_minute=None, tokens_per_minute=None,
+                 timeout=None, max_retries=None, queue_timeout=None):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self.max_concurrency = max_concurrency or int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+        self.timeout = timeout or float(os.getenv('OPENAI_TIMEOUT', '30'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('OPENAI_MAX_RETRIES', '4'))
+        self.queue_timeout = queue_timeout or float(os.getenv('OPENAI_QUEUE_TIMEOUT', '30'))
+        if requests_per_minute or tokens_per_minute:
+            self.requests_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+            self.tokens_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        else:
+            self.requests_bucket = shared_bucket("requests", int(os.getenv('OPENAI_RPM', '500')))
+            self.tokens_bucket = shared_bucket("tokens", int(os.getenv('OPENAI_TPM', '0')))
+        self.stats = {"requests": 0, "retries": 0, "rejected": 0, "errors": 0}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_completion))
+
+    def http_limits(self):
+        # One keep-alive connection pool sized to the concurrency limit, shared
+        # by every caller in the process. Retries are ours, not the SDK's.
+        return httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+
+    def estimate_tokens(self, kwargs):
+        prompt = sum(len(m.get("content") or "") for m in kwargs.get("messages", [])) // 4
+        return prompt + kwargs.get("max_tokens", 256)
+
+    def _reject(self, reason):
+        self.stats["rejected"] += 1
+        raise LLMBusyError(reason)
+
+    def _backoff(self, attempt, error):
+        # Honour Retry-After when the API sends one, otherwise exponential
+        # backoff with full jitter so a burst of retries spreads out.
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 60)
+            except ValueError:
+                pass
+        return random.uniform(0, min(0.5 * 2 ** attempt, 20))
+
+
+class LLMClient(BaseLLMClient):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.client = openai.OpenAI(
+            api_key=self.api_key,
+            http_client=httpx.Client(limits=self.http_limits(), timeout=self.timeout),
+            timeout=self.timeout,
+            max_retries=0
+        )
+        self.slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def create_completion(self, **kwargs):
+        deadline = time.monotonic() + self.queue_timeout
+        # Wait in line for a free slot rather than failing straight away;
+        # give up only once the queue timeout has passed.
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self._reject("Too many requests waiting for the model")
+        try:
+            response = self._call_with_retries(kwargs, deadline)
+        except BaseException:
+            self.slots.release()
+            raise
+        if kwargs.get("stream"):
+            # Keep the slot until the caller has drained the stream
+            return ReleasingStream(response, self.slots.release)
+        self.slots.release()
+        get_metrics().record_usage(response)
+        return response
+
+    def _call_with_retries(self, kwargs, deadline):
+        for attempt in range(self.max_retries + 1):
+            remaining = max(deadline - time.monotonic(), 0)
+            if self.requests_bucket and not self.requests_bucket.acquire(timeout=remaining):
+                self._reject("Request rate limit reached")
+            if self.tokens_bucket and not self.tokens_bucket.acquire(self.estimate_tokens(kwargs), timeout=remaining):
+                self._reject("Token rate limit reached")
+            self.stats["requests"] += 1
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except self.RETRYABLE as e:
+                if attempt == self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(self._backoff(attempt, e))
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+
+class AsyncLLMClient(BaseLLMClient):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            http_client=httpx.AsyncClient(limits=self.http_limits(), timeout=self.timeout),
+            timeout=self.timeout,
+            max_retries=0
+        )
+        # Created on first use so it binds to the server's event loop
+        self.slots = None
+
+    async def create_completion(self, **kwargs):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_concurrency)
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("Too many requests waiting for the model")
+        try:
+            response = await self._call_with_retries(kwargs, deadline)
+        except BaseException:
+            self.slots.release()
+            raise
+        if kwargs.get("stream"):
+            return ReleasingStream(response, self.slots.release)
+        self.slots.release()
+        get_metrics().record_usage(response)
+        return response
+
+    async def _call_with_retries(self, kwargs, deadline):
+        for attempt in range(self.max_retries + 1):
+            remaining = max(deadline - time.monotonic(), 0)
+            if self.requests_bucket and not await self.requests_bucket.acquire_async(timeout=remaining):
+                self._reject("Request rate limit reached")
+            if self.tokens_bucket and not await self.tokens_bucket.acquire_async(
+                    self.estimate_tokens(kwargs), timeout=remaining):
+                self._reject("Token rate limit reached")
+            self.stats["requests"] += 1
+            try:
+                return await self.client.chat.completions.create(**kwargs)
+            except self.RETRYABLE as e:
+                if attempt == self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+
+_default_client = None
+_default_async_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    # The process-wide client: pooled, rate limited and retrying, behind the
+    # shared completion cache. Exposes client.chat.completions.create().
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            client = LLMClient()
+            get_metrics().expose_stats("llm", client.stats, client="sync")
+            _default_client = CachedClient(client)
+        return _default_client
+
+
+def get_async_llm_client():
+    # Same for asyncio callers: await client.chat.completions.create().
+    global _default_async_client
+    with _default_client_lock:
+        if _default_async_client is None:
+            client = AsyncLLMClient()
+            get_metrics().expose_stats("llm", client.stats, client="async")
+            _default_async_client = AsyncCachedClient(client)
+        return _default_async_client
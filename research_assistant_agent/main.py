@@ -1,18 +1,38 @@
 import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import openai
 from datetime import datetime, timedelta
-from student_profile import StudentProfile
+from profile_cache import get_profile_cache
 from educational_activities import EducationalActivities
 from user_auth import UserAuth
+from sessions import SessionManager
+from llm_client import LLMBusyError, get_llm_client
+from metrics import get_metrics
+from analysis_batcher import AnalysisBatcher, normalize_analysis
+from style_classifier import StyleClassifier
+from quiz_sessions import QuizManager
+from commands import CommandRouter
+from analytics import get_analytics
+from search_index import get_search_index
 
 class VirtualClassroom:
     def __init__(self):
         load_dotenv()
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        self.client = openai.OpenAI(api_key=self.api_key)
+        # Shared pooled, rate-limited client behind the response cache; analysis
+        # runs at temperature 0 and is cached by default, replies when LLM_CACHE_REPLIES=1.
+        self.client = get_llm_client()
+        self.cache_replies = os.getenv('LLM_CACHE_REPLIES', '0') == '1'
         self.conversation_history = []
-        self.active_users = {}
+        # Bounded LRU of loaded profiles; idle or excess ones are flushed and dropped
+        self.active_users = get_profile_cache()
+        # Timing spans and counters, served at /metrics or printed by --profile
+        self.metrics = get_metrics()
+        # Classroom-wide counters, kept current from profile changes
+        self.analytics = get_analytics()
+        # Interest and word lookups across all students (/search, search_index.py)
+        self.search_index = get_search_index()
         self.system_prompt = """You are a friendly and educational chat moderator for a kids' virtual classroom. Your role is to:
         1. Keep the conversation fun but educational
         2. Adapt your teaching style to each student's learning style
@@ -22,28 +42,109 @@ class VirtualClassroom:
         6. Help students learn through their interests
         """
         self.activities = EducationalActivities()
-        self.current_quiz_theme = None
+        # One quiz in progress per student, with its answer key fixed at the start
+        self.quizzes = QuizManager(self.activities, self.get_or_create_student)
+        self.commands = self.build_commands()
         self.auth = UserAuth()
+        # Login state and the active quiz live on per-student sessions, so
+        # one process can serve a whole classroom without cross-talk.
+        self.sessions = SessionManager()
+        # sequential: analysis, then reply (two round trips back to back)
+        # parallel: analysis and reply run concurrently; the turn waits for both
+        # background: reply returns immediately, analysis is applied when it lands
+        # single: one JSON-mode call returns both the reply and the analysis
+        # batched: reply returns immediately; analysis is queued and sent in
+        # micro-batches of many messages per call, applied when each batch lands
+        self.analysis_mode = os.getenv('ANALYSIS_MODE', 'parallel')
+        self.analysis_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv('ANALYSIS_WORKERS', '4')),
+            thread_name_prefix="analysis"
+        )
+        # Local lexicon + naive Bayes classifier; confident messages skip the
+        # analysis call entirely (python style_classifier.py train)
+        self.classifier = StyleClassifier() if os.getenv('STYLE_CLASSIFIER', '1') == '1' else None
+        self.analysis_batcher = None
+        if self.analysis_mode == 'batched':
+            self.analysis_batcher = AnalysisBatcher(self.client, self.analysis_pool)
+        self.single_call_instructions = """
+
+        Respond with a JSON object with these keys:
+        "reply": your message to the student,
+        "style": the learning style the message suggests (visual, auditory or kinesthetic),
+        "interests": a list of interests or topics in the message,
+        "engagement": the student's engagement level (high, medium or low)"""
     
     def get_or_create_student(self, username):
-        if username not in self.active_users:
-            self.active_users[username] = StudentProfile(username, username)
-        return self.active_users[username]
+        return self.active_users.get(username)
+
+    def get_session(self, session_token=None):
+        # Callers without their own token (the CLI) share one local session
+        return self.sessions.get_or_create(session_token or "local")
 
-    def moderate_message(self, username, message):
+    def moderate_message(self, username, message, session_token=None):
+        self.metrics.inc("messages", source="classroom")
         try:
+            session = self.get_session(session_token)
             # Use logged-in username if available
-            if self.auth.is_logged_in():
-                username = self.auth.current_user
+            if session.is_logged_in():
+                username = session.username
+            session.student_id = username
                 
             student = self.get_or_create_student(username)
 
             # Check for special commands
             if message.lower().startswith('!'):
-                return self.handle_command(message.lower(), username)
+                return self.handle_command(message.lower(), username, session_token)
             
-            # Analyze message for learning style and interests
-            analysis_prompt = f"""Analyze this message for:
+            if self.analysis_mode == 'single':
+                response, analysis = self.reply_with_analysis(username, message, student)
+                self.record_turn(student, message, response, analysis)
+                return response
+
+            if self.analysis_mode == 'sequential':
+                analysis = self.analyze_message(message)
+                style = analysis[0] if analysis else student.profile['learning_style']['primary']
+                response = self.generate_reply(username, message, style)
+                self.record_turn(student, message, response, analysis)
+                return response
+
+            analysis = self.classifier.analyze(message) if self.classifier else None
+            if analysis is not None:
+                response = self.generate_reply(username, message, analysis[0])
+                self.record_turn(student, message, response, analysis, analyzed_by="local")
+                return response
+
+            if self.analysis_mode == 'batched':
+                response = self.generate_reply(username, message, student.profile['learning_style']['primary'])
+                self.analysis_batcher.submit(
+                    message,
+                    lambda analysis: self.record_turn(self.get_or_create_student(username), message, response, analysis)
+                )
+                return response
+
+            # parallel/background: the reply uses the style learned from earlier
+            # messages, so it no longer has to wait for this message's analysis.
+            analysis_future = self.analysis_pool.submit(self.analyze_message, message)
+            response = self.generate_reply(username, message, student.profile['learning_style']['primary'])
+            if self.analysis_mode == 'background':
+                # Looked up again when the analysis lands: the profile may have
+                # been evicted and reloaded meanwhile, and the old copy is stale.
+                analysis_future.add_done_callback(
+                    lambda future: self.record_turn(self.get_or_create_student(username), message, response,
+                                                    self.analysis_result(future))
+                )
+            else:
+                self.record_turn(student, message, response, self.analysis_result(analysis_future))
+            return response
+
+        except LLMBusyError:
+            return "Lots of students are asking questions right now! Please try again in a moment. ⏳"
+        except Exception as e:
+            print(f"Error handling message: \n{str(e)}")  # Added for debugging
+            return "I apologize, but I encountered an error processing your message. Please try again."
+
+    def analyze_message(self, message):
+        analysis_prompt = f"""Analyze this message for:
             1. Learning style indicators (visual, auditory, kinesthetic)
             2. Interests or topics
             3. Engagement level (high, medium, low)
@@ -51,68 +152,116 @@ class VirtualClassroom:
             Message: {message}
             
             Format: STYLE|INTERESTS|ENGAGEMENT"""
-            
-            # Updated API call format
+
+        with self.metrics.span("analysis"):
             analysis_response = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": analysis_prompt}],
-                temperature=0.7,
-                max_tokens=100
+                temperature=0,
+                max_tokens=100,
+                near_text=message
             )
-            analysis = analysis_response.choices[0].message.content
-            
-            style, interests, engagement = analysis.split('|')
-            
-            # Update student profile
-            student.update_learning_style(style.lower(), None, 0.7)
-            for interest in interests.split(','):
-                student.add_interest(interest.strip())
-            
-            # Updated API call format
+        return self.parse_analysis(analysis_response.choices[0].message.content)
+
+    def parse_analysis(self, analysis):
+        parts = [part.strip() for part in analysis.split('|')]
+        if len(parts) != 3:
+            print(f"Unexpected analysis format: {analysis}")
+            return None
+        style, interests, engagement = parts
+        interests = [interest.strip() for interest in interests.split(',') if interest.strip()]
+        return style.lower(), interests, engagement.lower()
+
+    def analysis_result(self, future):
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"Error analyzing message: \n{str(e)}")
+            return None
+
+    def generate_reply(self, username, message, style):
+        with self.metrics.span("chat"):
             chat_response = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": f"Student {username} (learning style: {style or 'unknown'}) says: {message}"}
+                ],
+                temperature=0.7,
+                max_tokens=500,
+                cache=self.cache_replies,
+                near_text=message
+            )
+        return chat_response.choices[0].message.content
+
+    def reply_with_analysis(self, username, message, student):
+        # One round trip: the model returns the reply and the analysis as JSON.
+        style = student.profile['learning_style']['primary'] or 'unknown'
+        with self.metrics.span("chat"):
+            chat_response = self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": self.system_prompt + self.single_call_instructions},
                     {"role": "user", "content": f"Student {username} (learning style: {style}) says: {message}"}
                 ],
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=600,
+                response_format={"type": "json_object"},
+                cache=self.cache_replies,
+                near_text=message
             )
-            response = chat_response.choices[0].message.content
-            
-            # Record interaction
-            student.add_interaction(message, response, engagement.lower())
-            
-            return response
+        content = chat_response.choices[0].message.content
+        try:
+            result = json.loads(content)
+            reply = result["reply"]
+        except (ValueError, KeyError, TypeError):
+            print(f"Unexpected single-call response: {content}")
+            return content, None
+        return reply, normalize_analysis(result)
 
-        except Exception as e:
-            print(f"Error handling message: \n{str(e)}")  # Added for debugging
-            return "I apologize, but I encountered an error processing your message. Please try again."
+    def record_turn(self, student, message, response, analysis, analyzed_by="model"):
+        engagement = "medium"
+        labels = {}
+        if analysis:
+            style, interests, engagement = analysis
+            student.update_learning_style(style, None, 0.7)
+            for interest in interests:
+                student.add_interest(interest)
+            labels = {"style": style, "interests": interests, "analyzed_by": analyzed_by}
+        student.add_interaction(message, response, engagement, **labels)
 
-    def handle_command(self, command, username):
-        commands = {
-            '!profile': lambda: self.show_profile(username),
-            '!help': self.show_help,
-            '!theme': lambda: self.change_theme(command),
-            '!quiz': lambda: self.start_quiz(username, command),
-            '!activity': lambda: self.start_activity(username),
-            '!answer': lambda: self.check_answer(username, command),
-            '!register': lambda: self.register_user(username, command),
-            '!login': lambda: self.login_user(username, command),
-            '!logout': lambda: self.logout_user(username),
-            '!forgot': lambda: self.forgot_password(username, command),
-            '!verify': lambda: self.verify_code(username, command),
-            '!reset': lambda: self.reset_password(username, command)
-        }
-        
-        parts = command.split(maxsplit=1)
-        command_name = parts[0]
-            
-        if command_name in commands:
-            return commands[command_name]()
-        return "Hmm, I don't know that command! Try !help for a list of commands! 🤔"
+    def build_commands(self):
+        # Built once; handlers get (session, username, **parsed args)
+        return (CommandRouter("Hmm, I don't know that command! Try !help for a list of commands! 🤔")
+                .add('!profile', self.show_profile)
+                .add('!help', response=self.show_help())
+                .add('!theme', self.change_theme, "theme?")
+                .add('!quiz', self.start_quiz, "theme?")
+                .add('!activity', self.start_activity)
+                .add('!answer', self.check_answer, "answer", usage="Please provide an answer! Example: !answer A")
+                .add('!register', self.register_user, "account password name... email",
+                     usage="Usage: !register [username] [password] [your name] [email]")
+                .add('!login', self.login_user, "account password", usage="Usage: !login [username] [password]")
+                .add('!logout', self.logout_user)
+                .add('!forgot', self.forgot_password, "account", usage="Usage: !forgot [username]")
+                .add('!verify', self.verify_code, "account code", usage="Usage: !verify [username] [code]")
+                .add('!reset', self.reset_password, "account new_password",
+                     usage="Usage: !reset [username] [new_password]"))
 
-    def show_profile(self, username):
+    def handle_command(self, command, username=None, session_token=None):
+        session = self.get_session(session_token)
+        # The logged-in account, else the name this session chats under;
+        # None when the student hasn't said who they are yet
+        if session.is_logged_in():
+            username = session.username
+        elif session.student_id:
+            username = session.student_id
+        with self.metrics.span("command"):
+            return self.commands.dispatch(command, session, username)
+
+    def show_profile(self, session, username):
+        if not username:
+            return "Tell me your name or !login first, and I'll show you your profile!"
         student = self.get_or_create_student(username)
         profile = student.get_profile_summary()
         return f"""📚 {username}'s Learning Profile 📚
@@ -129,121 +278,152 @@ Progress Level: {profile['progress']['language']['level']}"""
 !verify [username] [code] - Verify recovery code
 !reset [username] [new_password] - Reset password
 !profile - See your learning profile
-!theme - Change the learning theme
-!quiz - Take a themed quiz
+!theme [theme] - Change the learning theme
+!quiz [theme] - Take a themed quiz
 !activity - Get a fun learning activity
-!answer - Answer a quiz question
+!answer [A, B or C] - Answer a quiz question
 !help - Show this help message"""
 
-    def start_activity(self, username):
-        student = self.get_or_create_student(username)
-        interests = student.profile['interests']
+    def change_theme(self, session, username, theme=None):
+        if theme is None:
+            return f"Which theme? Try !theme followed by one of: {self.activities.theme_suggestions()}"
+
+        if self.activities.theme_bank(theme) is None:
+            return f"Theme not found! Try {self.activities.theme_suggestions()}!"
+        session.quiz_theme = theme
+        return f"🌈 Theme changed to {theme}! Try !quiz or !activity to get started!"
+
+    def learning_style(self, student):
+        return student.profile['learning_style']['primary'] if student else None
+
+    def start_quiz(self, session, username, theme=None):
+        student = self.get_or_create_student(username) if username else None
+        if theme is None:
+            # The chosen theme, else the first interest we have quizzes for
+            interests = student.profile['interests'] if student else []
+            theme = session.quiz_theme or next(
+                (interest for interest in interests if interest in self.activities.theme_names),
+                self.activities.themes[0] if self.activities.themes else None
+            )
+
+        quiz = self.quizzes.start(username, theme, self.learning_style(student), key=session.token)
+        if quiz is None:
+            return f"I don't have a quiz for that yet! Try {self.activities.theme_suggestions()}!"
+        session.quiz_theme = theme
+        return f"Let's do a quiz about {theme}! 🧠\n\n{self.format_question(quiz)}"
+
+    def format_question(self, quiz):
+        question = quiz.ask()
+        return f"Question {quiz.position + 1} of {len(quiz.question_ids)}:\n{question['text']}"
+
+    def start_activity(self, session, username):
+        student = self.get_or_create_student(username) if username else None
+        interests = student.profile['interests'] if student else []
         
-        if not interests:
+        if not interests and not session.quiz_theme:
             return "Let's learn about something you're interested in! What do you like?"
             
-        # Use student's first interest as theme
-        theme = interests[0]
-        return self.activities.get_activity(theme, student)
-
-    def check_answer(self, username, command):
-        parts = command.split()
-        if len(parts) < 2:
-            return "Please provide an answer! Example: !answer A"
-            
-        answer = parts[1]
-        return self.activities.check_answer(self.current_quiz_theme, answer)
+        # Use the chosen theme, or the student's first interest
+        theme = session.quiz_theme or interests[0]
+        activity = self.activities.pick(theme, self.learning_style(student))
+        if activity is None:
+            if student is None:
+                return f"Theme not found! Try {self.activities.theme_suggestions()}!"
+            return self.activities.get_activity(theme, student)
+        if activity['type'] == 'quiz':
+            # Remember exactly which question was asked, for !answer
+            self.quizzes.issue(username, activity, key=session.token)
+        return activity['text']
+
+    def check_answer(self, session, username, answer):
+        # Quizzes are kept per chat session, so they work before logging in too
+        result = self.quizzes.answer(session.token, answer)
+        if result is None:
+            return "There's no quiz going on right now! Start one with !quiz 🎯"
+
+        question, correct, quiz = result
+        if correct:
+            feedback = f"🎉 Correct! {question['explanation']}"
+        else:
+            feedback = f"Not quite! The answer was {question['correct']}. {question['explanation']}"
+        if quiz.finished:
+            return f"{feedback}\n\n🏆 Quiz complete! You got {quiz.score} out of {len(quiz.question_ids)} right!"
+        return f"{feedback}\n\n{self.format_question(quiz)}"
 
-    def register_user(self, username, command):
-        if self.auth.is_logged_in():
+    def register_user(self, session, username, account, password, name, email):
+        if session.is_logged_in():
             return "You're already logged in! Use !logout first."
             
-        parts = command.split()
-        if len(parts) < 4:
-            return "Usage: !register [username] [password] [your name] [email]"
-            
-        username = parts[1]
-        password = parts[2]
-        name = " ".join(parts[3:])
-        email = parts[4]
-        
-        success, message = self.auth.register(username, password, name, email)
+        with self.metrics.span("auth"):
+            success, message = self.auth.register(account, password, name, email)
         return message
 
-    def login_user(self, username, command):
-        if self.auth.is_logged_in():
+    def login_user(self, session, username, account, password):
+        if session.is_logged_in():
             return "You're already logged in! Use !logout first."
             
-        parts = command.split()
-        if len(parts) < 3:
-            return "Usage: !login [username] [password]"
-            
-        username = parts[1]
-        password = parts[2]
-        
-        success, message = self.auth.login(username, password)
+        with self.metrics.span("auth"):
+            success, message = self.auth.login(session, account, password)
         if success:
             # Load or create student profile for logged-in user
-            self.get_or_create_student(username)
+            session.student_id = account
+            self.get_or_create_student(account)
         return message
 
-    def logout_user(self, username):
-        return self.auth.logout()
+    def logout_user(self, session, username):
+        return self.auth.logout(session)
 
-    def forgot_password(self, username, command):
-        parts = command.split()
-        if len(parts) < 2:
-            return "Usage: !forgot [username]"
-            
-        username = parts[1]
-        success, message = self.auth.initiate_password_recovery(username)
+    def forgot_password(self, session, username, account):
+        success, message = self.auth.initiate_password_recovery(account)
         return message
 
-    def verify_code(self, username, command):
-        parts = command.split()
-        if len(parts) < 3:
-            return "Usage: !verify [username] [code]"
-            
-        username = parts[1]
-        code = parts[2]
-        success, message = self.auth.verify_recovery_code(username, code)
+    def verify_code(self, session, username, account, code):
+        success, message = self.auth.verify_recovery_code(account, code)
         return message
 
-    def reset_password(self, username, command):
-        parts = command.split()
-        if len(parts) < 3:
-            return "Usage: !reset [username] [new_password]"
-            
-        username = parts[1]
-        new_password = parts[2]
-        success, message = self.auth.reset_password(username, new_password)
+    def reset_password(self, session, username, account, new_password):
+        success, message = self.auth.reset_password(account, new_password)
         return message
 
 def main():
+    parser = argparse.ArgumentParser(description="Virtual Classroom chat")
+    parser.add_argument('--profile', action='store_true', help="print a per-stage timing breakdown on exit")
+    args = parser.parse_args()
+
     classroom = VirtualClassroom()
-    
+    session = classroom.get_session()
+    try:
+        run_chat(classroom, session)
+    finally:
+        if args.profile:
+            print(classroom.metrics.report())
+
+def run_chat(classroom, session):
     print("Welcome to the Virtual Classroom!")
     print("Type !help for available commands")
     print("Type 'quit' to exit")
     
     while True:
-        if classroom.auth.is_logged_in():
-            user = classroom.auth.get_current_user()
+        if session.is_logged_in():
+            user = classroom.auth.get_current_user(session)
             prompt = f"{user['name']}, what would you like to learn about? "
+        elif session.student_id:
+            prompt = f"{session.student_id}, what would you like to learn about? "
         else:
             prompt = "\nWhat's your name? "
             
         user_input = input(prompt)
         if user_input.lower() == 'quit':
-            if classroom.auth.is_logged_in():
-                print(classroom.auth.logout())
+            if session.is_logged_in():
+                print(classroom.auth.logout(session))
             print("See you next time! 👋")
             break
             
         if user_input.startswith('!'):
-            response = classroom.handle_command(user_input, user_input)
+            response = classroom.handle_command(user_input)
         else:
-            response = classroom.moderate_message(user_input, user_input)
+            # The first thing typed answers "What's your name?"
+            response = classroom.moderate_message(session.student_id or user_input, user_input)
             
         print(f"\nTeacher: {response}")
 
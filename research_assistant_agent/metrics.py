@@ -0,0 +1,174 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics: timing spans land in one histogram labelled by stage,
+# counters are keyed by name and labels, and the stats dicts other modules
+# already keep (cache, writer, client, storage) are exposed as they are.
+# render() produces the Prometheus text format served at /metrics.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, bound in enumerate(self.buckets):
+            seen += self.counts[i]
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self, prefix="classroom"):
+        self.prefix = prefix
+        self.started = time.monotonic()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._stats = []  # (name, stats dict or callable, labels, kind)
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def expose_stats(self, name, stats, kind="counter", **labels):
+        # stats is a dict of numbers (or a callable returning one), read at
+        # scrape time; each key becomes <prefix>_<name>_<key>.
+        with self._lock:
+            self._stats.append((name, stats, _label_key(labels), kind))
+
+    def record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.inc("tokens", getattr(usage, "prompt_tokens", 0) or 0, direction="in")
+        self.inc("tokens", getattr(usage, "completion_tokens", 0) or 0, direction="out")
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.sum, h.buckets))
+                                for key, h in self._histograms.items())
+            stats = list(self._stats)
+
+        # Samples of one metric must be contiguous, so group them by family
+        families = {}  # metric -> (kind, sample lines)
+
+        def add(metric, kind, line):
+            families.setdefault(metric, (kind, []))[1].append(line)
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}_total"
+            add(metric, "counter", f"{metric}{_format_labels(labels)} {value}")
+
+        for (name, labels), (counts, count, total, buckets) in histograms:
+            metric = f"{self.prefix}_{name}"
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                add(metric, "histogram", f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            add(metric, "histogram", f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            add(metric, "histogram", f"{metric}_sum{_format_labels(labels)} {total}")
+            add(metric, "histogram", f"{metric}_count{_format_labels(labels)} {count}")
+
+        for name, source, labels, kind in stats:
+            values = source() if callable(source) else dict(source)
+            for key, value in sorted(values.items()):
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = f"{self.prefix}_{name}_{key}" + ("_total" if kind == "counter" else "")
+                add(metric, kind, f"{metric}{_format_labels(labels)} {value}")
+
+        lines = []
+        for metric, (kind, samples) in families.items():
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        # Per-stage breakdown for the CLI's --profile switch
+        elapsed = time.monotonic() - self.started
+        with self._lock:
+            rows = [(dict(labels).get("stage", name), h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.max)
+                    for (name, labels), h in self._histograms.items() if name == "stage_seconds"]
+            counters = sorted(self._counters.items())
+        rows.sort(key=lambda row: row[2], reverse=True)
+        lines = [f"Profile after {elapsed:.1f}s",
+                 f"{'stage':<16}{'calls':>8}{'total s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+        for stage, count, total, p50, p95, longest in rows:
+            lines.append(f"{stage:<16}{count:>8}{total:>10.3f}{total / count * 1000:>10.1f}"
+                         f"{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}{longest * 1000:>10.1f}")
+        for (name, labels), value in counters:
+            label = ",".join(f"{k}={v}" for k, v in labels)
+            lines.append(f"{name}{'{' + label + '}' if label else ''}: {value}")
+        return "\n".join(lines)
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
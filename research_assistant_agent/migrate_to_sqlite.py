@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+from storage import JSONStorage, SQLiteStorage
+
+
+def migrate_profiles(source, target):
+    migrated = 0
+    for student_id in source.list_profile_ids():
+        profile = source.load_profile(student_id)
+        if profile is None:
+            continue
+        # Profiles that were never loaded since the history split still embed
+        # their interactions; fold them into the interactions table.
+        history = profile.pop("interaction_history", None)
+        if history is None:
+            history = source.iter_interactions(student_id)
+        copy_history = not target.has_interactions(student_id)
+        summary = {"count": 0, "last_interaction": None, "engagement": {"high": 0, "medium": 0, "low": 0}}
+        for interaction in history:
+            if copy_history:
+                target.append_interaction(student_id, interaction)
+            summary["count"] += 1
+            summary["last_interaction"] = interaction.get("date")
+            engagement = interaction.get("engagement")
+            summary["engagement"][engagement] = summary["engagement"].get(engagement, 0) + 1
+        profile["interaction_summary"] = summary
+        target.save_profile(student_id, target.serialize_profile(profile))
+        migrated += 1
+    return migrated
+
+
+def migrate_users(source, target):
+    users = source.list_users()
+    for username, user in users.items():
+        target.save_user(username, user)
+    return len(users)
+
+
+def migrate_conversation(path, target, conversation_id):
+    try:
+        with open(path, "r") as f:
+            messages = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return 0
+    if target.load_messages(conversation_id, limit=1):
+        return 0
+    for message in messages:
+        target.append_message(conversation_id, message["role"], message["content"], message.get("timestamp"))
+    return len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the JSON profile, user and conversation files into SQLite.")
+    parser.add_argument("--profiles", default="profiles")
+    parser.add_argument("--users", default="users.json")
+    parser.add_argument("--conversation", default="conversation_history.json")
+    parser.add_argument("--conversation-id", default="default")
+    parser.add_argument("--database", default=os.getenv('STORAGE_DATABASE', 'virtual_classroom.db'))
+    args = parser.parse_args()
+
+    source = JSONStorage(profiles_dir=args.profiles, users_file=args.users)
+    target = SQLiteStorage(args.database)
+    try:
+        profiles = migrate_profiles(source, target)
+        users = migrate_users(source, target)
+        messages = migrate_conversation(args.conversation, target, args.conversation_id)
+    finally:
+        target.close()
+
+    print(f"Migrated {profiles} profile(s), {users} user(s) and {messages} message(s) into {args.database}")
+    print("Set STORAGE_BACKEND=sqlite to use it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import get_metrics
+
+# Salted scrypt password hashes, stored as
+#
+#   scrypt$<n>$<r>$<p>$<salt>$<hash>           (base64 salt and hash)
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>   (PASSWORD_HASH=pbkdf2, or no scrypt in this OpenSSL)
+#
+# Older accounts hold a bare unsalted SHA-256 hex digest; those still verify
+# and are rehashed the next time the student logs in.
+#
+# Each hash takes tens of milliseconds of CPU and (for scrypt) 16 MB, so
+# they run on a small pool; hashlib releases the GIL while it works, so
+# the rest of the server keeps going. When more than queue_depth hashes are
+# already waiting, new ones are turned away straight off instead of piling up.
+
+
+class HasherBusyError(Exception):
+    pass
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class PasswordHasher:
+    def __init__(self, algorithm=None, workers=None, queue_depth=None, timeout=None,
+                 scrypt_n=None, pbkdf2_iterations=None):
+        if algorithm is None:
+            algorithm = os.getenv('PASSWORD_HASH', 'scrypt')
+        if workers is None:
+            workers = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+        if queue_depth is None:
+            queue_depth = int(os.getenv('PASSWORD_HASH_QUEUE', '64'))
+        if timeout is None:
+            timeout = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+        if scrypt_n is None:
+            scrypt_n = int(os.getenv('PASSWORD_SCRYPT_N', str(2 ** 14)))
+        if pbkdf2_iterations is None:
+            pbkdf2_iterations = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', '600000'))
+        if algorithm == 'scrypt' and not hasattr(hashlib, 'scrypt'):
+            algorithm = 'pbkdf2'
+        self.algorithm = algorithm
+        self.scrypt_params = (scrypt_n, 8, 1)
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        # Hashes running or waiting; anything past workers + queue_depth is refused
+        self.slots = threading.BoundedSemaphore(workers + queue_depth)
+        self.stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0}
+
+    # Hash formats
+
+    def compute_hash(self, password):
+        salt = secrets.token_bytes(16)
+        if self.algorithm == 'scrypt':
+            n, r, p = self.scrypt_params
+            digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+            return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(digest)}"
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.pbkdf2_iterations)
+        return f"pbkdf2_sha256${self.pbkdf2_iterations}${_b64(salt)}${_b64(digest)}"
+
+    def check_hash(self, password, stored):
+        # Returns (matches, needs_rehash)
+        parts = stored.split("$")
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            n, r, p = (int(value) for value in parts[1:4])
+            digest = hashlib.scrypt(password.encode(), salt=_unb64(parts[4]), n=n, r=r, p=p,
+                                    maxmem=256 * n * r, dklen=32)
+            current = self.algorithm == 'scrypt' and (n, r, p) == self.scrypt_params
+        elif parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            iterations = int(parts[1])
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), _unb64(parts[2]), iterations)
+            current = self.algorithm == 'pbkdf2' and iterations == self.pbkdf2_iterations
+        else:
+            # Legacy unsalted SHA-256
+            matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+            return matches, True
+        return hmac.compare_digest(digest, _unb64(parts[-1])), not current
+
+    # Pool
+
+    def submit(self, func, *args):
+        # A Future for func(*args) on the pool; HasherBusyError when the queue is full
+        if not self.slots.acquire(blocking=False):
+            self.stats["rejected"] += 1
+            raise HasherBusyError("Too many password checks waiting")
+        try:
+            future = self.pool.submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def hash(self, password):
+        hashed = self.submit(self.compute_hash, password).result(self.timeout)
+        self.stats["hashed"] += 1
+        return hashed
+
+    def verify(self, password, stored):
+        result = self.submit(self.check_hash, password, stored).result(self.timeout)
+        self.stats["verified"] += 1
+        return result
+
+    def usage(self):
+        return {"waiting": self.pool._work_queue.qsize()}
+
+
+_default_hasher = None
+_default_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    global _default_hasher
+    with _default_hasher_lock:
+        if _default_hasher is None:
+            _default_hasher = PasswordHasher()
+            get_metrics().expose_stats("password_hash", _default_hasher.stats)
+            get_metrics().expose_stats("password_hash", _default_hasher.usage, kind="gauge")
+        return _default_hasher
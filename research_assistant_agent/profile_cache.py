@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from metrics import get_metrics
+from profile_writer import get_profile_writer
+from student_profile import StudentProfile
+
+# Rough bytes a quiz result adds to a profile: a first progress entry for the
+# theme, and a milestone on each level up
+QUIZ_THEME_BYTES = 70
+MILESTONE_BYTES = 45
+
+
+class ProfileCache:
+    def __init__(self, loader=None, max_entries=None, max_bytes=None, idle_ttl=None, writer=None):
+        if max_entries is None:
+            max_entries = int(os.getenv('PROFILE_CACHE_SIZE', '500'))
+        if max_bytes is None:
+            max_bytes = int(os.getenv('PROFILE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+        if idle_ttl is None:
+            idle_ttl = float(os.getenv('PROFILE_CACHE_IDLE_TTL', '1800'))
+        self.loader = loader or StudentProfile
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.writer = writer or get_profile_writer()
+        # student_id -> [profile, approximate bytes, last used]; least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        # Keeps the size estimates current as cached profiles grow
+        StudentProfile.add_listener(self.on_change)
+
+    def close(self):
+        StudentProfile.remove_listener(self.on_change)
+
+    def estimate_size(self, profile):
+        # Serialized size is a stable stand-in for the dict's footprint
+        with profile.lock:
+            return len(json.dumps(profile.profile))
+
+    def get(self, student_id, name=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is not None:
+                self._entries.move_to_end(student_id)
+                entry[2] = now
+                self.stats["hits"] += 1
+                # Idle entries are swept on every access; with the oldest at
+                # the front this is a single check when nothing has expired.
+                evicted = self._evict(now)
+            else:
+                self.stats["misses"] += 1
+        if entry is not None:
+            self._flush(evicted)
+            return entry[0]
+
+        # A copy evicted a moment ago may still be waiting on the writer;
+        # write it out first so the reload sees its latest state.
+        if self.writer.is_dirty(student_id):
+            self.writer.flush(student_id)
+        with get_metrics().span("profile_load"):
+            profile = self.loader(student_id, name or student_id)
+        size = self.estimate_size(profile)
+
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is not None:
+                # Another thread loaded it while we were reading from disk
+                self._entries.move_to_end(student_id)
+                return entry[0]
+            self._entries[student_id] = [profile, size, now]
+            self._bytes += size
+            evicted = self._evict(now)
+        self._flush(evicted)
+        return profile
+
+    def _evict(self, now):
+        evicted = []
+        # Oldest entries sit at the front, so idle expiry stops at the first
+        # entry that is still fresh.
+        while self._entries:
+            student_id, (profile, size, last_used) = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                if len(self._entries) == 1:
+                    break
+                self.stats["evictions"] += 1
+            elif now - last_used > self.idle_ttl:
+                self.stats["expired"] += 1
+            else:
+                break
+            del self._entries[student_id]
+            self._bytes -= size
+            evicted.append(profile)
+        return evicted
+
+    def size_change(self, event, data):
+        # Worked out from the event alone so a mutation never re-serializes
+        # the profile; a reload starts again from the measured size.
+        if event == "interest":
+            return len(json.dumps(data["interest"])) + 2
+        if event == "learning_style":
+            return len(json.dumps(data["new"])) - len(json.dumps(data["old"]))
+        if event == "interaction" and data["number"] == 1:
+            return len(json.dumps(data["date"])) - len("null")  # the first last_interaction
+        if event == "quiz":
+            return QUIZ_THEME_BYTES * data.get("new_theme", False) + MILESTONE_BYTES * data.get("leveled_up", False)
+        return 0
+
+    def on_change(self, profile, event, data):
+        change = self.size_change(event, data)
+        if not change or profile.student_id not in self._entries:
+            return
+        with self._lock:
+            entry = self._entries.get(profile.student_id)
+            if entry is None or entry[0] is not profile:
+                return
+            self._bytes += change
+            entry[1] += change
+            evicted = self._evict(time.monotonic())
+        self._flush(evicted)
+
+    def _flush(self, profiles):
+        for profile in profiles:
+            if self.writer.is_dirty(profile.student_id):
+                self.writer.flush(profile.student_id)
+
+    def expire_idle(self):
+        with self._lock:
+            evicted = self._evict(time.monotonic())
+        self._flush(evicted)
+        return len(evicted)
+
+    def __contains__(self, student_id):
+        return student_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def usage(self):
+        return {"entries": len(self._entries), "bytes": self._bytes}
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, **self.usage())
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_profile_cache():
+    # One cache per process, so its listener and metrics are registered once
+    # however many classrooms are built.
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ProfileCache()
+            get_metrics().expose_stats("profile_cache", _default_cache.stats)
+            get_metrics().expose_stats("profile_cache", _default_cache.usage, kind="gauge")
+        return _default_cache
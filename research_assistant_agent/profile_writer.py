@@ -0,0 +1,165 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from metrics import get_metrics
+
+
+def atomic_write_json(path, data, indent=2):
+    return atomic_write_bytes(path, json.dumps(data, indent=indent).encode("utf-8"))
+
+
+def atomic_write_bytes(path, payload):
+    # Write to a temp file in the same directory and rename over the target,
+    # so readers never see a half-written file.
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(payload)
+
+
+class ProfileWriter:
+    def __init__(self, flush_delay=None):
+        if flush_delay is None:
+            flush_delay = float(os.getenv('PROFILE_FLUSH_DELAY', '2.0'))
+        self.flush_delay = flush_delay
+        self._dirty = {}  # student_id -> (profile, time first marked dirty)
+        self._writing = set()  # taken off _dirty, write not finished; one per student at a time
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.stats = {"marked": 0, "coalesced": 0, "flushes": 0, "errors": 0, "bytes_written": 0}
+
+    def mark_dirty(self, profile):
+        with self._cond:
+            self.stats["marked"] += 1
+            key = profile.student_id
+            if key in self._dirty:
+                # Already queued: keep the original deadline so a busy
+                # student still gets flushed within one window.
+                self.stats["coalesced"] += 1
+                self._dirty[key] = (profile, self._dirty[key][1])
+                return
+            self._dirty[key] = (profile, time.monotonic())
+            if self._closed or self.flush_delay <= 0:
+                write_now = True
+            else:
+                write_now = False
+                self._ensure_worker()
+                self._cond.notify()
+        if write_now:
+            self.flush(key)
+
+    def is_dirty(self, student_id):
+        # Includes a write in progress: the file isn't current until it lands
+        with self._cond:
+            return student_id in self._dirty or student_id in self._writing
+
+    def _take(self, keys):
+        # Called with the lock held. Keys already being written stay dirty,
+        # so two snapshots of one profile are never written at once.
+        batch = []
+        for key in keys:
+            if key in self._dirty and key not in self._writing:
+                batch.append(self._dirty.pop(key)[0])
+                self._writing.add(key)
+        return batch
+
+    def flush(self, student_id=None):
+        if student_id is None:
+            with self._cond:
+                keys = list(self._dirty)
+            for key in keys:
+                self.flush(key)
+            return
+        with self._cond:
+            # Let a write in progress land first; anything changed since is
+            # still in _dirty and goes out after it
+            while student_id in self._writing:
+                self._cond.wait()
+            batch = self._take([student_id])
+        self._write_batch(batch)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="profile-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Dicts keep insertion order, so the first entry is the oldest.
+                _, first_marked = next(iter(self._dirty.values()))
+                wait = first_marked + self.flush_delay - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                deadline = time.monotonic() - self.flush_delay
+                ready = [key for key, (_, marked) in self._dirty.items() if marked <= deadline]
+                batch = self._take(ready)
+                if not batch:
+                    # Everything due is being written by a flush() caller
+                    self._cond.wait()
+                    continue
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        for profile in batch:
+            written, failed = 0, False
+            try:
+                with get_metrics().span("profile_save"):
+                    written = profile.flush() or 0
+            except Exception as e:
+                print(f"Error saving profile {profile.student_id}: {str(e)}")
+                failed = True
+            with self._cond:
+                key = profile.student_id
+                if failed:
+                    self.stats["errors"] += 1
+                    if not self._closed:
+                        self._dirty.setdefault(key, (profile, time.monotonic()))
+                else:
+                    self.stats["flushes"] += 1
+                    self.stats["bytes_written"] += written
+                self._writing.discard(key)
+                self._cond.notify_all()
+
+
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+
+def get_profile_writer():
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = ProfileWriter()
+            get_metrics().expose_stats("profile_writer", _default_writer.stats)
+            atexit.register(_default_writer.close)
+        return _default_writer
@@ -0,0 +1,162 @@
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+
+def normalize_answer(answer):
+    # "b", " B) " and "B" all mean option B
+    return str(answer).strip().upper().rstrip(')').strip()
+
+
+class QuizSession:
+    def __init__(self, student_id, theme, items):
+        self.student_id = student_id
+        self.theme = theme
+        self.question_ids = [item['id'] for item in items]
+        self.questions = {item['id']: item for item in items}
+        # Answer key fixed when the quiz starts, so answering is a dict lookup
+        self.answer_key = {item['id']: normalize_answer(item['correct']) for item in items}
+        self.issued_at = {}  # question id -> time it was asked
+        self.answers = {}  # question id -> (answer, correct, answered at)
+        self.position = 0
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    @property
+    def current_id(self):
+        return self.question_ids[self.position] if self.position < len(self.question_ids) else None
+
+    def ask(self):
+        question_id = self.current_id
+        if question_id is None:
+            return None
+        self.issued_at.setdefault(question_id, time.time())
+        return self.questions[question_id]
+
+    def answer(self, answer):
+        question_id = self.current_id
+        correct = normalize_answer(answer) == self.answer_key[question_id]
+        self.answers[question_id] = (answer, correct, time.time())
+        self.position += 1
+        return self.questions[question_id], correct
+
+    @property
+    def finished(self):
+        return self.position >= len(self.question_ids)
+
+    @property
+    def score(self):
+        return sum(1 for _, correct, _ in self.answers.values() if correct)
+
+
+class QuizManager:
+    def __init__(self, activities, load_student, questions_per_quiz=None, timeout=None):
+        if questions_per_quiz is None:
+            questions_per_quiz = int(os.getenv('QUIZ_QUESTIONS', '3'))
+        if timeout is None:
+            timeout = float(os.getenv('QUIZ_TIMEOUT', '1800'))
+        self.activities = activities
+        self.load_student = load_student  # student_id -> StudentProfile
+        self.questions_per_quiz = questions_per_quiz
+        self.timeout = timeout
+        # key -> QuizSession; one quiz at a time per key. The key is the
+        # student id unless the caller passes its own (the chat session's token),
+        # and results are only recorded for sessions with a student id.
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self._next_sweep = time.time() + self.timeout / 10
+
+    def start(self, student_id, theme, style=None, key=None):
+        bank = self.activities.theme_bank(theme)
+        if bank is None:
+            return None
+        # Prefer quizzes suited to the student's style, then any quiz in the theme
+        candidates = {item['id']: item for item in bank.find('quiz', None, style)}
+        if len(candidates) < self.questions_per_quiz:
+            candidates.update((item['id'], item) for item in bank.find('quiz'))
+        if not candidates:
+            return None
+        items = list(candidates.values())
+        chosen = random.sample(items, min(self.questions_per_quiz, len(items)))
+        session = QuizSession(student_id, theme, chosen)
+        self._store(key or student_id, session)
+        return session
+
+    def issue(self, student_id, item, key=None):
+        # A single quiz item handed out by !activity becomes a one-question quiz
+        session = QuizSession(student_id, item['theme'], [item])
+        self._store(key or student_id, session)
+        return session
+
+    def _store(self, key, session):
+        # Quizzes left unfinished (a closed tab, a session token never seen
+        # again) are swept now and then as new ones start
+        if time.time() >= self._next_sweep:
+            self.expire_idle()
+        with self.lock:
+            self.sessions[key] = session
+
+    def expire_idle(self):
+        now = time.time()
+        with self.lock:
+            self._next_sweep = now + self.timeout / 10
+            expired = [key for key, session in self.sessions.items() if now - session.started_at > self.timeout]
+            for key in expired:
+                del self.sessions[key]
+        return len(expired)
+
+    def get(self, key):
+        session = self.sessions.get(key)
+        if session is not None and time.time() - session.started_at > self.timeout:
+            self.end(key, session)
+            return None
+        return session
+
+    def end(self, key, session=None):
+        # With a session given, only end it if it's still the current one for key
+        with self.lock:
+            if session is not None and self.sessions.get(key) is not session:
+                return None
+            return self.sessions.pop(key, None)
+
+    def answer(self, key, answer):
+        # Returns (question, correct, session) or None without an active quiz
+        session = self.get(key)
+        if session is None:
+            return None
+        with session.lock:
+            if session.finished:
+                return None
+            question, correct = session.answer(answer)
+            finished = session.finished
+        if finished:
+            self.end(key, session)
+            if session.student_id is not None:
+                self.load_student(session.student_id).record_quiz_result(
+                    session.theme, session.score, len(session.answers))
+        return question, correct, session
+
+    def grade(self, submissions):
+        # Grades a whole class at once. submissions: iterable of
+        # (student_id, question_id, answer). Each answer is one lookup in the
+        # content bank, and each student's profile is updated once per theme.
+        results = {}
+        totals = defaultdict(lambda: [0, 0])  # (student, theme) -> [correct, answered]
+        for student_id, question_id, answer in submissions:
+            item = self.activities.get_item(question_id)
+            graded = results.setdefault(student_id, {"correct": 0, "answered": 0, "results": {}})
+            if item is None or item['type'] != 'quiz':
+                graded["results"][question_id] = None
+                continue
+            correct = normalize_answer(answer) == normalize_answer(item['correct'])
+            graded["results"][question_id] = correct
+            graded["answered"] += 1
+            graded["correct"] += correct
+            total = totals[(student_id, item['theme'])]
+            total[0] += correct
+            total[1] += 1
+        for (student_id, theme), (correct, answered) in totals.items():
+            self.load_student(student_id).record_quiz_result(theme, correct, answered)
+        return results
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from metrics import get_metrics
+
+# Classroom rooms: many students on WebSockets sharing one conversation with
+# the moderator. A room event (a burst of student messages, an activity) is
+# handled once and the result is serialized once, then handed to every
+# connection's bounded send queue. Each connection drains its own queue, so
+# a slow client only delays itself; one that falls a whole queue behind is
+# disconnected and gets the recent events replayed when it reconnects.
+
+SLOW_CONSUMER = 1013  # WebSocket close code "try again later"
+
+
+class RoomConnection:
+    def __init__(self, send, name, max_queue):
+        self.send = send
+        self.name = name
+        self.queue = asyncio.Queue(max_queue)
+        self.task = None
+        self.closed = False
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    def push(self, text):
+        # False when the client is a whole queue behind
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def run(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                await self.send({"type": "websocket.send", "text": text})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.closed = True  # the client went away mid-send
+
+    async def close(self, code=1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self.task is not None:
+            self.task.cancel()
+        try:
+            await self.send({"type": "websocket.close", "code": code})
+        except Exception:
+            pass  # already gone
+
+
+class Room:
+    def __init__(self, room_id, classroom, activities, max_students, max_queue, history_size):
+        self.room_id = room_id
+        self.classroom = classroom
+        self.activities = activities
+        self.max_students = max_students
+        self.max_queue = max_queue
+        self.connections = set()
+        self.context = deque(maxlen=history_size)  # chat messages sent to the model
+        self.recent = deque(maxlen=history_size)  # serialized events replayed on join
+        self.pending = []  # (name, message) waiting for the moderator
+        self.moderator = None
+        self.presence = None  # joins and leaves not yet announced
+        self.metrics = get_metrics()
+
+    def join(self, send, name):
+        if len(self.connections) >= self.max_students:
+            return None
+        connection = RoomConnection(send, name, self.max_queue).start()
+        connection.push(json.dumps({
+            "type": "joined",
+            "room": self.room_id,
+            "students": sorted({other.name for other in self.connections} | {name}),
+            "recent": [json.loads(text) for text in self.recent]
+        }))
+        self.connections.add(connection)
+        self.presence_changed("joined", name)
+        return connection
+
+    def leave(self, connection):
+        if connection not in self.connections:
+            return
+        self.connections.discard(connection)
+        if connection.task is not None:
+            connection.task.cancel()
+        self.presence_changed("left", connection.name)
+
+    def presence_changed(self, change, name):
+        # A whole class joining at once is one presence event, not one per
+        # student, or the joins alone would fill every send queue.
+        if self.presence is None:
+            self.presence = {"joined": [], "left": []}
+            asyncio.get_running_loop().call_soon(self.send_presence)
+        self.presence[change].append(name)
+
+    def send_presence(self):
+        presence, self.presence = self.presence, None
+        self.broadcast(dict(type="presence", **presence), remember=False)
+
+    def broadcast(self, event, remember=True):
+        text = json.dumps(event)
+        if remember:
+            self.recent.append(text)
+        slow = [connection for connection in self.connections if not connection.push(text)]
+        self.metrics.inc("room_events")
+        self.metrics.inc("room_deliveries", len(self.connections) - len(slow))
+        for connection in slow:
+            self.metrics.inc("room_slow_consumers")
+            self.connections.discard(connection)
+            asyncio.create_task(connection.close(SLOW_CONSUMER))
+
+    async def receive(self, connection, message):
+        message = message.strip()
+        if not message:
+            return
+        if message.startswith('!activity'):
+            return self.share_activity(connection, message[len('!activity'):].strip())
+        if message.startswith('!'):
+            # Commands are answered to the sender only
+            reply = self.classroom.handle_command(message)
+            connection.push(json.dumps({"type": "moderator", "text": reply, "private": True}))
+            return
+        self.broadcast({"type": "message", "from": connection.name, "text": message, "time": time.time()})
+        self.pending.append((connection.name, message))
+        if self.moderator is None or self.moderator.done():
+            self.moderator = asyncio.create_task(self.moderate())
+
+    async def moderate(self):
+        # One model call per burst: messages that arrive while a reply is
+        # being written are answered together by the next call.
+        while self.pending:
+            batch, self.pending = self.pending, []
+            prompt = "\n".join(f"{name}: {message}" for name, message in batch)
+            reply = await self.classroom.handle_message_async(prompt, list(self.context))
+            self.metrics.inc("room_model_calls")
+            self.context.append({"role": "user", "content": prompt})
+            self.context.append({"role": "assistant", "content": reply})
+            self.broadcast({"type": "moderator", "text": reply, "time": time.time()})
+
+    def share_activity(self, connection, theme):
+        theme = theme or "space"
+        activity = self.activities.pick(theme)
+        if activity is None:
+            connection.push(json.dumps({"type": "error", "text": f"Theme not found! Try {self.activities.theme_suggestions()}!"}))
+            return
+        self.context.append({"role": "assistant", "content": activity['text']})
+        self.broadcast({"type": "activity", "from": connection.name, "theme": theme, "text": activity['text']})
+
+
+class RoomManager:
+    def __init__(self, classroom, activities, max_students=None, max_queue=None, history_size=None):
+        if max_students is None:
+            max_students = int(os.getenv('ROOM_MAX_STUDENTS', '50'))
+        if max_queue is None:
+            max_queue = int(os.getenv('ROOM_SEND_QUEUE', '64'))
+        if history_size is None:
+            history_size = int(os.getenv('ROOM_HISTORY', '20'))
+        self.classroom = classroom
+        self.activities = activities
+        self.max_students = max_students
+        self.max_queue = max_queue
+        self.history_size = history_size
+        self.rooms = {}
+        get_metrics().expose_stats("rooms", self.usage, kind="gauge")
+
+    def get(self, room_id):
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room(room_id, self.classroom, self.activities,
+                                              self.max_students, self.max_queue, self.history_size)
+        return room
+
+    def leave(self, room, connection):
+        room.leave(connection)
+        if not room.connections and self.rooms.get(room.room_id) is room:
+            del self.rooms[room.room_id]
+
+    def usage(self):
+        return {"open": len(self.rooms), "students": sum(len(room.connections) for room in self.rooms.values())}
@@ -0,0 +1,327 @@
+import argparse
+import bisect
+import json
+import os
+import re
+import threading
+from datetime import date, timedelta
+from profile_writer import atomic_write_bytes, get_profile_writer
+from student_profile import StudentProfile
+
+# Inverted index over student interests and what students have said, kept
+# current from StudentProfile change events so a search never opens a
+# profile:
+#
+#   interest -> students
+#   token    -> postings (day, student, interaction number), oldest first
+#
+# On disk it is a snapshot (search_index.json) plus an append-only log of
+# changes since (search_index.json.log). Each flush appends the new records;
+# every compact_every records the log is folded into a new snapshot.
+#
+#   python search_index.py interest astronomy
+#   python search_index.py search fractions --days 7
+#   python search_index.py rebuild    # reindex every profile in one pass
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+STOPWORDS = {"a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be", "to", "of", "in", "on",
+             "at", "for", "with", "it", "its", "i", "me", "my", "you", "your", "we", "he", "she", "they",
+             "this", "that", "what", "how", "why", "who", "do", "does", "did", "can", "about", "so", "im"}
+
+
+def normalize_token(token):
+    token = token.strip("'")
+    if token.endswith("'s"):
+        token = token[:-2]
+    # "fractions" and "fraction" share postings
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def index_tokens(text):
+    tokens = {normalize_token(token) for token in TOKEN_PATTERN.findall(text.lower())}
+    return sorted(token for token in tokens if token and token not in STOPWORDS)
+
+
+def day_number(timestamp):
+    return date.fromisoformat(timestamp[:10]).toordinal()
+
+
+class SearchIndex:
+    def __init__(self, path=None, writer=None, compact_every=None):
+        if path is None:
+            path = os.getenv('SEARCH_INDEX_FILE', 'search_index.json')
+        if compact_every is None:
+            compact_every = int(os.getenv('SEARCH_INDEX_COMPACT', '5000'))
+        self.path = path
+        self.log_path = path + ".log"
+        self.writer = writer or get_profile_writer()
+        self.compact_every = compact_every
+        # Key for the profile writer; a tuple, so no username can clash with it
+        self.student_id = ("shared", "search_index")
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.load()
+
+    def reset(self):
+        self.students = []  # position -> student id; postings store positions
+        self.positions = {}
+        self.interests = {}  # interest -> set of positions
+        self.postings = {}  # token -> [(day, position, interaction number)]
+        self.pending = []  # log records not yet written
+        self.log_records = 0
+        self.log_offset = 0  # bytes of the log applied so far
+        self.generation = 0
+
+    # Updates
+
+    def _position(self, student_id):
+        position = self.positions.get(student_id)
+        if position is None:
+            position = self.positions[student_id] = len(self.students)
+            self.students.append(student_id)
+        return position
+
+    def _apply(self, record):
+        if record[0] == "i":
+            _, student_id, interest = record
+            self.interests.setdefault(interest, set()).add(self._position(student_id))
+        elif record[0] == "p":
+            _, student_id, number, day, tokens = record
+            posting = (day, self._position(student_id), number)
+            for token in tokens:
+                postings = self.postings.setdefault(token, [])
+                if postings and postings[-1] > posting:
+                    bisect.insort(postings, posting)
+                else:
+                    postings.append(posting)
+
+    def record(self, record):
+        with self.lock:
+            self._apply(record)
+            self.pending.append(record)
+        self.writer.mark_dirty(self)
+
+    def add_interest(self, student_id, interest):
+        self.record(["i", student_id, interest.strip().lower()])
+
+    def add_interaction(self, student_id, number, timestamp, text):
+        tokens = index_tokens(text or "")
+        if tokens:
+            self.record(["p", student_id, number, day_number(timestamp), tokens])
+
+    def on_change(self, profile, event, data):
+        if event == "interest":
+            self.add_interest(profile.student_id, data["interest"])
+        elif event == "interaction":
+            self.add_interaction(profile.student_id, data["number"], data["date"], data.get("input"))
+
+    # Queries
+
+    def students_with_interest(self, interest):
+        self.refresh()
+        with self.lock:
+            positions = self.interests.get(interest.strip().lower(), ())
+            return sorted(self.students[position] for position in positions)
+
+    def search(self, text, since=None, limit=50):
+        # Interactions mentioning every word of text, newest first.
+        # since: a date; only interactions on or after that day count.
+        self.refresh()
+        tokens = index_tokens(text)
+        if not tokens:
+            return []
+        first_day = since.toordinal() if since else 0
+        with self.lock:
+            lists = []
+            for token in tokens:
+                postings = self.postings.get(token)
+                if not postings:
+                    return []
+                lists.append(postings[bisect.bisect_left(postings, (first_day,)):])
+            lists.sort(key=len)
+            others = [{(position, number) for _, position, number in postings} for postings in lists[1:]]
+            matches = []
+            for day, position, number in reversed(lists[0]):
+                if all((position, number) in other for other in others):
+                    matches.append({"student_id": self.students[position], "interaction": number,
+                                    "date": date.fromordinal(day).isoformat()})
+                    if len(matches) >= limit:
+                        break
+        return matches
+
+    # Persistence
+
+    def load(self):
+        with self.lock:
+            self.reset()
+            try:
+                with open(self.path, "r") as f:
+                    snapshot = json.load(f)
+            except FileNotFoundError:
+                snapshot = None
+            except ValueError as e:
+                print(f"Error loading search index: {str(e)}")
+                snapshot = None
+            if snapshot:
+                self.generation = snapshot["generation"]
+                self.students = snapshot["students"]
+                self.positions = {student_id: position for position, student_id in enumerate(self.students)}
+                self.interests = {interest: set(positions) for interest, positions in snapshot["interests"].items()}
+                for token, flat in snapshot["postings"].items():
+                    self.postings[token] = list(zip(flat[0::3], flat[1::3], flat[2::3]))
+            self.replay_log()
+            self.loaded_signature = self.signature()
+
+    def replay_log(self):
+        # Applies the log from log_offset on. False when the log belongs to
+        # another generation than the loaded snapshot.
+        try:
+            with open(self.log_path, "rb") as f:
+                if not self.log_offset:
+                    header = f.readline()
+                    # A log from before the latest snapshot is already folded in
+                    if not header.endswith(b"\n") or json.loads(header) != ["g", self.generation]:
+                        return False
+                    self.log_offset = len(header)
+                f.seek(self.log_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn, or still being appended; read it next time
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        break
+                    self.log_offset += len(line)
+                    self.log_records += 1
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"Error loading search index log: {str(e)}")
+        return True
+
+    def signature(self):
+        snapshot = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        log = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else None
+        return snapshot, log
+
+    def refresh(self):
+        # The Flask app reads the index the classroom process writes; catch up
+        # when the files have moved on and there is nothing of ours pending.
+        # Records appended to the log are replayed from where the last read
+        # stopped; only a new snapshot (a compaction) means a full reload.
+        signature = self.signature()
+        if signature == self.loaded_signature or self.writer.is_dirty(self.student_id):
+            return
+        snapshot, log = signature
+        with self.lock:
+            appended = snapshot == self.loaded_signature[0] and (log or 0) >= self.log_offset
+            if not appended or not self.replay_log():
+                self.load()
+                return
+            self.loaded_signature = signature
+
+    def serialize(self):
+        return json.dumps({
+            "generation": self.generation,
+            "students": self.students,
+            "interests": {interest: sorted(positions) for interest, positions in self.interests.items()},
+            "postings": {token: [value for posting in postings for value in posting]
+                         for token, postings in self.postings.items()}
+        }, separators=(",", ":")).encode("utf-8")
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                records, self.pending = self.pending, []
+                compact = self.log_records + len(records) >= self.compact_every
+                if compact:
+                    self.generation += 1
+                    self.log_records = 0
+                    snapshot = self.serialize()
+                else:
+                    self.log_records += len(records)
+                generation = self.generation
+            if compact:
+                written = self.write_snapshot(snapshot, generation)
+            else:
+                payload = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+                if not os.path.exists(self.log_path):
+                    payload = json.dumps(["g", generation]) + "\n" + payload
+                with open(self.log_path, "a") as f:
+                    f.write(payload)
+                written = len(payload)
+            self.log_offset = os.path.getsize(self.log_path)
+            self.loaded_signature = self.signature()
+        return written
+
+    def write_snapshot(self, snapshot, generation):
+        written = atomic_write_bytes(self.path, snapshot)
+        header = (json.dumps(["g", generation]) + "\n").encode("utf-8")
+        return written + atomic_write_bytes(self.log_path, header)
+
+    def rebuild(self, storage):
+        # One streaming pass over every profile and its interaction log
+        with self.flush_lock:
+            with self.lock:
+                generation = self.generation + 1
+                self.reset()
+                self.generation = generation
+                for student_id in storage.list_profile_ids():
+                    profile = storage.load_profile(student_id)
+                    if profile is None:
+                        continue
+                    for interest in profile.get("interests", []):
+                        self._apply(["i", student_id, interest.strip().lower()])
+                    history = profile.get("interaction_history")
+                    interactions = history if history is not None else storage.iter_interactions(student_id)
+                    for number, interaction in enumerate(interactions, 1):
+                        tokens = index_tokens(interaction.get("input") or "")
+                        if tokens and interaction.get("date"):
+                            self._apply(["p", student_id, number, day_number(interaction["date"]), tokens])
+                snapshot = self.serialize()
+            self.write_snapshot(snapshot, generation)
+            self.log_offset = os.path.getsize(self.log_path)
+            self.loaded_signature = self.signature()
+        return len(self.students), len(self.postings)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_search_index():
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SearchIndex()
+            StudentProfile.add_listener(_default_index.on_change)
+        return _default_index
+
+
+def main():
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description="Search students by interest or by what they asked")
+    parser.add_argument("command", choices=["interest", "search", "rebuild"])
+    parser.add_argument("text", nargs="*")
+    parser.add_argument("--days", type=int, default=None, help="only interactions from the last N days")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    text = " ".join(args.text)
+    if args.command == "rebuild":
+        students, tokens = index.rebuild(get_storage())
+        print(f"Indexed {students} students and {tokens} words into {index.path}")
+    elif args.command == "interest":
+        print("\n".join(index.students_with_interest(text)) or "No students found")
+    else:
+        since = date.today() - timedelta(days=args.days) if args.days else None
+        for match in index.search(text, since, args.limit):
+            print(f"{match['date']}  {match['student_id']}  #{match['interaction']}")
+
+
+if __name__ == "__main__":
+    main()
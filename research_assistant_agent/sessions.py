@@ -0,0 +1,73 @@
+import os
+import secrets
+import threading
+import time
+
+
+class ClassroomSession:
+    # Everything that used to be process-wide state on VirtualClassroom and
+    # UserAuth, now held per connected student.
+    def __init__(self, token):
+        self.token = token
+        self.username = None  # logged-in account, if any
+        self.student_id = None  # profile this session reads and updates
+        self.quiz_theme = None  # theme picked with !theme or the last !quiz
+        self.lock = threading.RLock()
+        self.last_seen = time.monotonic()
+
+    def is_logged_in(self):
+        return self.username is not None
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+
+class SessionManager:
+    def __init__(self, idle_timeout=None):
+        if idle_timeout is None:
+            idle_timeout = float(os.getenv('SESSION_IDLE_TIMEOUT', '3600'))
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        # Only creating and removing sessions takes this lock; lookups are
+        # plain dict reads so the per-message path never contends on it.
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + self.idle_timeout
+
+    def create(self):
+        return self.get_or_create(secrets.token_urlsafe(24))
+
+    def get(self, token):
+        session = self._sessions.get(token)
+        if session is not None:
+            session.touch()
+        return session
+
+    def get_or_create(self, token):
+        session = self.get(token)
+        if session is not None:
+            return session
+        if time.monotonic() >= self._next_sweep:
+            self.expire_idle()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                session = self._sessions[token] = ClassroomSession(token)
+            return session
+
+    def end(self, token):
+        with self._lock:
+            return self._sessions.pop(token, None)
+
+    def expire_idle(self):
+        # Run now and then from get_or_create, so abandoned sessions don't pile up
+        now = time.monotonic()
+        cutoff = now - self.idle_timeout
+        with self._lock:
+            self._next_sweep = now + self.idle_timeout / 10
+            expired = [token for token, session in self._sessions.items() if session.last_seen < cutoff]
+            for token in expired:
+                del self._sessions[token]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
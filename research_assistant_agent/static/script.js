@@ -1,44 +1,134 @@
-let messageHistory = [];
-
-function appendMessage(message, isUser) {
+function createMessageElement(isUser) {
     const chatMessages = document.getElementById('chat-messages');
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${isUser ? 'user-message' : 'assistant-message'}`;
-    messageDiv.textContent = message;
     chatMessages.appendChild(messageDiv);
+    return messageDiv;
+}
+
+function scrollToBottom() {
+    const chatMessages = document.getElementById('chat-messages');
     chatMessages.scrollTop = chatMessages.scrollHeight;
-    messageHistory.push({ role: isUser ? 'user' : 'assistant', content: message });
+}
+
+function appendMessage(message, isUser) {
+    const messageDiv = createMessageElement(isUser);
+    messageDiv.textContent = message;
+    scrollToBottom();
+}
+
+function postMessage(message) {
+    return fetch('/chat', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        // The server keeps the conversation history; only the new message is sent
+        body: JSON.stringify({
+            message: message
+        })
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        if (data.error) {
+            throw new Error(data.error);
+        }
+        appendMessage(data.response, false);
+    });
+}
+
+// Renders the reply as it streams in over Server-Sent Events. Rejects with
+// error.partial = false when nothing was shown, so the caller can fall back.
+function streamMessage(message) {
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return Promise.reject(Object.assign(new Error('Streaming not supported'), { partial: false }));
+    }
+
+    let messageDiv = null;
+    let text = '';
+
+    function fail(reason) {
+        return Object.assign(new Error(reason), { partial: text.length > 0 });
+    }
+
+    function handleEvent(rawEvent) {
+        const dataLines = rawEvent.split('\n')
+            .filter(line => line.startsWith('data: '))
+            .map(line => line.slice(6));
+        if (dataLines.length === 0) {
+            return;
+        }
+        const data = JSON.parse(dataLines.join('\n'));
+        if (data.error) {
+            throw fail(data.error);
+        }
+        if (data.delta) {
+            if (!messageDiv) {
+                messageDiv = createMessageElement(false);
+            }
+            text += data.delta;
+            messageDiv.textContent = text;
+            scrollToBottom();
+        }
+    }
+
+    return fetch('/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        // The server keeps the conversation history; only the new message is sent
+        body: JSON.stringify({
+            message: message
+        })
+    })
+    .then(response => {
+        if (!response.ok || !response.body) {
+            throw fail(`HTTP error! status: ${response.status}`);
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        function read() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    if (!text) {
+                        throw fail('Empty response');
+                    }
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                events.forEach(handleEvent);
+                return read();
+            });
+        }
+        return read();
+    });
 }
 
 function sendMessage() {
     const input = document.getElementById('message-input');
     const message = input.value.trim();
-    
+
     if (message) {
         appendMessage(message, true);
         input.value = '';
-        
-        fetch('/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                message: message,
-                history: messageHistory
-            })
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .then(data => {
-            if (data.error) {
-                throw new Error(data.error);
+
+        streamMessage(message)
+        .catch(error => {
+            if (error.partial) {
+                throw error;
             }
-            appendMessage(data.response, false);
+            console.warn('Streaming failed, falling back to /chat:', error);
+            return postMessage(message);
         })
         .catch(error => {
             console.error('Error:', error);
@@ -63,4 +153,4 @@ document.getElementById('message-input').addEventListener('keypress', function(e
 // Initialize with a welcome message
 window.onload = function() {
     appendMessage('Welcome! How can I help you today?', false);
-}; 
\ No newline at end of file
+};
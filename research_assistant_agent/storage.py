@@ -0,0 +1,337 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from interaction_log import CompactionJob, InteractionLog
+from metrics import get_metrics
+from profile_writer import atomic_write_bytes, atomic_write_json
+
+
+class JSONStorage:
+    # The original flat-file layout: profiles/<id>.json, users.json and
+    # one append-only JSON-lines file per conversation.
+    def __init__(self, profiles_dir="profiles", users_file="users.json", conversations_dir="conversations"):
+        self.profiles_dir = profiles_dir
+        self.users_file = users_file
+        self.conversations_dir = conversations_dir
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        self.history = InteractionLog(os.path.join(self.profiles_dir, "history"))
+        self._users = None
+        self._users_lock = threading.Lock()
+        self._conversation_lock = threading.Lock()
+        self.bytes_written = 0
+
+    def start_background_jobs(self):
+        interval = float(os.getenv('HISTORY_COMPACT_INTERVAL', '3600'))
+        if interval > 0:
+            job = CompactionJob(self.history, interval).start()
+            atexit.register(job.stop)
+
+    # Profiles
+
+    def _profile_path(self, student_id):
+        return os.path.join(self.profiles_dir, f"{student_id}.json")
+
+    def load_profile(self, student_id):
+        try:
+            with open(self._profile_path(student_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def serialize_profile(self, profile):
+        return json.dumps(profile, indent=2)
+
+    def save_profile(self, student_id, serialized):
+        written = atomic_write_bytes(self._profile_path(student_id), serialized.encode("utf-8"))
+        self.bytes_written += written
+        return written
+
+    def list_profile_ids(self):
+        return sorted(n[:-5] for n in os.listdir(self.profiles_dir) if n.endswith(".json"))
+
+    def append_interaction(self, student_id, interaction):
+        written = self.history.append(student_id, interaction)
+        self.bytes_written += written
+        return written
+
+    def has_interactions(self, student_id):
+        return self.history.has_history(student_id)
+
+    def iter_interactions(self, student_id):
+        return self.history.read(student_id)
+
+    def recent_interactions(self, student_id, limit):
+        return self.history.recent(student_id, limit)
+
+    # Users
+
+    def _load_users(self):
+        if self._users is None:
+            try:
+                with open(self.users_file, "r") as f:
+                    self._users = json.load(f)
+            except FileNotFoundError:
+                self._users = {}
+        return self._users
+
+    def get_user(self, username):
+        with self._users_lock:
+            user = self._load_users().get(username)
+            return dict(user) if user is not None else None
+
+    def save_user(self, username, user):
+        with self._users_lock:
+            users = self._load_users()
+            users[username] = dict(user)
+            self.bytes_written += atomic_write_json(self.users_file, users)
+
+    def list_users(self):
+        with self._users_lock:
+            return dict(self._load_users())
+
+    # Conversations
+
+    def _conversation_path(self, conversation_id):
+        return os.path.join(self.conversations_dir, f"{conversation_id}.jsonl")
+
+    def append_message(self, conversation_id, role, content, timestamp=None):
+        message = {
+            "role": role,
+            "content": content,
+            "timestamp": timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        line = json.dumps(message) + "\n"
+        with self._conversation_lock:
+            os.makedirs(self.conversations_dir, exist_ok=True)
+            with open(self._conversation_path(conversation_id), "a") as f:
+                f.write(line)
+        self.bytes_written += len(line)
+        return message
+
+    def load_messages(self, conversation_id, limit=None):
+        try:
+            with open(self._conversation_path(conversation_id), "r") as f:
+                lines = deque(f, maxlen=limit) if limit else f.readlines()
+        except FileNotFoundError:
+            return []
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def count_messages(self, conversation_id):
+        try:
+            with open(self._conversation_path(conversation_id), "r") as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def _summary_path(self, conversation_id):
+        return os.path.join(self.conversations_dir, f"{conversation_id}.summary.json")
+
+    def load_summary(self, conversation_id):
+        try:
+            with open(self._summary_path(conversation_id), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_summary(self, conversation_id, summary):
+        os.makedirs(self.conversations_dir, exist_ok=True)
+        self.bytes_written += atomic_write_json(self._summary_path(conversation_id), summary)
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS profiles (
+        student_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS interactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id TEXT NOT NULL,
+        date TEXT,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_interactions_student ON interactions (student_id, id);
+    CREATE INDEX IF NOT EXISTS idx_interactions_date ON interactions (date);
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        email TEXT,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id);
+    CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp);
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        conversation_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """
+
+    # Statements are kept as constants so sqlite3's per-connection statement
+    # cache reuses the prepared form on every call.
+    UPSERT_PROFILE = ("INSERT INTO profiles (student_id, data, updated_at) VALUES (?, ?, ?) "
+                      "ON CONFLICT(student_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at")
+    SELECT_PROFILE = "SELECT data FROM profiles WHERE student_id = ?"
+    SELECT_PROFILE_IDS = "SELECT student_id FROM profiles ORDER BY student_id"
+    INSERT_INTERACTION = "INSERT INTO interactions (student_id, date, data) VALUES (?, ?, ?)"
+    HAS_INTERACTIONS = "SELECT 1 FROM interactions WHERE student_id = ? LIMIT 1"
+    SELECT_INTERACTIONS = "SELECT data FROM interactions WHERE student_id = ? ORDER BY id"
+    SELECT_RECENT_INTERACTIONS = "SELECT data FROM interactions WHERE student_id = ? ORDER BY id DESC LIMIT ?"
+    UPSERT_USER = ("INSERT INTO users (username, email, data) VALUES (?, ?, ?) "
+                   "ON CONFLICT(username) DO UPDATE SET email = excluded.email, data = excluded.data")
+    SELECT_USER = "SELECT data FROM users WHERE username = ?"
+    SELECT_USERS = "SELECT username, data FROM users"
+    INSERT_MESSAGE = "INSERT INTO messages (conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?)"
+    SELECT_MESSAGES = "SELECT role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY id"
+    SELECT_RECENT_MESSAGES = ("SELECT role, content, timestamp FROM messages WHERE conversation_id = ? "
+                              "ORDER BY id DESC LIMIT ?")
+    COUNT_MESSAGES = "SELECT COUNT(*) FROM messages WHERE conversation_id = ?"
+    UPSERT_SUMMARY = ("INSERT INTO conversation_summaries (conversation_id, data, updated_at) VALUES (?, ?, ?) "
+                      "ON CONFLICT(conversation_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at")
+    SELECT_SUMMARY = "SELECT data FROM conversation_summaries WHERE conversation_id = ?"
+
+    def __init__(self, path="virtual_classroom.db"):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.bytes_written = 0
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def start_background_jobs(self):
+        pass
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # One connection per thread; WAL lets readers run alongside the writer.
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self, sql, params):
+        with self._connection() as conn:
+            conn.execute(sql, params)
+        self.bytes_written += sum(len(p) for p in params if isinstance(p, str))
+
+    # Profiles
+
+    def load_profile(self, student_id):
+        row = self._connection().execute(self.SELECT_PROFILE, (student_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def serialize_profile(self, profile):
+        return json.dumps(profile, separators=(",", ":"))
+
+    def save_profile(self, student_id, serialized):
+        self._write(self.UPSERT_PROFILE, (student_id, serialized, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        return len(serialized)
+
+    def list_profile_ids(self):
+        return [row[0] for row in self._connection().execute(self.SELECT_PROFILE_IDS)]
+
+    def append_interaction(self, student_id, interaction):
+        data = json.dumps(interaction)
+        self._write(self.INSERT_INTERACTION, (student_id, interaction.get("date"), data))
+        return len(data)
+
+    def has_interactions(self, student_id):
+        return self._connection().execute(self.HAS_INTERACTIONS, (student_id,)).fetchone() is not None
+
+    def iter_interactions(self, student_id):
+        for row in self._connection().execute(self.SELECT_INTERACTIONS, (student_id,)):
+            yield json.loads(row[0])
+
+    def recent_interactions(self, student_id, limit):
+        rows = self._connection().execute(self.SELECT_RECENT_INTERACTIONS, (student_id, limit)).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    # Users
+
+    def get_user(self, username):
+        row = self._connection().execute(self.SELECT_USER, (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_user(self, username, user):
+        self._write(self.UPSERT_USER, (username, user.get("email"), json.dumps(user)))
+
+    def list_users(self):
+        return {username: json.loads(data) for username, data in self._connection().execute(self.SELECT_USERS)}
+
+    # Conversations
+
+    def append_message(self, conversation_id, role, content, timestamp=None):
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._write(self.INSERT_MESSAGE, (conversation_id, role, content, timestamp))
+        return {"role": role, "content": content, "timestamp": timestamp}
+
+    def load_messages(self, conversation_id, limit=None):
+        conn = self._connection()
+        if limit:
+            rows = conn.execute(self.SELECT_RECENT_MESSAGES, (conversation_id, limit)).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(self.SELECT_MESSAGES, (conversation_id,)).fetchall()
+        return [{"role": role, "content": content, "timestamp": timestamp} for role, content, timestamp in rows]
+
+    def count_messages(self, conversation_id):
+        return self._connection().execute(self.COUNT_MESSAGES, (conversation_id,)).fetchone()[0]
+
+    def load_summary(self, conversation_id):
+        row = self._connection().execute(self.SELECT_SUMMARY, (conversation_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_summary(self, conversation_id, summary):
+        self._write(self.UPSERT_SUMMARY, (conversation_id, json.dumps(summary),
+                                          datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+_default_storage = None
+_default_storage_lock = threading.Lock()
+
+
+def create_storage(backend=None):
+    backend = backend or os.getenv('STORAGE_BACKEND', 'json')
+    if backend == 'sqlite':
+        return SQLiteStorage(os.getenv('STORAGE_DATABASE', 'virtual_classroom.db'))
+    if backend == 'json':
+        return JSONStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def get_storage():
+    global _default_storage
+    with _default_storage_lock:
+        if _default_storage is None:
+            _default_storage = create_storage()
+            _default_storage.start_background_jobs()
+            storage = _default_storage
+            get_metrics().expose_stats("storage", lambda: {"bytes_written": storage.bytes_written})
+        return _default_storage
@@ -1,21 +1,49 @@
-import json
-import os
+import threading
 from datetime import datetime
+from profile_writer import get_profile_writer
+from storage import get_storage
 
 class StudentProfile:
-    def __init__(self, student_id, name):
+    # Callables listener(profile, event, data) told about every mutation,
+    # e.g. the classroom analytics. Called outside the profile lock.
+    listeners = []
+
+    def __init__(self, student_id, name, writer=None, storage=None):
         self.student_id = student_id
         self.name = name
-        # Create profiles directory if it doesn't exist
-        os.makedirs("profiles", exist_ok=True)
+        self.writer = writer or get_profile_writer()
+        self.storage = storage or get_storage()
+        # Guards self.profile while the background writer serializes it
+        self.lock = threading.RLock()
+        self.created = False
         self.profile = self.load_or_create_profile()
+        self.migrate_interaction_history()
+        if self.created:
+            # Saved right away so a reload doesn't count the student twice
+            self.save_profile()
+            self.notify("created")
+
+    @classmethod
+    def add_listener(cls, listener):
+        if listener not in cls.listeners:
+            cls.listeners.append(listener)
+
+    @classmethod
+    def remove_listener(cls, listener):
+        if listener in cls.listeners:
+            cls.listeners.remove(listener)
+
+    def notify(self, event, **data):
+        for listener in self.listeners:
+            try:
+                listener(self, event, data)
+            except Exception as e:
+                print(f"Error notifying profile listener: {str(e)}")
 
     def load_or_create_profile(self):
-        profile_path = f"profiles/{self.student_id}.json"
-        try:
-            with open(profile_path, "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
+        profile = self.storage.load_profile(self.student_id)
+        if profile is None:
+            self.created = True
             return {
                 "student_id": self.student_id,
                 "name": self.name,
@@ -29,41 +57,116 @@ class StudentProfile:
                     "math": {"level": 1, "milestones": []},
                     "language": {"level": 1, "milestones": []}
                 },
-                "interaction_history": [],
+                "interaction_summary": self.empty_interaction_summary(),
                 "chat_settings": {
                     "language": "en",
                     "grammar_corrections": True,
                     "suggestions": True
                 }
             }
+        return profile
+
+    def empty_interaction_summary(self):
+        return {
+            "count": 0,
+            "last_interaction": None,
+            "engagement": {"high": 0, "medium": 0, "low": 0}
+        }
+
+    def migrate_interaction_history(self):
+        # Older profiles embed the whole history; move it to the append-only
+        # log once and keep only the summary in the profile document.
+        history = self.profile.pop("interaction_history", None)
+        if history is None:
+            self.profile.setdefault("interaction_summary", self.empty_interaction_summary())
+            return
+        summary = self.empty_interaction_summary()
+        for interaction in history:
+            self._count_interaction(summary, interaction)
+        self.profile["interaction_summary"] = summary
+        if history and not self.storage.has_interactions(self.student_id):
+            for interaction in history:
+                self.storage.append_interaction(self.student_id, interaction)
+        self.save_profile()
+
+    def _count_interaction(self, summary, interaction):
+        summary["count"] += 1
+        summary["last_interaction"] = interaction.get("date")
+        engagement = interaction.get("engagement")
+        summary["engagement"][engagement] = summary["engagement"].get(engagement, 0) + 1
 
     def save_profile(self):
-        profile_path = f"profiles/{self.student_id}.json"
-        with open(profile_path, "w") as f:
-            json.dump(self.profile, f, indent=2)
+        # Mutations only mark the profile dirty; the shared writer coalesces
+        # them and writes the file once per flush window.
+        self.writer.mark_dirty(self)
+
+    def flush(self):
+        with self.lock:
+            serialized = self.storage.serialize_profile(self.profile)
+        return self.storage.save_profile(self.student_id, serialized)
 
-    def add_interaction(self, message, response, engagement="medium"):
+    def add_interaction(self, message, response, engagement="medium", style=None, interests=None, analyzed_by=None):
         interaction = {
             "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "input": message,
             "response": response,
             "engagement": engagement
         }
-        self.profile["interaction_history"].append(interaction)
+        # Per-message analysis labels; the local classifier trains on these
+        if analyzed_by:
+            interaction.update(style=style, interests=interests or [], analyzed_by=analyzed_by)
+        # Constant-cost append; the profile itself only keeps counters.
+        self.storage.append_interaction(self.student_id, interaction)
+        with self.lock:
+            self._count_interaction(self.profile["interaction_summary"], interaction)
+            number = self.profile["interaction_summary"]["count"]
         self.save_profile()
+        # number is the interaction's 1-based position in the student's log
+        self.notify("interaction", date=interaction["date"], engagement=engagement, input=message, number=number)
+
+    def get_interaction_history(self, limit=None):
+        if limit:
+            return self.storage.recent_interactions(self.student_id, limit)
+        return list(self.storage.iter_interactions(self.student_id))
 
     def update_learning_style(self, primary, secondary, confidence):
-        self.profile["learning_style"] = {
-            "primary": primary,
-            "secondary": secondary,
-            "confidence": confidence
-        }
+        with self.lock:
+            old = self.profile["learning_style"].get("primary")
+            self.profile["learning_style"] = {
+                "primary": primary,
+                "secondary": secondary,
+                "confidence": confidence
+            }
         self.save_profile()
+        self.notify("learning_style", old=old, new=primary)
 
     def add_interest(self, interest):
-        if interest not in self.profile["interests"]:
+        with self.lock:
+            if interest in self.profile["interests"]:
+                return
             self.profile["interests"].append(interest)
-            self.save_profile()
+        self.save_profile()
+        self.notify("interest", interest=interest)
+
+    def record_quiz_result(self, theme, correct, answered, level_step=5):
+        # Quiz scores count toward a per-theme progress entry shaped like the
+        # subject ones; every level_step correct answers is a new level.
+        with self.lock:
+            new_theme = theme not in self.profile["progress"]
+            progress = self.profile["progress"].setdefault(theme, {"level": 1, "milestones": []})
+            progress["answered"] = progress.get("answered", 0) + answered
+            progress["correct"] = progress.get("correct", 0) + correct
+            level = 1 + progress["correct"] // level_step
+            leveled_up = level > progress["level"]
+            if leveled_up:
+                progress["level"] = level
+                progress["milestones"].append({
+                    "level": level,
+                    "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                })
+        self.save_profile()
+        self.notify("quiz", theme=theme, correct=correct, answered=answered, new_theme=new_theme,
+                    leveled_up=leveled_up)
 
     def get_profile_summary(self):
         return {
@@ -0,0 +1,263 @@
+import argparse
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from metrics import get_metrics
+from profile_writer import atomic_write_json
+
+# A CPU-only fast path for the STYLE|INTERESTS|ENGAGEMENT analysis. A keyword
+# lexicon gives evidence for each learning style, a naive Bayes model trained
+# on past interactions adds word statistics, and only messages whose style
+# is still uncertain go to the LLM.
+#
+#   python style_classifier.py train
+#   python style_classifier.py evaluate --holdout 0.2
+
+TOKEN_PATTERN = re.compile(r"[a-z']+")
+
+STYLE_LEXICON = {
+    "visual": {"see", "look", "looks", "draw", "drawing", "picture", "pictures", "color", "colors", "colour",
+               "show", "watch", "video", "diagram", "map", "paint", "painting", "image", "photo", "read"},
+    "auditory": {"hear", "listen", "sing", "song", "songs", "sound", "sounds", "music", "tell", "talk",
+                 "say", "story", "stories", "rhyme", "loud", "voice", "podcast", "explain"},
+    "kinesthetic": {"build", "built", "make", "made", "touch", "move", "experiment", "play", "try", "do",
+                    "run", "dance", "craft", "hands", "jump", "cook", "lego", "act", "game", "games"}
+}
+
+INTEREST_LEXICON = {
+    "space": {"space", "planet", "planets", "star", "stars", "moon", "sun", "rocket", "astronaut", "galaxy",
+              "mars", "saturn", "jupiter", "orbit", "astronomy"},
+    "animals": {"animal", "animals", "dog", "dogs", "cat", "cats", "lion", "cheetah", "bird", "birds", "fish",
+                "shark", "elephant", "horse", "pet", "pets"},
+    "dinosaurs": {"dinosaur", "dinosaurs", "rex", "fossil", "fossils", "jurassic"},
+    "science": {"science", "experiment", "chemistry", "physics", "volcano", "volcanoes", "magnet", "atom",
+                "electricity", "weather"},
+    "math": {"math", "maths", "fraction", "fractions", "number", "numbers", "add", "subtract", "multiply",
+             "divide", "geometry", "shapes"},
+    "music": {"music", "song", "songs", "sing", "piano", "guitar", "drum", "drums"},
+    "robots": {"robot", "robots", "coding", "code", "computer", "computers", "program"},
+    "art": {"art", "draw", "drawing", "paint", "painting", "color", "colors"},
+    "sports": {"soccer", "football", "basketball", "sport", "sports", "swim", "swimming"}
+}
+
+LOW_ENGAGEMENT = {"boring", "bored", "idk", "whatever", "meh", "dunno", "stop", "tired"}
+HIGH_ENGAGEMENT = {"love", "awesome", "cool", "wow", "amazing", "favorite", "favourite", "fun", "excited"}
+
+# Each lexicon hit multiplies a style's odds by this much
+LEXICON_WEIGHT = math.log(4)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class NaiveBayes:
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.class_counts = Counter()
+        self.token_counts = {}  # label -> Counter
+        self.totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, documents, labels):
+        for tokens, label in zip(documents, labels):
+            self.class_counts[label] += 1
+            counts = self.token_counts.setdefault(label, Counter())
+            counts.update(tokens)
+            self.totals[label] += len(tokens)
+            self.vocabulary.update(tokens)
+        return self
+
+    def log_scores(self, tokens):
+        documents = sum(self.class_counts.values())
+        vocabulary = len(self.vocabulary) or 1
+        scores = {}
+        for label, count in self.class_counts.items():
+            counts = self.token_counts[label]
+            denominator = self.totals[label] + self.alpha * vocabulary
+            score = math.log(count / documents)
+            for token in tokens:
+                if token in self.vocabulary:
+                    score += math.log((counts[token] + self.alpha) / denominator)
+            scores[label] = score
+        return scores
+
+    def to_dict(self):
+        return {
+            "alpha": self.alpha,
+            "class_counts": dict(self.class_counts),
+            "token_counts": {label: dict(counts) for label, counts in self.token_counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(data.get("alpha", 1.0))
+        model.class_counts = Counter(data["class_counts"])
+        for label, counts in data["token_counts"].items():
+            model.token_counts[label] = Counter(counts)
+            model.totals[label] = sum(counts.values())
+            model.vocabulary.update(counts)
+        return model
+
+
+def softmax(scores):
+    top = max(scores.values())
+    weights = {label: math.exp(score - top) for label, score in scores.items()}
+    total = sum(weights.values())
+    return {label: weight / total for label, weight in weights.items()}
+
+
+class StyleClassifier:
+    def __init__(self, model_path=None, threshold=None):
+        if model_path is None:
+            model_path = os.getenv('STYLE_MODEL_PATH', 'style_model.json')
+        if threshold is None:
+            threshold = float(os.getenv('STYLE_CLASSIFIER_THRESHOLD', '0.8'))
+        self.model_path = model_path
+        self.threshold = threshold
+        self.style_model = None
+        self.engagement_model = None
+        self.stats = {"local": 0, "escalated": 0}
+        get_metrics().expose_stats("style_classifier", self.stats)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.model_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            print(f"Error loading style model: {str(e)}")
+            return False
+        self.style_model = NaiveBayes.from_dict(data["style"]) if data.get("style") else None
+        self.engagement_model = NaiveBayes.from_dict(data["engagement"]) if data.get("engagement") else None
+        return True
+
+    def save(self):
+        atomic_write_json(self.model_path, {
+            "style": self.style_model.to_dict() if self.style_model else None,
+            "engagement": self.engagement_model.to_dict() if self.engagement_model else None
+        }, indent=None)
+
+    def classify(self, message):
+        # Returns ((style, interests, engagement), style confidence)
+        tokens = tokenize(message)
+        scores = self.style_model.log_scores(tokens) if self.style_model else {}
+        hits = {style: sum(token in words for token in tokens) for style, words in STYLE_LEXICON.items()}
+        for style in STYLE_LEXICON:
+            scores[style] = scores.get(style, 0.0) + hits[style] * LEXICON_WEIGHT
+        if not self.style_model and not any(hits.values()):
+            style, confidence = "", 0.0
+        else:
+            probabilities = softmax(scores)
+            style = max(probabilities, key=probabilities.get)
+            confidence = probabilities[style]
+
+        interests = [topic for topic, words in INTEREST_LEXICON.items() if any(token in words for token in tokens)]
+        return (style, interests, self.engagement(message, tokens)), confidence
+
+    def engagement(self, message, tokens):
+        if self.engagement_model:
+            probabilities = softmax(self.engagement_model.log_scores(tokens))
+            return max(probabilities, key=probabilities.get)
+        if any(token in LOW_ENGAGEMENT for token in tokens) or len(tokens) < 3:
+            return "low"
+        if "!" in message or len(tokens) > 12 or any(token in HIGH_ENGAGEMENT for token in tokens):
+            return "high"
+        return "medium"
+
+    def analyze(self, message):
+        # The analysis when the local answer is confident, otherwise None
+        analysis, confidence = self.classify(message)
+        if confidence >= self.threshold:
+            self.stats["local"] += 1
+            return analysis
+        self.stats["escalated"] += 1
+        return None
+
+    def train(self, examples):
+        # examples: (message, style or None, engagement or None)
+        style_docs, style_labels, engagement_docs, engagement_labels = [], [], [], []
+        for message, style, engagement in examples:
+            tokens = tokenize(message)
+            if style in STYLE_LEXICON:
+                style_docs.append(tokens)
+                style_labels.append(style)
+            if engagement in ("high", "medium", "low"):
+                engagement_docs.append(tokens)
+                engagement_labels.append(engagement)
+        self.style_model = NaiveBayes().fit(style_docs, style_labels) if style_docs else None
+        self.engagement_model = NaiveBayes().fit(engagement_docs, engagement_labels) if engagement_docs else None
+        return len(style_docs), len(engagement_docs)
+
+
+def training_examples(storage):
+    # One streaming pass over every student's history. Interactions analysed
+    # by the LLM carry their own style label; older ones fall back to the
+    # student's overall style. Local guesses are skipped so the model never
+    # learns from itself.
+    for student_id in storage.list_profile_ids():
+        profile = storage.load_profile(student_id) or {}
+        profile_style = (profile.get("learning_style") or {}).get("primary")
+        for interaction in storage.iter_interactions(student_id):
+            if interaction.get("analyzed_by") == "local" or not interaction.get("input"):
+                continue
+            style = interaction.get("style") or profile_style
+            yield interaction["input"], style, interaction.get("engagement")
+
+
+def in_holdout(message, holdout):
+    # Stable split, so train and evaluate agree on which examples are held out
+    return zlib.crc32(message.encode("utf-8")) % 1000 < holdout * 1000
+
+
+def evaluate(classifier, examples):
+    total = confident = style_correct = confident_correct = engagement_correct = 0
+    for message, style, engagement in examples:
+        (predicted_style, _, predicted_engagement), confidence = classifier.classify(message)
+        total += 1
+        style_correct += predicted_style == style
+        engagement_correct += predicted_engagement == engagement
+        if confidence >= classifier.threshold:
+            confident += 1
+            confident_correct += predicted_style == style
+    return {
+        "examples": total,
+        "style_accuracy": round(style_correct / total, 3) if total else 0.0,
+        "engagement_accuracy": round(engagement_correct / total, 3) if total else 0.0,
+        "local_coverage": round(confident / total, 3) if total else 0.0,
+        "local_style_accuracy": round(confident_correct / confident, 3) if confident else 0.0
+    }
+
+
+def main():
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description="Train or evaluate the local learning-style classifier")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--model", default=None, help="model file (default: STYLE_MODEL_PATH)")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of examples held out for evaluate")
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args()
+
+    classifier = StyleClassifier(args.model, args.threshold)
+    storage = get_storage()
+    if args.command == "train":
+        styles, engagements = classifier.train(training_examples(storage))
+        classifier.save()
+        print(f"Trained on {styles} style and {engagements} engagement examples; saved to {classifier.model_path}")
+        return
+
+    examples = list(training_examples(storage))
+    classifier.train(example for example in examples if not in_holdout(example[0], args.holdout))
+    held_out = [example for example in examples if in_holdout(example[0], args.holdout) and example[1]]
+    for name, value in evaluate(classifier, held_out).items():
+        print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
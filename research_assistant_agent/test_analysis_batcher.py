@@ -0,0 +1,105 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from analysis_batcher import AnalysisBatcher
+
+
+class FakeClient:
+    # Answers each batch with one result per numbered message, newest first,
+    # taking the style from the message text
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+        self.chat = self.completions = self
+
+    def create(self, **kwargs):
+        messages = [json.loads(m) for m in re.findall(r"^\s*\d+\. (\".*\")$", kwargs["messages"][0]["content"], re.M)]
+        self.batches.append(messages)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        results = [{"id": number, "style": message.split()[0], "interests": message.split()[1:],
+                    "engagement": "High"} for number, message in enumerate(messages, 1)]
+        content = json.dumps({"results": list(reversed(results))})
+        return type("Response", (), {"choices": [
+            type("Choice", (), {"message": type("Message", (), {"content": content})})]})
+
+
+@pytest.fixture
+def pool():
+    pool = ThreadPoolExecutor(max_workers=2)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def collect(results, message):
+    landed = threading.Event()
+
+    def callback(analysis):
+        results[message] = analysis
+        landed.set()
+    return callback, landed
+
+
+def test_full_batch_goes_out_without_waiting(pool):
+    client = FakeClient()
+    batcher = AnalysisBatcher(client, pool, batch_size=3, max_wait=60)
+    results = {}
+    try:
+        events = []
+        for message in ["Visual planets stars", "Auditory music", "Kinesthetic lego", "Visual maps"]:
+            callback, landed = collect(results, message)
+            batcher.submit(message, callback)
+            events.append(landed)
+        assert all(landed.wait(5) for landed in events[:3])
+        assert not events[3].is_set()
+        # Each result reaches the callback of its own message, whatever the order
+        assert results == {
+            "Visual planets stars": ("visual", ["planets", "stars"], "high"),
+            "Auditory music": ("auditory", ["music"], "high"),
+            "Kinesthetic lego": ("kinesthetic", ["lego"], "high")}
+        assert batcher.flush(timeout=5)
+        assert [len(batch) for batch in client.batches] == [3, 1]
+        assert batcher.stats == {"messages": 4, "batches": 2, "errors": 0}
+    finally:
+        batcher.close()
+
+
+def test_partial_batch_goes_out_after_max_wait(pool):
+    client = FakeClient()
+    batcher = AnalysisBatcher(client, pool, batch_size=10, max_wait=0.1)
+    results = {}
+    try:
+        started = time.monotonic()
+        events = []
+        for message in ["Visual planets", "Auditory songs"]:
+            callback, landed = collect(results, message)
+            batcher.submit(message, callback)
+            events.append(landed)
+        assert all(landed.wait(5) for landed in events)
+        assert time.monotonic() - started >= 0.1
+        assert client.batches == [["Visual planets", "Auditory songs"]]
+    finally:
+        batcher.close()
+
+
+def test_failed_batch_hands_none_to_every_callback(pool):
+    client = FakeClient()
+    client.fail = True
+    batcher = AnalysisBatcher(client, pool, batch_size=2, max_wait=60)
+    results = {}
+    batcher.submit("Visual planets", collect(results, "Visual planets")[0])
+    batcher.submit("Auditory songs", collect(results, "Auditory songs")[0])
+    assert batcher.flush(timeout=5)
+    assert results == {"Visual planets": None, "Auditory songs": None}
+    assert batcher.stats["errors"] == 1
+
+    # Closing sends what is still queued, then refuses more
+    client.fail = False
+    batcher.submit("Visual maps", collect(results, "Visual maps")[0])
+    batcher.close()
+    assert results["Visual maps"] == ("visual", ["maps"], "high")
+    with pytest.raises(RuntimeError):
+        batcher.submit("Visual maps", lambda analysis: None)
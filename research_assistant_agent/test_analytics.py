@@ -0,0 +1,53 @@
+from analytics import ClassAnalytics
+from profile_writer import ProfileWriter
+from storage import JSONStorage
+from student_profile import StudentProfile
+
+
+def test_incremental_matches_rebuild(tmp_path):
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    writer = ProfileWriter(flush_delay=60)
+    analytics = ClassAnalytics(str(tmp_path / "analytics.json"), writer)
+    StudentProfile.add_listener(analytics.on_change)
+    try:
+        amy = StudentProfile("amy", "Amy", writer, storage)
+        amy.add_interaction("planets!", "yes", "high")
+        amy.update_learning_style("visual", None, 0.9)
+        amy.update_learning_style("auditory", None, 0.9)
+        amy.add_interest("space")
+        amy.record_quiz_result("space", 2, 3)
+        bob = StudentProfile("bob", "Bob", writer, storage)
+        bob.add_interaction("meh", "ok", "low")
+        bob.update_learning_style("auditory", None, 0.9)
+        bob.add_interest("space")
+        writer.flush()
+    finally:
+        StudentProfile.remove_listener(analytics.on_change)
+
+    report = analytics.report()
+    assert report["students"] == 2 and report["interactions"] == 2
+    assert report["engagement"] == {"high": 1, "low": 1}
+    assert report["learning_styles"] == {"auditory": 2}
+    assert report["top_interests"] == [("space", 2)]
+    assert report["quizzes"] == {"answered": 3, "correct": 2}
+
+    incremental = {key: value for key, value in analytics.data.items() if key != "updated"}
+    rebuilt = analytics.rebuild(storage)
+    assert {key: value for key, value in rebuilt.items() if key != "updated"} == incremental
+    assert ClassAnalytics(str(tmp_path / "analytics.json"), writer).report()["students"] == 2
+
+
+def test_a_student_named_like_the_writer_key_is_kept_apart(tmp_path):
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    writer = ProfileWriter(flush_delay=60)
+    analytics = ClassAnalytics(str(tmp_path / "analytics.json"), writer)
+    StudentProfile.add_listener(analytics.on_change)
+    try:
+        for name in ["__analytics__", "shared", "analytics"]:
+            StudentProfile(name, name, writer, storage).add_interest("space")
+        writer.flush()
+    finally:
+        StudentProfile.remove_listener(analytics.on_change)
+    # Both the profile and the shared aggregates were written
+    assert storage.load_profile("__analytics__")["interests"] == ["space"]
+    assert ClassAnalytics(str(tmp_path / "analytics.json"), writer).report()["students"] == 3
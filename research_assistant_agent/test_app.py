@@ -0,0 +1,36 @@
+import importlib
+
+
+def load_app(tmp_path, monkeypatch, teachers=""):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('GOOGLE_CLIENT_ID', 'test')
+    monkeypatch.setenv('GOOGLE_CLIENT_SECRET', 'test')
+    monkeypatch.setenv('TEACHER_EMAILS', teachers)
+    monkeypatch.setenv('ANALYTICS_FILE', str(tmp_path / "analytics.json"))
+    monkeypatch.setenv('SEARCH_INDEX_FILE', str(tmp_path / "search_index.json"))
+    monkeypatch.chdir(tmp_path)
+    import app
+    return importlib.reload(app).app.test_client()
+
+
+def log_in(client, email):
+    with client.session_transaction() as session:
+        session['google_token'] = ('token', '')
+        session['user_email'] = email
+
+
+def test_analytics_needs_a_teacher(tmp_path, monkeypatch):
+    client = load_app(tmp_path, monkeypatch, teachers="Teacher@example.com")
+    assert client.get('/analytics').status_code == 401
+    log_in(client, "student@example.com")
+    assert client.get('/analytics').status_code == 403
+    log_in(client, "teacher@example.com")
+    assert client.get('/analytics').status_code == 200
+
+
+def test_search_needs_a_login(tmp_path, monkeypatch):
+    client = load_app(tmp_path, monkeypatch)
+    assert client.get('/search?interest=space').status_code == 401
+    assert client.get('/search?q=planets').status_code == 401
+    log_in(client, "anyone@example.com")
+    assert client.get('/search?interest=space').json == {'interest': 'space', 'students': []}
@@ -0,0 +1,19 @@
+from commands import CommandRouter
+
+
+def test_router_parses_typed_args_once():
+    calls = []
+    router = (CommandRouter(lambda command: f"Unknown command: {command}")
+              .add("!help", response="help text")
+              .add("!register", lambda session, **args: calls.append((session, args)) or "ok",
+                   "account password name... email")
+              .add("!level", lambda session, level, theme=None: (level, theme), "level:int theme?"))
+
+    assert router.dispatch("!help me please", "s") == "help text"
+    assert router.dispatch("!nope", "s") == "Unknown command: !nope"
+    assert router.dispatch("!register amy pw Amy Lee amy@example.com", "s") == "ok"
+    assert calls == [("s", {"account": "amy", "password": "pw", "name": "Amy Lee", "email": "amy@example.com"})]
+    assert router.dispatch("!register amy pw", "s") == "Usage: !register [account] [password] [name] [email]"
+    assert router.dispatch("!level 3", "s") == (3, None)
+    assert router.dispatch("!level 3 space extra", "s") == (3, "space")
+    assert router.dispatch("!level three", "s").startswith("Usage: !level")
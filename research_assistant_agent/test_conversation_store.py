@@ -0,0 +1,37 @@
+import os
+from conversation_store import ConversationStore
+from storage import JSONStorage, SQLiteStorage
+
+
+def summarize(previous, dropped):
+    return " ".join(([previous] if previous else []) + [m["content"] for m in dropped])
+
+
+def check_summary_survives_reload(storage):
+    store = ConversationStore(storage, token_budget=40, summarizer=summarize)
+    for number in range(12):
+        store.append("amy", "user", f"message {number:02d} " + "x" * 20)
+    store._summary_pool.submit(lambda: None).result()  # wait for the summaries
+    before = store.context("amy")
+
+    # A fresh store (as after a restart or eviction) picks the summary back up
+    reloaded = ConversationStore(storage, token_budget=40, summarizer=summarize)
+    after = reloaded.context("amy")
+    reloaded._summary_pool.submit(lambda: None).result()
+    assert after == before
+    assert after[0]["role"] == "system"
+    summary = reloaded.context("amy")[0]["content"]
+    assert [summary.count(f"message {number:02d}") for number in range(12)] == [1] * 9 + [0] * 3
+
+
+def test_summary_saved_with_json_storage(tmp_path):
+    check_summary_survives_reload(JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"),
+                                              str(tmp_path / "conversations")))
+
+
+def test_summary_saved_with_sqlite_storage(tmp_path):
+    storage = SQLiteStorage(os.path.join(str(tmp_path), "classroom.db"))
+    try:
+        check_summary_survives_reload(storage)
+    finally:
+        storage.close()
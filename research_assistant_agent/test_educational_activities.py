@@ -0,0 +1,50 @@
+import json
+from educational_activities import EducationalActivities
+
+
+def write_theme(directory, theme, lines):
+    with open(directory / f"{theme}.jsonl", "w") as f:
+        f.write("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+
+
+def quiz(**fields):
+    return dict({"type": "quiz", "difficulty": 1, "question": "Which one?", "options": ["A) a", "B) b"],
+                 "correct": "B", "explanation": "Because."}, **fields)
+
+
+def test_themes_load_on_first_use(tmp_path):
+    write_theme(tmp_path, "space", [quiz(id="space-1", styles=["visual"]), "", "{not json", quiz()])
+    write_theme(tmp_path, "animals", [{"type": "activity", "title": "Draw", "description": "A cat"}])
+    activities = EducationalActivities(tmp_path)
+    assert activities.themes == ["animals", "space"] and activities.banks == {}
+
+    bank = activities.theme_bank("space")
+    assert list(activities.banks) == ["space"]
+    # Items without an id are named after their theme and line
+    assert sorted(bank.items) == ["space-1", "space-4"]
+    assert bank.items["space-4"]["styles"] == [] and bank.items["space-4"]["theme"] == "space"
+    assert bank.find("quiz", 1, "visual") == [bank.items["space-1"]]
+    assert len(bank.find("quiz", None, "auditory")) == 2
+    assert activities.theme_bank("dinosaurs") is None
+    assert activities.pick("animals")["text"].startswith("🎨 Activity Time!")
+
+
+def test_get_item_finds_any_id(tmp_path):
+    write_theme(tmp_path, "outer-space", [quiz(id="outer-space-1"), quiz(id="mars")])
+    write_theme(tmp_path, "space", [quiz(id="space-1"), quiz(id=7)])
+    activities = EducationalActivities(tmp_path)
+
+    assert activities.get_item("space-1")["theme"] == "space"
+    assert list(activities.banks) == ["space"]
+    assert activities.get_item("outer-space-1")["theme"] == "outer-space"
+    assert activities.get_item("mars")["theme"] == "outer-space"
+    assert activities.get_item(7)["id"] == "7"
+    assert activities.get_item("space-99") is None and activities.get_item("pluto") is None
+
+
+def test_shipped_content_has_unique_ids():
+    activities = EducationalActivities()
+    assert activities.themes
+    ids = [item_id for theme in activities.themes for item_id in activities.theme_bank(theme).items]
+    assert len(ids) == len(set(ids))
+    assert all(activities.get_item(item_id)["id"] == item_id for item_id in ids)
@@ -0,0 +1,87 @@
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from email_handler import EmailHandler, MailQueue
+
+
+class FakeSMTP:
+    # Stands in for smtplib.SMTP; fail_next makes the next send drop the connection
+    def __init__(self, server):
+        self.server = server
+
+    def send_message(self, message):
+        if self.server.fail_next:
+            self.server.fail_next -= 1
+            raise smtplib.SMTPServerDisconnected("connection lost")
+        self.server.delivered.append(message["To"])
+
+    def quit(self):
+        self.server.quits += 1
+
+
+class FakeServer:
+    def __init__(self, fail_next=0):
+        self.fail_next = fail_next
+        self.delivered = []
+        self.quits = 0
+
+    def connect(self):
+        return FakeSMTP(self)
+
+
+def message(to):
+    msg = EmailMessage()
+    msg["To"] = to
+    msg.set_content("Your code is abc123")
+    return msg
+
+
+def test_delivers_retries_and_drains_on_close():
+    server = FakeServer(fail_next=1)
+    outbox = MailQueue(server.connect, max_retries=2, idle_timeout=30)
+    for number in range(5):
+        assert outbox.put(message(f"student{number}@example.com"))
+    outbox.close()
+    assert server.delivered == [f"student{number}@example.com" for number in range(5)]
+    assert outbox.stats["retries"] == 1 and outbox.stats["connections"] == 2
+    assert outbox.stats["failed"] == 0 and server.quits == 2
+    assert not outbox._thread.is_alive()
+
+
+def test_gives_up_after_max_retries():
+    server = FakeServer(fail_next=10)
+    outbox = MailQueue(server.connect, max_retries=1)
+    outbox.put(message("amy@example.com"))
+    outbox.flush()
+    assert server.delivered == [] and outbox.stats["failed"] == 1
+    outbox.close()
+
+
+def test_close_does_not_hang_when_the_queue_is_full():
+    release = threading.Event()
+    server = FakeServer()
+
+    def slow_connect():
+        release.wait()
+        return server.connect()
+
+    outbox = MailQueue(slow_connect, max_queue=1)
+    outbox.put(message("amy@example.com"))
+    time.sleep(0.05)  # the sender picks it up and blocks connecting
+    assert outbox.put(message("ben@example.com"))
+    assert not outbox.put(message("cal@example.com"))
+    started = time.monotonic()
+    outbox.close(timeout=0.1)
+    assert time.monotonic() - started < 1
+    release.set()
+    outbox.flush()
+    assert server.delivered == ["amy@example.com", "ben@example.com"]
+
+
+def test_recovery_email_states_the_configured_expiry(monkeypatch):
+    monkeypatch.setenv('RECOVERY_CODE_TTL', '3600')
+    assert "expire in 1 hour." in EmailHandler().build_recovery_email("amy@example.com", "abc123").as_string()
+    for ttl, text in [(900, "15 minutes"), (60, "1 minute"), (90, "90 seconds"), (7200, "2 hours")]:
+        body = EmailHandler(ttl).build_recovery_email("amy@example.com", "abc123").as_string()
+        assert f"expire in {text}." in body
@@ -0,0 +1,42 @@
+import threading
+import time
+from interaction_log import InteractionLog
+
+
+def test_recent_reads_through_to_archives(tmp_path):
+    log = InteractionLog(str(tmp_path / "history"), max_segment_bytes=60)
+    for number in range(10):
+        log.append("amy", {"input": f"question {number}"})
+    assert log.compact("amy") > 0
+    log.append("amy", {"input": "question 10"})
+
+    assert [i["input"] for i in log.recent("amy", 3)] == ["question 8", "question 9", "question 10"]
+    assert len(log.recent("amy", 0)) == 11
+    assert [i["input"] for i in log.recent("amy", 11)] == [i["input"] for i in log.read("amy")]
+    assert log.recent("nobody", 5) == []
+
+
+def test_compaction_between_listing_and_reading_loses_nothing(tmp_path, monkeypatch):
+    log = InteractionLog(str(tmp_path / "history"), max_segment_bytes=60)
+    for number in range(10):
+        log.append("amy", {"input": f"question {number}"})
+
+    # Compact right after the files are listed, as the background job might
+    listed = log._files
+    compacting = []
+
+    def list_then_compact(directory, prefix):
+        paths = listed(directory, prefix)
+        if prefix == "segment-" and not compacting:
+            compacting.append(threading.Thread(target=log.compact, args=("amy",)))
+            compacting[0].start()
+            time.sleep(0.05)
+        return paths
+
+    monkeypatch.setattr(log, "_files", list_then_compact)
+    assert len(list(log.read("amy"))) == 10
+    compacting[0].join()
+    for number in range(10, 20):
+        log.append("amy", {"input": f"question {number}"})
+    compacting.clear()
+    assert len(log.recent("amy", 0)) == 20
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from llm_cache import AsyncCachedClient, CachedClient, CompletionCache, SingleFlight
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        assert "near_text" not in kwargs
+        self.calls += 1
+        return f"answer {self.calls}"
+
+
+def make_client(**cache_options):
+    completions = FakeCompletions()
+    client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                          CompletionCache(**cache_options))
+    return client, completions
+
+
+def ask(client, question, **kwargs):
+    return client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "system", "content": "You are a teacher."},
+                  {"role": "user", "content": question}],
+        **kwargs
+    )
+
+
+def test_exact_hits_and_policy():
+    client, completions = make_client(max_entries=10, ttl=60, similarity=0)
+    assert ask(client, "What's a planet?", temperature=0) == "answer 1"
+    assert ask(client, "  what's a PLANET ", temperature=0) == "answer 1"
+    assert ask(client, "What's a planet?", temperature=0.7) == "answer 2"
+    assert ask(client, "What's a planet?", temperature=0.7) == "answer 3"
+    assert ask(client, "What's a planet?", temperature=0.7, cache=True) == "answer 4"
+    assert ask(client, "What's a planet?", temperature=0.7, cache=True) == "answer 4"
+    assert completions.calls == 4
+    assert client.cache.stats["hits"] == 2
+
+
+def test_lru_and_ttl_eviction():
+    client, completions = make_client(max_entries=2, ttl=0.05, similarity=0)
+    ask(client, "one", temperature=0)
+    ask(client, "two", temperature=0)
+    ask(client, "three", temperature=0)
+    assert len(client.cache) == 2
+    assert client.cache.stats["evictions"] == 1
+    time.sleep(0.06)
+    ask(client, "three", temperature=0)
+    assert client.cache.stats["expired"] == 1
+    assert completions.calls == 4
+
+
+def test_near_duplicates():
+    client, completions = make_client(max_entries=10, ttl=60, similarity=0.6)
+    for question in ["Which planet is red?", "which planet is the red one", "How fast is a cheetah?"]:
+        ask(client, question, temperature=0, near_text=question)
+    assert completions.calls == 2
+    assert client.cache.stats["near_hits"] == 1
+    # Without near_text only exact matches count
+    assert ask(client, "which planet is red one", temperature=0) == "answer 3"
+
+
+def analyze(client, message, **kwargs):
+    prompt = f"""Analyze this message for:
+            1. Learning style indicators (visual, auditory, kinesthetic)
+            2. Interests or topics
+            3. Engagement level (high, medium, low)
+            
+            Message: {message}
+            
+            Format: STYLE|INTERESTS|ENGAGEMENT"""
+    return client.chat.completions.create(
+        model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}], temperature=0, **kwargs)
+
+
+def test_templated_prompts_compare_only_the_student_text():
+    client, completions = make_client(max_entries=10, ttl=60, similarity=0.6)
+    assert analyze(client, "I love drawing diagrams of planets", near_text="I love drawing diagrams of planets") == "answer 1"
+    assert analyze(client, "I hate math, it is boring", near_text="I hate math, it is boring") == "answer 2"
+    assert analyze(client, "I love drawing diagrams of planets!", near_text="I love drawing diagrams of planets!") == "answer 1"
+    # The same prompts without near_text stay out of the near tier
+    assert analyze(client, "I hate maths, it is boring") == "answer 3"
+    assert analyze(client, "Tell me about volcanoes") == "answer 4"
+    assert client.cache.stats["near_hits"] == 1
+
+
+class SlowCompletions(FakeCompletions):
+    def create(self, **kwargs):
+        time.sleep(0.05)
+        return super().create(**kwargs)
+
+
+class AsyncSlowCompletions(FakeCompletions):
+    async def create(self, **kwargs):
+        await asyncio.sleep(0.05)
+        return super().create(**kwargs)
+
+
+def test_single_flight_without_cache():
+    completions = SlowCompletions()
+    flights = SingleFlight()
+    client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                          CompletionCache(max_entries=10, ttl=60, similarity=0), flights)
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(ask(client, "What's a planet?", temperature=0.7)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert answers == ["answer 1"] * 8 and completions.calls == 1
+    assert flights.stats == {"leaders": 1, "coalesced": 7}
+    # Nothing is kept once the call returns
+    assert ask(client, "What's a planet?", temperature=0.7) == "answer 2"
+    assert ask(client, "What's a planet?", temperature=0.7, coalesce=False) == "answer 3"
+
+
+def test_single_flight_async():
+    completions = AsyncSlowCompletions()
+    flights = SingleFlight()
+    client = AsyncCachedClient(SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                               CompletionCache(max_entries=10, ttl=60, similarity=0), flights)
+
+    async def scenario():
+        same = [ask(client, "  what's a PLANET ", temperature=0.7) for _ in range(5)]
+        return await asyncio.gather(*same, ask(client, "How fast is a cheetah?", temperature=0.7))
+
+    assert asyncio.run(scenario()) == ["answer 1"] * 5 + ["answer 2"]
+    assert flights.stats == {"leaders": 2, "coalesced": 4}
+
+
+if __name__ == "__main__":
+    test_exact_hits_and_policy()
+    test_lru_and_ttl_eviction()
+    test_near_duplicates()
+    test_templated_prompts_compare_only_the_student_text()
+    test_single_flight_without_cache()
+    test_single_flight_async()
+    print("Completion cache OK")
@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import openai
+import pytest
+from llm_client import AsyncLLMClient, LLMBusyError, LLMClient
+
+
+def rate_limited():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": "0"}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class FakeOpenAI:
+    # Stands in for openai.OpenAI: each call pops the next outcome
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        if kwargs.get("stream"):
+            return iter(["Plan", "ets"])
+        return outcome
+
+
+class AsyncFakeOpenAI(FakeOpenAI):
+    async def create(self, **kwargs):
+        return FakeOpenAI.create(self, **kwargs)
+
+
+def make_client(fake, client_class=LLMClient, **options):
+    client = client_class(api_key="test-key", requests_per_minute=6000, max_retries=2, **options)
+    client.client = fake
+    return client
+
+
+def ask(client, **kwargs):
+    return client.chat.completions.create(
+        model="gpt-3.5-turbo", messages=[{"role": "user", "content": "What's a planet?"}], **kwargs)
+
+
+def test_retries_a_retryable_error_then_succeeds():
+    fake = FakeOpenAI(rate_limited(), "answer")
+    client = make_client(fake)
+    assert ask(client) == "answer"
+    assert fake.calls == 2
+    assert client.stats == {"requests": 2, "retries": 1, "rejected": 0, "errors": 0}
+
+    fake.outcomes = [rate_limited()] * 3
+    with pytest.raises(openai.RateLimitError):
+        ask(client)
+    assert client.stats["retries"] == 3 and client.stats["errors"] == 1
+
+    fake.outcomes = [ValueError("bad request")]
+    with pytest.raises(ValueError):
+        ask(client)
+    assert fake.calls == 6 and client.stats["errors"] == 2
+
+
+def test_busy_once_the_queue_timeout_passes():
+    client = make_client(FakeOpenAI(), max_concurrency=1, queue_timeout=0.05)
+    stream = ask(client, stream=True)
+    with pytest.raises(LLMBusyError):
+        ask(client)
+    assert client.stats["rejected"] == 1
+
+    # Closing the stream early gives the slot back, and only once
+    stream.close()
+    stream.close()
+    assert ask(client) == "ok"
+    assert client.slots.acquire(timeout=0) and not client.slots.acquire(timeout=0)
+    client.slots.release()
+
+
+def test_slot_is_released_after_a_stream_is_drained():
+    client = make_client(FakeOpenAI(), max_concurrency=1, queue_timeout=0.05)
+    assert "".join(ask(client, stream=True)) == "Planets"
+    assert "".join(ask(client, stream=True)) == "Planets"
+
+    # A failed call gives its slot back too
+    client.client.outcomes = [ValueError("bad request")]
+    with pytest.raises(ValueError):
+        ask(client)
+    assert ask(client) == "ok"
+
+
+def test_async_client_retries_and_rejects():
+    fake = AsyncFakeOpenAI(rate_limited(), "answer")
+    client = make_client(fake, AsyncLLMClient, max_concurrency=1, queue_timeout=0.05)
+
+    async def scenario():
+        assert await ask(client) == "answer"
+        stream = await ask(client, stream=True)
+        with pytest.raises(LLMBusyError):
+            await ask(client)
+        stream.close()
+        return await ask(client)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert client.stats == {"requests": 4, "retries": 1, "rejected": 1, "errors": 0}
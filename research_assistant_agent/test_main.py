@@ -0,0 +1,168 @@
+import json
+import re
+import threading
+import pytest
+from analysis_batcher import AnalysisBatcher
+from main import VirtualClassroom
+from profile_cache import ProfileCache
+from profile_writer import ProfileWriter
+from storage import JSONStorage
+from student_profile import StudentProfile
+
+
+class FakeClient:
+    # Stands in for the LLM client; records which kind of call came in, in order
+    def __init__(self, single_content=None):
+        self.calls = []
+        self.single_content = single_content
+        self.analysis_gate = threading.Event()
+        self.analysis_gate.set()
+        self.chat = self.completions = self
+
+    def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if prompt.startswith("Analyze each"):
+            kind, content = "batch", json.dumps({"results": [
+                {"id": 1, "style": "visual", "interests": ["planets"], "engagement": "high"}]})
+        elif prompt.startswith("Analyze this"):
+            kind, content = "analysis", "visual|planets|high"
+        elif "response_format" in kwargs:
+            kind, content = "single", self.single_content
+        else:
+            kind, content = "reply", f"reply ({prompt})"
+        self.calls.append(kind)
+        if kind == "analysis":
+            self.analysis_gate.wait(5)
+        return type("Response", (), {"choices": [
+            type("Choice", (), {"message": type("Message", (), {"content": content})})]})
+
+
+@pytest.fixture
+def classroom(tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('STORAGE_BACKEND', 'json')
+    # Absolute, since the shared index and counters outlive the chdir
+    monkeypatch.setenv('ANALYTICS_FILE', str(tmp_path / "analytics.json"))
+    monkeypatch.setenv('SEARCH_INDEX_FILE', str(tmp_path / "search_index.json"))
+    monkeypatch.chdir(tmp_path)
+    classroom = VirtualClassroom()
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    writer = ProfileWriter(flush_delay=0)
+    classroom.active_users = ProfileCache(
+        lambda student_id, name: StudentProfile(student_id, name, writer=writer, storage=storage), writer=writer)
+    classroom.classifier = None
+    classroom.client = FakeClient()
+    yield classroom
+    classroom.active_users.close()
+    writer.close()
+
+
+def test_classrooms_share_one_profile_cache(classroom):
+    def exposed():
+        return [stats for name, stats, labels, kind in classroom.metrics._stats if name == "profile_cache"]
+
+    listeners, series = len(StudentProfile.listeners), len(exposed())
+    assert VirtualClassroom().active_users is VirtualClassroom().active_users
+    assert len(StudentProfile.listeners) == listeners and len(exposed()) == series == 2
+
+
+def turns(classroom, username):
+    return classroom.get_or_create_student(username).profile["interaction_summary"]["count"]
+
+
+def style(classroom, username):
+    return classroom.get_or_create_student(username).profile["learning_style"]["primary"]
+
+
+def test_sequential_analyzes_before_replying(classroom):
+    classroom.analysis_mode = 'sequential'
+    response = classroom.moderate_message("amy", "I love drawing planets")
+    assert classroom.client.calls == ["analysis", "reply"]
+    assert "learning style: visual" in response
+    assert turns(classroom, "amy") == 1 and style(classroom, "amy") == "visual"
+
+
+def test_parallel_records_the_turn_before_returning(classroom):
+    classroom.analysis_mode = 'parallel'
+    response = classroom.moderate_message("amy", "I love drawing planets")
+    assert sorted(classroom.client.calls) == ["analysis", "reply"]
+    # The reply used the style known before this message
+    assert "learning style: visual" not in response
+    assert turns(classroom, "amy") == 1 and style(classroom, "amy") == "visual"
+
+
+def test_background_applies_the_analysis_when_it_lands(classroom):
+    classroom.analysis_mode = 'background'
+    classroom.client.analysis_gate.clear()
+    classroom.moderate_message("amy", "I love drawing planets")
+    assert turns(classroom, "amy") == 0
+    classroom.client.analysis_gate.set()
+    classroom.analysis_pool.shutdown(wait=True)
+    assert sorted(classroom.client.calls) == ["analysis", "reply"]
+    assert turns(classroom, "amy") == 1 and style(classroom, "amy") == "visual"
+    assert classroom.get_or_create_student("amy").profile["interests"] == ["planets"]
+
+
+def test_analysis_lands_on_the_reloaded_profile_after_eviction(classroom, tmp_path):
+    classroom.analysis_mode = 'background'
+    classroom.client.analysis_gate.clear()
+    classroom.moderate_message("amy", "I love drawing planets")
+    stale = classroom.get_or_create_student("amy")
+
+    # Evicted and read back in while the analysis is still in flight
+    classroom.active_users.max_entries = 1
+    classroom.get_or_create_student("ben")
+    assert "amy" not in classroom.active_users
+    assert classroom.get_or_create_student("amy") is not stale
+
+    classroom.client.analysis_gate.set()
+    classroom.analysis_pool.shutdown(wait=True)
+    assert turns(classroom, "amy") == 1 and style(classroom, "amy") == "visual"
+    assert stale.profile["interaction_summary"]["count"] == 0
+    classroom.active_users.writer.flush()
+    with open(tmp_path / "profiles" / "amy.json") as f:
+        assert json.load(f)["interaction_summary"]["count"] == 1
+
+
+def test_single_call_parses_json_and_falls_back_to_raw_text(classroom):
+    classroom.analysis_mode = 'single'
+    classroom.client.single_content = json.dumps(
+        {"reply": "Planets are great!", "style": "Visual", "interests": "planets, stars", "engagement": "high"})
+    assert classroom.moderate_message("amy", "I love drawing planets") == "Planets are great!"
+    assert classroom.client.calls == ["single"]
+    assert style(classroom, "amy") == "visual"
+    assert classroom.get_or_create_student("amy").profile["interests"] == ["planets", "stars"]
+
+    # Not JSON: the text is the reply and the turn is kept without an analysis
+    classroom.client.single_content = "Planets are great!"
+    assert classroom.moderate_message("ben", "Tell me about planets") == "Planets are great!"
+    assert turns(classroom, "ben") == 1 and style(classroom, "ben") is None
+
+
+def test_batched_replies_now_and_analyzes_in_a_batch(classroom):
+    classroom.analysis_mode = 'batched'
+    classroom.analysis_batcher = AnalysisBatcher(classroom.client, classroom.analysis_pool, batch_size=10, max_wait=5)
+    classroom.moderate_message("amy", "I love drawing planets")
+    assert classroom.client.calls == ["reply"] and turns(classroom, "amy") == 0
+    assert classroom.analysis_batcher.flush(timeout=5)
+    assert classroom.client.calls == ["reply", "batch"]
+    assert turns(classroom, "amy") == 1 and style(classroom, "amy") == "visual"
+    classroom.analysis_batcher.close()
+
+
+def test_quiz_runs_through_commands_before_login(classroom, tmp_path):
+    # As the CLI does before anyone logs in: no username, the shared local session
+    started = classroom.handle_command("!quiz space")
+    assert started.startswith("Let's do a quiz about space!")
+    total = int(re.search(r"Question 1 of (\d+)", started).group(1))
+    for number in range(total):
+        reply = classroom.handle_command("!answer B")
+        assert "There's no quiz going on" not in reply
+    assert "Quiz complete!" in reply
+    assert classroom.handle_command("!answer B").startswith("There's no quiz going on")
+    assert not list(tmp_path.glob("profiles/!*"))
+
+    # Separate sessions keep separate quizzes
+    classroom.handle_command("!quiz space", None, "amy-token")
+    assert classroom.handle_command("!answer A", None, "ben-token").startswith("There's no quiz going on")
+    assert "There's no quiz going on" not in classroom.handle_command("!answer A", None, "amy-token")
@@ -0,0 +1,65 @@
+from metrics import Metrics
+
+
+def families(text):
+    # metric -> sample lines, in the order they were rendered
+    found = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            current = line.split()[2]
+            assert current not in found, f"{current} declared twice"
+            found[current] = (line.split()[3], [])
+        else:
+            assert line.split("{")[0].split(" ")[0].startswith(current)
+            found[current][1].append(line)
+    return found
+
+
+def test_render_groups_each_family_once():
+    metrics = Metrics(prefix="test")
+    metrics.inc("messages", source="classroom")
+    metrics.inc("tokens", 5, direction="in")
+    metrics.inc("messages", 2, source="api")
+    metrics.observe("stage_seconds", 0.003, stage="chat")
+    metrics.observe("stage_seconds", 20, stage="chat")
+    metrics.observe("stage_seconds", 0.3, stage="analysis")
+    stats = {"hits": 3, "misses": 1, "name": "not a number"}
+    metrics.expose_stats("cache", stats)
+    metrics.expose_stats("cache", lambda: {"entries": 7}, kind="gauge")
+    metrics.expose_stats("llm", {"requests": 4}, client="sync")
+    metrics.expose_stats("llm", {"requests": 1}, client="async")
+    stats["hits"] = 4  # read at scrape time
+
+    text = metrics.render()
+    assert text.endswith("\n")
+    found = families(text)
+    assert found["test_messages_total"] == ("counter", [
+        'test_messages_total{source="api"} 2',
+        'test_messages_total{source="classroom"} 1'])
+    assert found["test_tokens_total"] == ("counter", ['test_tokens_total{direction="in"} 5'])
+    assert found["test_cache_hits_total"] == ("counter", ["test_cache_hits_total 4"])
+    assert found["test_cache_entries"] == ("gauge", ["test_cache_entries 7"])
+    assert found["test_llm_requests_total"] == ("counter", [
+        'test_llm_requests_total{client="sync"} 4',
+        'test_llm_requests_total{client="async"} 1'])
+    assert not any("name" in metric for metric in found)
+
+    kind, samples = found["test_stage_seconds"]
+    assert kind == "histogram"
+    chat = [line for line in samples if 'stage="chat"' in line]
+    assert 'test_stage_seconds_bucket{stage="chat",le="0.005"} 1' in chat
+    assert 'test_stage_seconds_bucket{stage="chat",le="10"} 1' in chat
+    assert 'test_stage_seconds_bucket{stage="chat",le="+Inf"} 2' in chat
+    assert 'test_stage_seconds_count{stage="chat"} 2' in chat
+    assert 'test_stage_seconds_sum{stage="chat"} 20.003' in chat
+    # Buckets are cumulative and never decrease
+    counts = [int(line.split()[-1]) for line in chat if "_bucket" in line]
+    assert counts == sorted(counts)
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics(prefix="test")
+    metrics.inc("errors", reason='bad "quote"\\path\nnext')
+    assert metrics.render() == ('# TYPE test_errors_total counter\n'
+                                'test_errors_total{reason="bad \\"quote\\"\\\\path\\nnext"} 1\n')
@@ -0,0 +1,39 @@
+import hashlib
+import threading
+import pytest
+from password_hashing import HasherBusyError, PasswordHasher
+from sessions import ClassroomSession
+from storage import JSONStorage
+from ttl_store import MemoryTTLStore
+from user_auth import UserAuth
+
+
+def test_hashes_are_salted_and_legacy_accounts_migrate(tmp_path):
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    hasher = PasswordHasher("scrypt", workers=1, queue_depth=4, scrypt_n=2 ** 10)
+    auth = UserAuth(storage, hasher, MemoryTTLStore())
+
+    first, second = hasher.compute_hash("secret"), hasher.compute_hash("secret")
+    assert first != second and first.startswith("scrypt$1024$8$1$")
+    assert hasher.check_hash("secret", first) == (True, False)
+    assert hasher.check_hash("wrong", first) == (False, False)
+    assert PasswordHasher("pbkdf2", workers=1, pbkdf2_iterations=1000).check_hash("secret", first) == (True, True)
+
+    storage.save_user("amy", {"password": hashlib.sha256(b"secret").hexdigest(), "name": "Amy"})
+    assert auth.login(ClassroomSession("t"), "amy", "wrong") == (False, "Incorrect password!")
+    assert auth.login(ClassroomSession("t"), "amy", "secret")[0]
+    hasher.pool.shutdown(wait=True)  # the rehash runs after the login returns
+    assert storage.get_user("amy")["password"].startswith("scrypt$")
+    assert hasher.stats["rehashed"] == 1
+
+
+def test_full_queue_is_turned_away():
+    hasher = PasswordHasher("scrypt", workers=1, queue_depth=1, scrypt_n=2 ** 10)
+    release = threading.Event()
+    running = [hasher.submit(release.wait), hasher.submit(release.wait)]
+    with pytest.raises(HasherBusyError):
+        hasher.hash("secret")
+    release.set()
+    for future in running:
+        future.result()
+    assert hasher.hash("secret").startswith("scrypt$") and hasher.stats["rejected"] == 1
@@ -1,9 +1,24 @@
 import json
+import os
+import tempfile
+from profile_writer import ProfileWriter
+from storage import JSONStorage
 from student_profile import StudentProfile
 
 def test_profile():
-    # Create a new student profile
-    student = StudentProfile("test123", "Alex")
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = JSONStorage(
+            profiles_dir=os.path.join(tmp, "profiles"),
+            users_file=os.path.join(tmp, "users.json"),
+            conversations_dir=os.path.join(tmp, "conversations")
+        )
+        writer = ProfileWriter(flush_delay=0)
+        try:
+            check_profile(StudentProfile("test123", "Alex", writer=writer, storage=storage))
+        finally:
+            writer.close()
+
+def check_profile(student):
     
     # Test adding interactions
     student.add_interaction(
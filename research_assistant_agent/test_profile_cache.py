@@ -0,0 +1,78 @@
+import threading
+import time
+from profile_cache import ProfileCache
+from profile_writer import ProfileWriter
+from storage import JSONStorage
+from student_profile import StudentProfile
+
+
+def make_cache(tmp_path, writer, **kwargs):
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    loader = lambda student_id, name: StudentProfile(student_id, name, writer=writer, storage=storage)
+    return ProfileCache(loader, writer=writer, **kwargs), storage
+
+
+def test_eviction_flushes_dirty_profile(tmp_path):
+    writer = ProfileWriter(flush_delay=60)
+    cache, storage = make_cache(tmp_path, writer, max_entries=1)
+    try:
+        cache.get("amy").add_interest("space")
+        assert writer.is_dirty("amy")
+        cache.get("ben")
+        assert "amy" not in cache and not writer.is_dirty("amy")
+        assert storage.load_profile("amy")["interests"] == ["space"]
+        assert cache.get("amy").profile["interests"] == ["space"]
+    finally:
+        cache.close()
+        writer.close()
+
+
+def test_sizes_follow_changes_and_idle_entries_expire_on_access(tmp_path):
+    writer = ProfileWriter(flush_delay=0)
+    cache, storage = make_cache(tmp_path, writer, idle_ttl=0.05)
+    try:
+        amy = cache.get("amy")
+        before = cache.usage()["bytes"]
+        amy.add_interest("dinosaurs and volcanoes")
+        amy.add_interest("space")
+        amy.update_learning_style("visual", None, 0.7)
+        amy.record_quiz_result("space", 5, 5)
+        amy.add_interaction("hi", "hello")
+        # Kept up from the events, within a few bytes of the real size
+        assert cache.usage()["bytes"] > before
+        assert abs(cache.usage()["bytes"] - cache.estimate_size(amy)) <= 4
+        cache.get("ben")
+        time.sleep(0.1)
+        cache.get("ben")  # a hit sweeps too
+        assert "amy" not in cache and cache.stats["expired"] == 1
+    finally:
+        cache.close()
+        writer.close()
+
+
+def test_flush_waits_for_a_write_in_progress():
+    writing, release = threading.Event(), threading.Event()
+
+    class SlowProfile:
+        student_id = "amy"
+
+        def flush(self):
+            writing.set()
+            release.wait()
+            return 0
+
+    writer = ProfileWriter(flush_delay=60)
+    writer.mark_dirty(SlowProfile())
+    background = threading.Thread(target=writer.flush)
+    background.start()
+    writing.wait()
+    # Off the dirty list but not yet on disk
+    assert writer.is_dirty("amy")
+    waiter = threading.Thread(target=writer.flush, args=("amy",))
+    waiter.start()
+    waiter.join(0.05)
+    assert waiter.is_alive()
+    release.set()
+    waiter.join(1)
+    background.join(1)
+    assert not waiter.is_alive() and not writer.is_dirty("amy")
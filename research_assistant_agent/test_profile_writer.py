@@ -0,0 +1,49 @@
+import threading
+from profile_writer import ProfileWriter
+
+
+class SlowProfile:
+    # Counts overlapping writes; the first one blocks until released
+    def __init__(self):
+        self.student_id = "amy"
+        self.version = 0
+        self.written = []
+        self.active = 0
+        self.overlap = 0
+        self.writing, self.release = threading.Event(), threading.Event()
+        self.lock = threading.Lock()
+
+    def flush(self):
+        with self.lock:
+            self.active += 1
+            self.overlap = max(self.overlap, self.active)
+            version = self.version
+        self.writing.set()
+        self.release.wait()
+        with self.lock:
+            self.written.append(version)
+            self.active -= 1
+        return 10
+
+
+def test_one_write_per_profile_at_a_time():
+    profile = SlowProfile()
+    writer = ProfileWriter(flush_delay=60)
+    writer.mark_dirty(profile)
+    first = threading.Thread(target=writer.flush)
+    first.start()
+    profile.writing.wait()
+
+    # Changed again while the first snapshot is still being written
+    profile.version = 1
+    writer.mark_dirty(profile)
+    second = threading.Thread(target=writer.flush, args=("amy",))
+    second.start()
+    second.join(0.05)
+    assert second.is_alive() and profile.active == 1
+    profile.release.set()
+    first.join(1)
+    second.join(1)
+    assert profile.written == [0, 1] and profile.overlap == 1
+    assert writer.stats["flushes"] == 2 and writer.stats["bytes_written"] == 20
+    assert not writer.is_dirty("amy")
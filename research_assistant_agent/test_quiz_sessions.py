@@ -0,0 +1,62 @@
+import json
+import time
+from educational_activities import EducationalActivities
+from quiz_sessions import QuizManager
+
+
+class FakeStudent:
+    def __init__(self):
+        self.results = []
+
+    def record_quiz_result(self, theme, correct, answered):
+        self.results.append((theme, correct, answered))
+
+
+def make_manager(tmp_path, questions=2, timeout=None):
+    with open(tmp_path / "space.jsonl", "w") as f:
+        for number, correct in enumerate("ABC", 1):
+            f.write(json.dumps({"id": f"space-{number}", "type": "quiz", "styles": ["visual"], "question": "?",
+                                "options": ["A) a", "B) b", "C) c"], "correct": correct, "explanation": ""}) + "\n")
+        f.write(json.dumps({"id": "space-4", "type": "activity", "title": "t", "description": "d"}) + "\n")
+    students = {}
+    manager = QuizManager(EducationalActivities(tmp_path),
+                          lambda student_id: students.setdefault(student_id, FakeStudent()),
+                          questions_per_quiz=questions, timeout=timeout)
+    return manager, students
+
+
+def test_quiz_session_scores_into_profile(tmp_path):
+    manager, students = make_manager(tmp_path)
+    quiz = manager.start("amy", "space", "visual")
+    assert len(quiz.question_ids) == 2 and quiz.ask()["type"] == "quiz"
+
+    first = quiz.answer_key[quiz.current_id]
+    question, correct, _ = manager.answer("amy", first.lower() + ")")
+    assert correct and question["correct"] == first
+    _, correct, session = manager.answer("amy", "Z")
+    assert not correct and session.finished and session.score == 1
+    assert manager.answer("amy", "A") is None
+    assert students["amy"].results == [("space", 1, 2)]
+
+
+def test_bulk_grading(tmp_path):
+    manager, students = make_manager(tmp_path)
+    results = manager.grade([("amy", "space-1", "a"), ("amy", "space-2", "A"), ("bob", "space-3", "C"),
+                             ("bob", "space-4", "A"), ("bob", "moon-1", "A")])
+    assert results["amy"] == {"correct": 1, "answered": 2, "results": {"space-1": True, "space-2": False}}
+    assert results["bob"]["results"] == {"space-3": True, "space-4": None, "moon-1": None}
+    assert students["amy"].results == [("space", 1, 2)]
+    assert students["bob"].results == [("space", 1, 1)]
+
+
+def test_abandoned_quizzes_are_swept_when_new_ones_start(tmp_path):
+    manager, students = make_manager(tmp_path, timeout=0.1)
+    manager.start(None, "space", key="amy-token")
+    manager.start(None, "space", key="ben-token")
+    time.sleep(0.15)
+    assert len(manager.sessions) == 2
+    manager.start(None, "space", key="cat-token")
+    assert list(manager.sessions) == ["cat-token"]
+
+    manager.issue(None, manager.activities.get_item("space-1"), key="dan-token")
+    assert manager.expire_idle() == 0 and len(manager.sessions) == 2
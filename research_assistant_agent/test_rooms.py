@@ -0,0 +1,100 @@
+import asyncio
+import json
+from rooms import RoomManager
+
+
+class FakeClassroom:
+    def __init__(self):
+        self.prompts = []
+
+    async def handle_message_async(self, message, history):
+        self.prompts.append(message)
+        await asyncio.sleep(0.01)
+        return f"reply {len(self.prompts)}"
+
+    def handle_command(self, command):
+        return "help"
+
+
+class FakeActivities:
+    def pick(self, theme):
+        return {"text": f"{theme} activity"} if theme == "space" else None
+
+    def theme_suggestions(self):
+        return "space"
+
+
+class Client:
+    def __init__(self, stall=False):
+        self.stall = stall
+        self.events = []
+        self.closed_with = None
+
+    async def send(self, message):
+        if message["type"] == "websocket.close":
+            self.closed_with = message["code"]
+            return
+        if self.stall:
+            await asyncio.sleep(3600)
+        self.events.append(json.loads(message["text"]))
+
+
+def test_room_shares_one_model_call_per_burst():
+    async def scenario():
+        classroom = FakeClassroom()
+        rooms = RoomManager(classroom, FakeActivities(), max_students=3, max_queue=4, history_size=10)
+        room = rooms.get("math")
+        clients = [Client(), Client(), Client(stall=True)]
+        connections = [room.join(client.send, f"s{number}") for number, client in enumerate(clients)]
+        assert room.join(Client().send, "late") is None
+        for number in range(3):
+            await room.receive(connections[number % 2], f"question {number}")
+            await asyncio.sleep(0)
+        await room.moderator
+        await room.receive(connections[0], "!activity space")
+        await asyncio.sleep(0.05)
+        for connection in connections:
+            rooms.leave(room, connection)
+        return classroom, rooms, clients
+
+    classroom, rooms, (amy, bob, stalled) = asyncio.run(scenario())
+    # The first message gets its own call; the two sent meanwhile share one
+    assert classroom.prompts == ["s0: question 0", "s1: question 1\ns0: question 2"]
+    for client in (amy, bob):
+        replies = [event["text"] for event in client.events if event["type"] in ("moderator", "activity")]
+        assert replies == ["reply 1", "reply 2", "space activity"]
+    assert stalled.closed_with == 1013
+    assert rooms.rooms == {}
+
+
+def test_socket_skips_messages_that_are_not_text(tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('GOOGLE_CLIENT_ID', 'test')
+    monkeypatch.setenv('GOOGLE_CLIENT_SECRET', 'test')
+    monkeypatch.setenv('ANALYTICS_FILE', str(tmp_path / "analytics.json"))
+    monkeypatch.setenv('SEARCH_INDEX_FILE', str(tmp_path / "search_index.json"))
+    monkeypatch.chdir(tmp_path)
+    import asgi
+
+    classroom = FakeClassroom()
+    server = asgi.ClassroomASGI(asgi.flask_app, classroom, None, RoomManager(classroom, FakeActivities()))
+    server.load_session = lambda scope: {"google_token": ("token", ""), "user_name": "amy"}
+    frames = [{"type": "websocket.connect"}]
+    frames += [{"type": "websocket.receive", "text": json.dumps(frame)}
+               for frame in [{"message": 5}, {"message": None}, {"message": ["!help"]}, {"message": "hello"}]]
+    sent = []
+
+    async def receive():
+        if frames:
+            return frames.pop(0)
+        await asyncio.sleep(0.05)  # let the moderator reply
+        return {"type": "websocket.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(server.room_socket({"type": "websocket", "path": "/rooms/math", "headers": []}, receive, send))
+    assert [message["type"] for message in sent if message["type"] != "websocket.send"] == ["websocket.accept"]
+    events = [json.loads(message["text"]) for message in sent if message["type"] == "websocket.send"]
+    assert [event["text"] for event in events if event["type"] in ("message", "moderator")] == ["hello", "reply 1"]
+    assert classroom.prompts == ["amy: hello"]
@@ -0,0 +1,72 @@
+from datetime import date
+from profile_writer import ProfileWriter
+from search_index import SearchIndex
+from storage import JSONStorage
+from student_profile import StudentProfile
+
+
+def test_index_follows_profiles_and_survives_reload(tmp_path):
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    writer = ProfileWriter(flush_delay=60)
+    path = str(tmp_path / "search_index.json")
+    index = SearchIndex(path, writer, compact_every=3)
+    StudentProfile.add_listener(index.on_change)
+    try:
+        amy = StudentProfile("amy", "Amy", writer, storage)
+        amy.add_interest("Astronomy")
+        amy.add_interaction("How do fractions work?", "...")
+        writer.flush()
+        bob = StudentProfile("bob", "Bob", writer, storage)
+        bob.add_interest("astronomy")
+        bob.add_interaction("I like planets", "...")
+        bob.add_interaction("Adding a fraction to a fraction?", "...")
+        writer.flush()
+    finally:
+        StudentProfile.remove_listener(index.on_change)
+
+    assert index.students_with_interest("astronomy") == ["amy", "bob"]
+    matches = index.search("fraction")
+    assert [(match["student_id"], match["interaction"]) for match in matches] == [("bob", 2), ("amy", 1)]
+    assert index.search("fractions adding") == [{"student_id": "bob", "interaction": 2,
+                                                  "date": date.today().isoformat()}]
+    assert index.search("fraction", since=date.fromordinal(date.today().toordinal() + 1)) == []
+
+    # Snapshot plus log replay gives the same index, and so does a rebuild
+    reloaded = SearchIndex(path, writer)
+    assert reloaded.search("fraction") == matches
+    assert reloaded.students_with_interest("Astronomy") == ["amy", "bob"]
+    reloaded.rebuild(storage)
+    assert reloaded.search("fraction") == matches
+    assert SearchIndex(path, writer).search("planet")[0]["student_id"] == "bob"
+
+
+def test_refresh_replays_only_the_appended_log(tmp_path):
+    path = str(tmp_path / "search_index.json")
+    writer = SearchIndex(path, ProfileWriter(flush_delay=60), compact_every=4)
+    writer.add_interest("amy", "astronomy")
+    writer.flush()
+    reader = SearchIndex(path, ProfileWriter(flush_delay=60))
+    loads = []
+    original_load = reader.load
+    reader.load = lambda: loads.append(1) or original_load()
+
+    writer.add_interest("bob", "astronomy")
+    writer.flush()
+    # A record still being appended is picked up once it is complete
+    with open(writer.log_path, "a") as f:
+        f.write('["i","cat","astro')
+    reader.refresh()
+    assert reader.students_with_interest("astronomy") == ["amy", "bob"] and loads == []
+    with open(writer.log_path, "a") as f:
+        f.write('nomy"]\n')
+    reader.refresh()
+    reader.refresh()
+    assert reader.students_with_interest("astronomy") == ["amy", "bob", "cat"] and loads == []
+
+    # A compaction writes a new snapshot, so the reader loads that instead
+    writer.replay_log()
+    writer.add_interest("dan", "astronomy")
+    writer.flush()
+    reader.refresh()
+    assert loads == [1]
+    assert reader.students_with_interest("astronomy") == ["amy", "bob", "cat", "dan"]
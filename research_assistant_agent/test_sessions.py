@@ -0,0 +1,72 @@
+import time
+import pytest
+from main import VirtualClassroom
+from password_hashing import PasswordHasher
+from profile_cache import ProfileCache
+from profile_writer import ProfileWriter
+from sessions import SessionManager
+from storage import JSONStorage
+from student_profile import StudentProfile
+from ttl_store import MemoryTTLStore
+from user_auth import UserAuth
+
+
+def test_idle_sessions_expire():
+    sessions = SessionManager(idle_timeout=0.1)
+    first = sessions.get_or_create("amy-token")
+    sessions.get_or_create("ben-token")
+    time.sleep(0.06)
+    assert sessions.get("amy-token") is first  # a lookup keeps it alive
+    time.sleep(0.06)
+    assert sessions.expire_idle() == 1
+    assert sessions.get("ben-token") is None and sessions.get("amy-token") is first
+
+    # Abandoned sessions are swept when new ones are created
+    time.sleep(0.15)
+    sessions.get_or_create("cat-token")
+    assert len(sessions) == 1
+    assert sessions.get_or_create("amy-token") is not first
+    assert sessions.end("amy-token") is not None and sessions.end("amy-token") is None
+
+
+def test_created_sessions_get_unique_tokens():
+    sessions = SessionManager(idle_timeout=60)
+    tokens = {sessions.create().token for _ in range(50)}
+    assert len(tokens) == 50 and len(sessions) == 50
+
+
+@pytest.fixture
+def classroom(tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('STORAGE_BACKEND', 'json')
+    monkeypatch.setenv('ANALYTICS_FILE', str(tmp_path / "analytics.json"))
+    monkeypatch.setenv('SEARCH_INDEX_FILE', str(tmp_path / "search_index.json"))
+    monkeypatch.chdir(tmp_path)
+    classroom = VirtualClassroom()
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    writer = ProfileWriter(flush_delay=0)
+    classroom.active_users = ProfileCache(
+        lambda student_id, name: StudentProfile(student_id, name, writer=writer, storage=storage), writer=writer)
+    classroom.auth = UserAuth(storage, PasswordHasher("scrypt", workers=1, scrypt_n=2 ** 10), MemoryTTLStore())
+    yield classroom
+    classroom.active_users.close()
+    writer.close()
+
+
+def test_sessions_keep_login_and_theme_apart(classroom):
+    classroom.handle_command("!register amy secret Amy amy@example.com")
+    assert classroom.handle_command("!login amy secret", None, "amy-token").startswith("Welcome")
+    classroom.handle_command("!theme space", None, "amy-token")
+
+    amy = classroom.get_session("amy-token")
+    ben = classroom.get_session("ben-token")
+    assert amy.username == "amy" and amy.quiz_theme == "space"
+    assert ben.username is None and ben.quiz_theme is None
+    assert "amy's Learning Profile" in classroom.handle_command("!profile", None, "amy-token")
+    assert classroom.handle_command("!profile", None, "ben-token").startswith("Tell me your name")
+
+    # Logging out one session leaves the other logged in
+    classroom.handle_command("!login amy secret", None, "ben-token")
+    classroom.handle_command("!logout", None, "amy-token")
+    assert not amy.is_logged_in() and ben.username == "amy"
+    assert classroom.get_session().username is None
@@ -0,0 +1,54 @@
+import os
+import tempfile
+from profile_writer import ProfileWriter
+from storage import JSONStorage, SQLiteStorage
+from student_profile import StudentProfile
+
+
+def check_backend(storage):
+    writer = ProfileWriter(flush_delay=0)
+    student = StudentProfile("test123", "Alex", writer=writer, storage=storage)
+    student.add_interaction("What's a planet?", "A planet orbits a star.", "high")
+    student.add_interaction("Is Pluto a planet?", "It's a dwarf planet.", "medium")
+    student.add_interest("space")
+    writer.close()
+
+    reloaded = StudentProfile("test123", "Alex", writer=writer, storage=storage)
+    assert reloaded.profile["interests"] == ["space"]
+    assert reloaded.profile["interaction_summary"]["count"] == 2
+    assert [i["input"] for i in reloaded.get_interaction_history(1)] == ["Is Pluto a planet?"]
+    assert len(reloaded.get_interaction_history()) == 2
+    assert "test123" in storage.list_profile_ids()
+
+    storage.save_user("alex", {"password": "x", "name": "Alex", "email": "alex@example.com"})
+    assert storage.get_user("alex")["email"] == "alex@example.com"
+    assert storage.get_user("nobody") is None
+
+    storage.append_message("alex", "user", "hello")
+    storage.append_message("alex", "assistant", "hi there")
+    assert [m["role"] for m in storage.load_messages("alex")] == ["user", "assistant"]
+    assert storage.load_messages("alex", limit=1)[0]["content"] == "hi there"
+
+
+def test_json_storage():
+    with tempfile.TemporaryDirectory() as tmp:
+        check_backend(JSONStorage(
+            profiles_dir=os.path.join(tmp, "profiles"),
+            users_file=os.path.join(tmp, "users.json"),
+            conversations_dir=os.path.join(tmp, "conversations")
+        ))
+
+
+def test_sqlite_storage():
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "classroom.db"))
+        try:
+            check_backend(storage)
+        finally:
+            storage.close()
+
+
+if __name__ == "__main__":
+    test_json_storage()
+    test_sqlite_storage()
+    print("Storage backends OK")
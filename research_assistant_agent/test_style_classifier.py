@@ -0,0 +1,29 @@
+import os
+from style_classifier import StyleClassifier
+
+
+def make_classifier(tmp_path, threshold=0.8):
+    return StyleClassifier(model_path=os.path.join(str(tmp_path), "style_model.json"), threshold=threshold)
+
+
+def test_lexicon_fast_path(tmp_path):
+    classifier = make_classifier(tmp_path)
+    assert classifier.analyze("I love drawing pictures of planets!") == ("visual", ["space", "art"], "high")
+    assert classifier.analyze("Can we sing a song about fractions?")[0] == "auditory"
+    # No style evidence at all: leave it to the LLM
+    assert classifier.analyze("why is the sky blue") is None
+    assert classifier.stats == {"local": 2, "escalated": 1}
+
+
+def test_trained_model_round_trip(tmp_path):
+    classifier = make_classifier(tmp_path)
+    examples = [("I want to watch how rockets fly", "visual", "high"),
+                ("tell me about rockets please", "auditory", "medium"),
+                ("let me do the rocket thing myself", "kinesthetic", "high")] * 10
+    assert classifier.train(examples) == (30, 30)
+    classifier.save()
+
+    loaded = make_classifier(tmp_path, threshold=0.5)
+    (style, interests, _), confidence = loaded.classify("can I watch the rocket")
+    assert style == "visual" and interests == ["space"]
+    assert confidence > 0.5
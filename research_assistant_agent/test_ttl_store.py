@@ -0,0 +1,103 @@
+import threading
+import time
+import pytest
+from password_hashing import PasswordHasher
+from storage import JSONStorage
+from ttl_store import MemoryTTLStore, SQLiteTTLStore
+from user_auth import UserAuth
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryTTLStore(max_entries=3)
+        return
+    store = SQLiteTTLStore(str(tmp_path / "ttl.db"), max_entries=3, sweep_interval=0.05)
+    yield store
+    store.close()
+
+
+def test_entries_expire_and_are_swept(store):
+    store.set("short", {"code": "a"}, 0.05)
+    store.set("long", {"code": "b"}, 60)
+    assert store.get("short") == {"code": "a"}
+    assert store.update("long", {"code": "c"})
+    time.sleep(0.3)
+    assert store.get("short") is None and not store.update("short", {})
+    assert store.get("long") == {"code": "c"}
+    assert len(store) == 1 and store.stats["expired"] == 1
+
+
+def test_bounded_and_taken_once(store):
+    for number in range(5):
+        store.set(f"k{number}", number, 60 + number)
+    assert len(store) == 3 and store.stats["evicted"] == 2
+    assert store.get("k0") is None and store.get("k4") == 4
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.take("k4"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results, key=str) == [4] + [None] * 7
+
+
+def test_sqlite_entries_are_shared_between_stores(tmp_path):
+    first = SQLiteTTLStore(str(tmp_path / "ttl.db"))
+    second = SQLiteTTLStore(str(tmp_path / "ttl.db"))
+    first.set("recovery:amy", {"code": "abc"}, 60)
+    assert second.take("recovery:amy") == {"code": "abc"}
+    assert first.get("recovery:amy") is None
+
+
+def test_reset_needs_a_verified_code(tmp_path):
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    auth = UserAuth(storage, PasswordHasher("scrypt", workers=1, scrypt_n=2 ** 10), MemoryTTLStore())
+    auth.email_handler.send_recovery_email = lambda email, code: (True, "sent")
+    auth.register("amy", "secret", "Amy", "amy@example.com")
+
+    assert auth.reset_password("amy", "new") == (False, "Please verify your recovery code first!")
+    auth.initiate_password_recovery("amy")
+    code = auth.tokens.get("recovery:amy")["code"]
+    assert auth.reset_password("amy", "new")[0] is False
+    assert auth.verify_recovery_code("amy", "wrong") == (False, "Invalid recovery code!")
+    assert auth.verify_recovery_code("amy", code)[0]
+    assert auth.reset_password("amy", "new") == (True, "Password reset successfully!")
+    assert auth.reset_password("amy", "newer")[0] is False
+
+    auth.initiate_password_recovery("amy")
+    for _ in range(5):
+        success, message = auth.verify_recovery_code("amy", "wrong")
+    assert "request a new" in message and auth.tokens.get("recovery:amy") is None
+
+
+def test_concurrent_guesses_share_one_attempt_count(tmp_path):
+    storage = JSONStorage(str(tmp_path / "profiles"), str(tmp_path / "users.json"), str(tmp_path / "conversations"))
+    hasher = PasswordHasher("scrypt", workers=1, scrypt_n=2 ** 10)
+    # Two workers sharing the SQLite file
+    workers = [UserAuth(storage, hasher, SQLiteTTLStore(str(tmp_path / "ttl.db"))) for _ in range(2)]
+    for auth in workers:
+        auth.email_handler.send_recovery_email = lambda email, code: (True, "sent")
+    workers[0].register("amy", "secret", "Amy", "amy@example.com")
+    workers[0].initiate_password_recovery("amy")
+
+    messages = []
+    threads = [threading.Thread(target=lambda auth=workers[number % 2]: messages.append(
+        auth.verify_recovery_code("amy", "wrong")[1])) for number in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert messages.count("Invalid recovery code!") == 4
+    assert sum("request a new" in message for message in messages) == 1
+    assert workers[1].tokens.get("recovery:amy") is None
+
+    workers[1].initiate_password_recovery("amy")
+    assert workers[0].verify_recovery_code("amy", "ü½") == (False, "Invalid recovery code!")
+    code = workers[0].tokens.get("recovery:amy")["code"]
+    assert workers[1].verify_recovery_code("amy", code)[0]
+    hashed = hasher.stats["hashed"]
+    assert workers[0].reset_password("amy", "new")[0]
+    assert workers[1].reset_password("amy", "newer")[0] is False
+    assert hasher.stats["hashed"] == hashed + 1
@@ -0,0 +1,264 @@
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from metrics import get_metrics
+
+# Short-lived key-value entries (password recovery codes and the like) that
+# disappear on their own. Both backends have the same methods:
+#
+#   set(key, value, ttl)   value is anything JSON can hold
+#   get(key)               the value, or None once expired or deleted
+#   update(key, value)     replaces the value and keeps the expiry; False if gone
+#   take(key)              get and delete in one step, so only one caller wins
+#   modify(key, func)      func(value) -> (new value or None to delete, result),
+#                          run atomically; returns result, or None if gone
+#   delete(key)
+#
+# TTL_STORE_BACKEND=sqlite (the default) keeps entries in a small SQLite file
+# that every worker process opens, so a code sent by one worker can be checked
+# by another. TTL_STORE_BACKEND=memory is per process. Either way at most
+# max_entries are kept; past that the entries closest to expiring go first.
+
+
+class MemoryTTLStore:
+    def __init__(self, max_entries=None):
+        if max_entries is None:
+            max_entries = int(os.getenv('TTL_STORE_MAX_ENTRIES', '10000'))
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires_at, serialized value)
+        self._heap = []  # (expires_at, key); stale pairs are skipped when popped
+        self._cond = threading.Condition()
+        self.stats = {"expired": 0, "evicted": 0}
+        self._thread = threading.Thread(target=self._sweep, name="ttl-sweeper", daemon=True)
+        self._thread.start()
+
+    def set(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        with self._cond:
+            self._entries[key] = (expires_at, json.dumps(value))
+            heapq.heappush(self._heap, (expires_at, key))
+            while len(self._entries) > self.max_entries:
+                self._pop_soonest("evicted")
+            if len(self._heap) > 2 * self.max_entries:
+                # Mostly stale pairs from overwritten or deleted keys
+                self._heap = [(expires_at, key) for key, (expires_at, _) in self._entries.items()]
+                heapq.heapify(self._heap)
+            # Wake the sweeper if this is now the first entry to expire
+            if self._heap[0][1] == key:
+                self._cond.notify()
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry
+
+    def get(self, key):
+        with self._cond:
+            entry = self._live(key)
+        return json.loads(entry[1]) if entry else None
+
+    def update(self, key, value):
+        with self._cond:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._entries[key] = (entry[0], json.dumps(value))
+            return True
+
+    def take(self, key):
+        with self._cond:
+            entry = self._live(key)
+            if entry is not None:
+                del self._entries[key]
+        return json.loads(entry[1]) if entry else None
+
+    def modify(self, key, func):
+        with self._cond:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            value, result = func(json.loads(entry[1]))
+            if value is None:
+                del self._entries[key]
+            else:
+                self._entries[key] = (entry[0], json.dumps(value))
+        return result
+
+    def delete(self, key):
+        with self._cond:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pop_soonest(self, reason):
+        # Drops the entry at the top of the heap if it is still current
+        expires_at, key = heapq.heappop(self._heap)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == expires_at:
+            del self._entries[key]
+            self.stats[reason] += 1
+
+    def _sweep(self):
+        # Sleeps until the earliest expiry, then drops everything due
+        with self._cond:
+            while True:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    self._pop_soonest("expired")
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+
+class SQLiteTTLStore:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ttl_entries (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_ttl_entries_expires ON ttl_entries (expires_at);
+    """
+
+    UPSERT = ("INSERT INTO ttl_entries (key, value, expires_at) VALUES (?, ?, ?) "
+              "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at")
+    SELECT = "SELECT value FROM ttl_entries WHERE key = ? AND expires_at > ?"
+    UPDATE = "UPDATE ttl_entries SET value = ? WHERE key = ? AND expires_at > ?"
+    DELETE = "DELETE FROM ttl_entries WHERE key = ?"
+    DELETE_EXPIRED = "DELETE FROM ttl_entries WHERE expires_at <= ?"
+    COUNT = "SELECT COUNT(*) FROM ttl_entries"
+    DELETE_SOONEST = "DELETE FROM ttl_entries WHERE key IN (SELECT key FROM ttl_entries ORDER BY expires_at LIMIT ?)"
+
+    def __init__(self, path=None, max_entries=None, sweep_interval=None):
+        if path is None:
+            path = os.getenv('TTL_STORE_PATH', 'ttl_store.db')
+        if max_entries is None:
+            max_entries = int(os.getenv('TTL_STORE_MAX_ENTRIES', '10000'))
+        if sweep_interval is None:
+            sweep_interval = float(os.getenv('TTL_SWEEP_INTERVAL', '60'))
+        self.path = path
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self.stats = {"expired": 0, "evicted": 0}
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+        # Reads already ignore expired rows; the sweep only reclaims space.
+        # The expires_at index keeps it a range delete, however big the table.
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sweep, name="ttl-sweeper", daemon=True)
+        self._thread.start()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def set(self, key, value, ttl):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(self.UPSERT, (key, json.dumps(value), time.time() + ttl))
+            excess = conn.execute(self.COUNT).fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(self.DELETE_EXPIRED, (time.time(),))
+                excess = conn.execute(self.COUNT).fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute(self.DELETE_SOONEST, (excess,))
+                    self.stats["evicted"] += excess
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key):
+        row = self._connection().execute(self.SELECT, (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, key, value):
+        cursor = self._connection().execute(self.UPDATE, (json.dumps(value), key, time.time()))
+        return cursor.rowcount > 0
+
+    def take(self, key):
+        # The write lock makes read-then-delete atomic across processes
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(self.SELECT, (key, time.time())).fetchone()
+            if row:
+                conn.execute(self.DELETE, (key,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[0]) if row else None
+
+    def modify(self, key, func):
+        # Read, change and write back under one write lock, like take
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(self.SELECT, (key, time.time())).fetchone()
+            result = None
+            if row:
+                value, result = func(json.loads(row[0]))
+                if value is None:
+                    conn.execute(self.DELETE, (key,))
+                else:
+                    conn.execute(self.UPDATE, (json.dumps(value), key, time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def delete(self, key):
+        self._connection().execute(self.DELETE, (key,))
+
+    def __len__(self):
+        return self._connection().execute(self.COUNT).fetchone()[0]
+
+    def sweep(self):
+        cursor = self._connection().execute(self.DELETE_EXPIRED, (time.time(),))
+        self.stats["expired"] += cursor.rowcount
+        return cursor.rowcount
+
+    def _sweep(self):
+        while not self._stopped.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except sqlite3.Error as e:
+                print(f"Error sweeping expired entries: {str(e)}")
+
+    def close(self):
+        self._stopped.set()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def create_ttl_store(backend=None):
+    backend = backend or os.getenv('TTL_STORE_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        return SQLiteTTLStore()
+    if backend == 'memory':
+        return MemoryTTLStore()
+    raise ValueError(f"Unknown TTL store backend: {backend}")
+
+
+def get_ttl_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = create_ttl_store()
+            get_metrics().expose_stats("ttl_store", _default_store.stats)
+        return _default_store
@@ -1,107 +1,157 @@
-import json
+import hmac
 import os
-import hashlib
-from datetime import datetime, timedelta
+from concurrent.futures import TimeoutError as HashTimeout
+from datetime import datetime
 from email_handler import EmailHandler
+from password_hashing import HasherBusyError, get_password_hasher
+from storage import get_storage
+from ttl_store import get_ttl_store
 
-class UserAuth:
-    def __init__(self):
-        self.users_file = "users.json"
-        self.current_user = None
-        self.users = self.load_users()
-        self.email_handler = EmailHandler()
-        self.recovery_codes = {}  # Store recovery codes temporarily
-
-    def load_users(self):
-        try:
-            with open(self.users_file, "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+BUSY_MESSAGE = "Lots of students are logging in right now! Please try again in a moment."
+RECOVERY_MAX_ATTEMPTS = 5
 
-    def save_users(self):
-        with open(self.users_file, "w") as f:
-            json.dump(self.users, f, indent=2)
+class UserAuth:
+    def __init__(self, storage=None, hasher=None, tokens=None, code_ttl=None):
+        if code_ttl is None:
+            code_ttl = int(os.getenv('RECOVERY_CODE_TTL', '900'))
+        self.storage = storage or get_storage()
+        # Salted scrypt on a bounded pool shared by every UserAuth in the process
+        self.hasher = hasher or get_password_hasher()
+        self.email_handler = EmailHandler(code_ttl)
+        # Recovery codes expire on their own and are shared by every worker
+        # (checked against None: an empty store has len 0)
+        self.tokens = tokens if tokens is not None else get_ttl_store()
+        self.code_ttl = code_ttl
 
     def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        return self.hasher.hash(password)
+
+    def rehash_later(self, username, password, old_hash):
+        # Moves an account off an old hash format without making the login wait
+        def save(future):
+            if future.exception() is not None:
+                return
+            user = self.storage.get_user(username)
+            # Skip it if the password changed in the meantime
+            if user is not None and user["password"] == old_hash:
+                user["password"] = future.result()
+                self.storage.save_user(username, user)
+                self.hasher.stats["rehashed"] += 1
+        try:
+            self.hasher.submit(self.hasher.compute_hash, password).add_done_callback(save)
+        except HasherBusyError:
+            pass  # next login will try again
 
     def register(self, username, password, name, email):
-        if username in self.users:
+        if self.storage.get_user(username) is not None:
             return False, "Username already exists!"
         
-        self.users[username] = {
-            "password": self.hash_password(password),
+        try:
+            hashed = self.hash_password(password)
+        except (HasherBusyError, HashTimeout):
+            return False, BUSY_MESSAGE
+        self.storage.save_user(username, {
+            "password": hashed,
             "name": name,
             "email": email,
             "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        self.save_users()
+        })
         return True, "Registration successful! You can now log in."
 
-    def login(self, username, password):
-        if username not in self.users:
+    def login(self, session, username, password):
+        user = self.storage.get_user(username)
+        if user is None:
             return False, "Username not found!"
         
-        if self.users[username]["password"] != self.hash_password(password):
+        try:
+            matches, needs_rehash = self.hasher.verify(password, user["password"])
+        except (HasherBusyError, HashTimeout):
+            return False, BUSY_MESSAGE
+        if not matches:
             return False, "Incorrect password!"
+        if needs_rehash:
+            self.rehash_later(username, password, user["password"])
         
-        self.current_user = username
-        return True, f"Welcome back, {self.users[username]['name']}!"
-
-    def logout(self):
-        if self.current_user:
-            username = self.current_user
-            self.current_user = None
-            return f"Goodbye, {self.users[username]['name']}!"
+        with session.lock:
+            session.username = username
+        return True, f"Welcome back, {user['name']}!"
+
+    def logout(self, session):
+        with session.lock:
+            username = session.username
+            session.username = None
+        if username:
+            return f"Goodbye, {self.storage.get_user(username)['name']}!"
         return "No user logged in."
 
-    def is_logged_in(self):
-        return self.current_user is not None
+    def is_logged_in(self, session):
+        return session.is_logged_in()
 
-    def get_current_user(self):
-        if self.current_user:
-            return self.users[self.current_user]
+    def get_current_user(self, session):
+        if session.username:
+            return self.storage.get_user(session.username)
         return None
 
     def initiate_password_recovery(self, username):
-        if username not in self.users:
+        user = self.storage.get_user(username)
+        if user is None:
             return False, "Username not found!"
         
-        email = self.users[username].get('email')
+        email = user.get('email')
         if not email:
             return False, "No email address found for this account!"
         
         # Generate and store recovery code
         recovery_code = self.email_handler.generate_recovery_code()
-        self.recovery_codes[username] = {
+        self.tokens.set(f"recovery:{username}", {
             'code': recovery_code,
-            'expires': datetime.now() + timedelta(minutes=15)
-        }
+            'verified': False,
+            'attempts': 0
+        }, self.code_ttl)
         
         # Send recovery email
         success, message = self.email_handler.send_recovery_email(email, recovery_code)
         return success, message
 
     def verify_recovery_code(self, username, code):
-        if username not in self.recovery_codes:
-            return False, "No recovery code requested!"
-        
-        recovery_data = self.recovery_codes[username]
-        if datetime.now() > recovery_data['expires']:
-            del self.recovery_codes[username]
-            return False, "Recovery code has expired!"
-        
-        if recovery_data['code'] != code:
+        key = f"recovery:{username}"
+
+        def attempt(recovery_data):
+            # Runs inside the store's lock, so concurrent guesses all count
+            if hmac.compare_digest(recovery_data['code'].encode(), code.encode()):
+                recovery_data['verified'] = True
+                return recovery_data, "verified"
+            recovery_data['attempts'] += 1
+            if recovery_data['attempts'] >= RECOVERY_MAX_ATTEMPTS:
+                return None, "locked"
+            return recovery_data, "invalid"
+
+        outcome = self.tokens.modify(key, attempt)
+        if outcome is None:
+            return False, "No recovery code requested, or it has expired!"
+        if outcome == "locked":
+            return False, "Too many wrong codes! Please request a new recovery code."
+        if outcome == "invalid":
             return False, "Invalid recovery code!"
-        
         return True, "Code verified successfully!"
 
     def reset_password(self, username, new_password):
-        if username not in self.users:
+        user = self.storage.get_user(username)
+        if user is None:
             return False, "Username not found!"
-        
-        self.users[username]["password"] = self.hash_password(new_password)
-        self.save_users()
-        del self.recovery_codes[username]  # Clear recovery code
-        return True, "Password reset successfully!" 
\ No newline at end of file
+
+        # Used up before the slow hash, so a repeated reset costs nothing
+        key = f"recovery:{username}"
+        recovery_data = self.tokens.modify(
+            key, lambda data: (None, data) if data['verified'] else (data, None))
+        if recovery_data is None:
+            return False, "Please verify your recovery code first!"
+
+        try:
+            user["password"] = self.hash_password(new_password)
+        except (HasherBusyError, HashTimeout):
+            # Give the verified code back so the student can simply retry
+            self.tokens.set(key, recovery_data, self.code_ttl)
+            return False, BUSY_MESSAGE
+        self.storage.save_user(username, user)
+        return True, "Password reset successfully!"